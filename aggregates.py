@@ -0,0 +1,159 @@
+"""
+Materialized aggregates for YourCarbonFootprint application.
+Keeps dashboard breakdowns and totals current as entries are inserted and deleted.
+"""
+
+import threading
+
+import pandas as pd
+
+# Breakdowns the dashboard shows
+DASHBOARD_GROUPINGS = [("scope",), ("category",), ("month", "scope")]
+MEASURE = "emissions_kgCO2e"
+
+
+class MaterializedAggregates:
+    """
+    Incrementally maintained sums and counts.
+
+    Each grouping is a dict from group key to (sum, count); totals, entry
+    count and a date histogram (for the latest date) sit alongside. Inserts
+    and deletes are grouped on their own rows and folded into the dicts, so
+    keeping them current costs O(changed rows) and reading them costs
+    O(groups), however large the ledger grows. Groups whose count drops to
+    zero are removed.
+    """
+
+    # Leave out rows with a missing group key, like pandas groupby
+    dropna = True
+
+    def __init__(self, groupings=None, measure=MEASURE):
+        """
+        Initialize the MaterializedAggregates class.
+
+        Args:
+            groupings (list, optional): Tuples of columns to group by; "month" is
+                derived from date as YYYY-MM. Defaults to DASHBOARD_GROUPINGS
+            measure (str, optional): Column to sum
+        """
+        self.groupings = [tuple(g) for g in (groupings or DASHBOARD_GROUPINGS)]
+        self.measure = measure
+        self._lock = threading.Lock()
+        self.version = 0  # bumped on every change
+        self.clear()
+
+    def clear(self):
+        """Forget everything; the aggregates are not ready until rebuilt."""
+        with self._lock:
+            self._groups = {g: {} for g in self.groupings}
+            self._total = 0.0
+            self._entries = 0
+            self._dates = {}
+            self.version += 1
+            self.ready = False
+
+    def rebuild(self, df):
+        """
+        Compute the aggregates from scratch.
+
+        Args:
+            df (pandas.DataFrame): Full emissions data
+        """
+        self.clear()
+        self._update(df, 1)
+        self.ready = True
+
+    def add(self, df):
+        """
+        Fold newly inserted entries in.
+
+        Args:
+            df (pandas.DataFrame): Inserted entries
+        """
+        self._update(df, 1)
+
+    def remove(self, df):
+        """
+        Take deleted entries out.
+
+        Args:
+            df (pandas.DataFrame): Deleted entries, with the values they had
+        """
+        self._update(df, -1)
+
+    def _prepare(self, df):
+        """Coerce the measure and derive the month column."""
+        values = pd.to_numeric(df[self.measure], errors="coerce").fillna(0) if self.measure in df.columns else 0.0
+        data = df.assign(**{self.measure: values})
+        if "date" in data.columns:
+            dates = pd.to_datetime(data["date"], errors="coerce")
+            # datetime64[M] prints as YYYY-MM, much faster than strftime
+            months = pd.Series(dates.to_numpy(dtype="datetime64[ns]").astype("datetime64[M]").astype(str), index=data.index)
+            data = data.assign(date=dates, month=months.where(dates.notna()))
+        return data
+
+    def _update(self, df, sign):
+        """Add (sign 1) or subtract (sign -1) the sums and counts of some rows."""
+        if df is None or not len(df):
+            return
+        data = self._prepare(df)
+        with self._lock:
+            self.version += 1
+            self._total += sign * float(data[self.measure].sum())
+            self._entries += sign * len(data)
+            if "date" in data.columns:
+                for day, n in data["date"].dropna().value_counts().items():
+                    self._adjust(self._dates, day, 0.0, sign * int(n))
+            for grouping in self.groupings:
+                if any(c not in data.columns for c in grouping):
+                    continue
+                grouped = data.groupby(list(grouping), observed=True, dropna=self.dropna)[self.measure].agg(["sum", "size"])
+                table = self._groups[grouping]
+                for key, total, n in zip(grouped.index, grouped["sum"], grouped["size"]):
+                    key = key if isinstance(key, tuple) else (key,)
+                    # NaN never equals itself, so it cannot be a dict key
+                    key = tuple(None if pd.isna(k) else k for k in key)
+                    self._adjust(table, key, sign * float(total), sign * int(n))
+
+    @staticmethod
+    def _adjust(table, key, amount, n):
+        """Adjust one (sum, count) cell, dropping it once its count reaches zero."""
+        total, count = table.get(key, (0.0, 0))
+        if count + n <= 0:
+            table.pop(key, None)
+        else:
+            table[key] = (total + amount, count + n)
+
+    def totals(self):
+        """
+        Return the headline figures.
+
+        Returns:
+            dict: total (float), entries (int) and latest (pandas.Timestamp or None)
+        """
+        with self._lock:
+            return {
+                "total": self._total,
+                "entries": self._entries,
+                "latest": max(self._dates) if self._dates else None,
+            }
+
+    def breakdown(self, by):
+        """
+        Return one maintained breakdown.
+
+        Args:
+            by (list): Columns of a grouping passed to the constructor
+
+        Returns:
+            pandas.DataFrame: Group columns plus the summed measure and an "entries" count,
+                the same shape storage.aggregate_frame returns
+
+        Raises:
+            KeyError: If the grouping is not maintained
+        """
+        grouping = tuple(by)
+        with self._lock:
+            table = self._groups[grouping]
+            rows = [key + value for key, value in table.items()]
+        return pd.DataFrame(rows, columns=list(grouping) + [self.measure, "entries"])
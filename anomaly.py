@@ -0,0 +1,286 @@
+"""
+Anomaly detection for YourCarbonFootprint application.
+Flags incoming entries whose values are far from what each activity usually records.
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Entries are compared with earlier entries sharing these columns
+ANOMALY_KEYS = ["category", "activity", "unit", "facility"]
+# Values checked on every entry
+ANOMALY_MEASURES = ["quantity", "emission_factor", "emissions_kgCO2e"]
+ANOMALY_THRESHOLD = 4.0  # spreads from typical before an entry is flagged
+ANOMALY_MIN_COUNT = 5  # earlier entries a key needs before its entries are scored
+MIN_LOG_SPREAD = 0.1  # floor on the spread, in log10 units (about 26%)
+SKETCH_ACCURACY = 0.02  # relative error of sketch quantiles
+
+
+class QuantileSketch:
+    """
+    Quantiles of positive values from a log-bucketed histogram.
+
+    Each value is counted in bucket ceil(log_gamma(value)), so any quantile is
+    within SKETCH_ACCURACY of the true value while the sketch holds one counter
+    per occupied bucket: a few dozen for values spanning several orders of
+    magnitude. Counts can be taken out again, which supports deletes.
+    """
+
+    def __init__(self, accuracy=SKETCH_ACCURACY):
+        """
+        Initialize the QuantileSketch class.
+
+        Args:
+            accuracy (float, optional): Relative accuracy of quantiles
+        """
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.counts = {}
+        self.count = 0
+        self._sorted = None
+
+    def buckets(self, values):
+        """
+        Bucket of each value.
+
+        Args:
+            values (numpy.ndarray): Positive values
+
+        Returns:
+            numpy.ndarray: Bucket numbers
+        """
+        return np.ceil(np.log(values) / np.log(self.gamma)).astype(np.int64)
+
+    def adjust(self, bucket, n):
+        """Add n values (or take them out, for negative n) to one bucket."""
+        count = self.counts.get(bucket, 0) + n
+        if count > 0:
+            self.counts[bucket] = count
+        else:
+            self.counts.pop(bucket, None)
+        self.count = max(self.count + n, 0)
+        self._sorted = None
+
+    def quantile(self, q):
+        """
+        Estimate a quantile.
+
+        Args:
+            q (float): Quantile between 0 and 1
+
+        Returns:
+            float: Estimated value, or NaN if the sketch is empty
+        """
+        if not self.counts:
+            return float("nan")
+        if self._sorted is None:
+            buckets = np.array(sorted(self.counts))
+            self._sorted = (buckets, np.cumsum([self.counts[b] for b in buckets]))
+        buckets, cumulative = self._sorted
+        position = np.searchsorted(cumulative, q * (cumulative[-1] - 1), side="right")
+        bucket = buckets[min(position, len(buckets) - 1)]
+        # Midpoint of the bucket (gamma^(b-1), gamma^b]
+        return 2 * self.gamma ** bucket / (self.gamma + 1)
+
+
+class AnomalyDetector:
+    """
+    Running statistics per (category, activity, unit, facility) for scoring new entries.
+
+    For every key and measure the detector keeps a count, mean and sum of
+    squared deviations of log10(value) (Welford's online algorithm, merged a
+    batch at a time with Chan's formula) and a QuantileSketch of the values.
+    Working in log space makes a 1000x unit or factor mistake a shift of 3,
+    whatever the typical magnitude.
+
+    An entry is anomalous when, for some measure, it sits more than
+    ANOMALY_THRESHOLD spreads away from both the key's mean (spread: standard
+    deviation) and its median (spread: interquartile range / 1.349), so a
+    mean skewed by one earlier outlier cannot cause a flag on its own.
+    Scoring a batch and folding it in cost O(batch + keys in it); history is
+    scanned once, by rebuild(). Only positive values are scored, and keys with
+    fewer than ANOMALY_MIN_COUNT earlier entries are not.
+    """
+
+    def __init__(self, keys=None, measures=None, threshold=ANOMALY_THRESHOLD, min_count=ANOMALY_MIN_COUNT):
+        """
+        Initialize the AnomalyDetector class.
+
+        Args:
+            keys (list, optional): Columns identifying comparable entries; defaults to ANOMALY_KEYS
+            measures (list, optional): Columns to check; defaults to ANOMALY_MEASURES
+            threshold (float, optional): Spreads from typical before an entry is flagged
+            min_count (int, optional): Earlier entries a key needs before it is scored
+        """
+        self.keys = list(keys or ANOMALY_KEYS)
+        self.measures = list(measures or ANOMALY_MEASURES)
+        self.threshold = threshold
+        self.min_count = min_count
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Forget everything; the detector is not ready until rebuilt."""
+        with self._lock:
+            self._slots = {}
+            # Per slot and measure: count, mean and M2 of log10(value)
+            self._stats = np.zeros((0, len(self.measures), 3))
+            self._sketches = []
+            self.ready = False
+
+    def rebuild(self, df):
+        """
+        Compute the statistics from scratch.
+
+        Args:
+            df (pandas.DataFrame): Full emissions data
+        """
+        self.clear()
+        self._update(df, 1)
+        self.ready = True
+
+    def add(self, df):
+        """
+        Fold newly stored entries in.
+
+        Args:
+            df (pandas.DataFrame): Inserted entries
+        """
+        self._update(df, 1)
+
+    def remove(self, df):
+        """
+        Take deleted entries out.
+
+        Args:
+            df (pandas.DataFrame): Deleted entries, with the values they had
+        """
+        self._update(df, -1)
+
+    def _key_codes(self, df):
+        """Distinct keys of some rows and the position of each row's key among them."""
+        frame = pd.DataFrame(
+            {c: df[c].astype(object) if c in df.columns else None for c in self.keys}, index=df.index
+        )
+        codes, uniques = pd.factorize(pd.MultiIndex.from_frame(frame))
+        # NaN never equals itself, so it cannot be part of a dict key
+        return codes, [tuple(None if pd.isna(k) else k for k in key) for key in uniques]
+
+    def _values(self, df):
+        """(rows, measures) matrix of values, NaN where missing or not positive."""
+        values = np.full((len(df), len(self.measures)), np.nan)
+        for m, col in enumerate(self.measures):
+            if col in df.columns:
+                values[:, m] = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+        values[~(values > 0)] = np.nan
+        return values
+
+    def _slots_for(self, keys, create):
+        """Slot of each key; -1 for unknown keys unless create is set (lock held)."""
+        slots = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            slot = self._slots.get(key)
+            if slot is None and create:
+                slot = self._slots[key] = len(self._sketches)
+                self._sketches.append([QuantileSketch() for _ in self.measures])
+            slots[i] = -1 if slot is None else slot
+        if create and len(self._stats) < len(self._sketches):
+            grown = np.zeros((len(self._sketches), len(self.measures), 3))
+            grown[:len(self._stats)] = self._stats
+            self._stats = grown
+        return slots
+
+    def _update(self, df, sign):
+        """Merge (sign 1) or unmerge (sign -1) the statistics of some rows."""
+        if df is None or not len(df):
+            return
+        codes, keys = self._key_codes(df)
+        values = self._values(df)
+        with self._lock:
+            slots = self._slots_for(keys, create=True)[codes]
+            for m in range(len(self.measures)):
+                valid = ~np.isnan(values[:, m])
+                if not valid.any():
+                    continue
+                logs = np.log10(values[valid, m])
+                batch = pd.DataFrame({"slot": slots[valid], "x": logs}).groupby("slot")["x"].agg(["size", "mean", "var"])
+                index = batch.index.to_numpy()
+                nb = batch["size"].to_numpy(dtype=float)
+                mb = batch["mean"].to_numpy()
+                m2b = np.nan_to_num(batch["var"].to_numpy()) * (nb - 1)
+                na, ma, m2a = self._stats[index, m].T
+                if sign > 0:
+                    n = na + nb
+                    delta = mb - ma
+                    mean = ma + delta * nb / n
+                    m2 = m2a + m2b + delta ** 2 * na * nb / n
+                else:
+                    n = np.maximum(na - nb, 0)
+                    safe = np.where(n > 0, n, 1)
+                    mean = np.where(n > 0, (na * ma - nb * mb) / safe, 0.0)
+                    delta = mb - mean
+                    m2 = np.where(n > 0, np.maximum(m2a - m2b - delta ** 2 * n * nb / np.where(na > 0, na, 1), 0), 0.0)
+                self._stats[index, m] = np.column_stack([n, mean, m2])
+
+                # Quantile sketches share one bucketing: one adjustment per occupied bucket
+                buckets = self._sketches[0][m].buckets(values[valid, m])
+                counts = pd.DataFrame({"slot": slots[valid], "bucket": buckets}).value_counts()
+                for (slot, bucket), n_values in counts.items():
+                    self._sketches[slot][m].adjust(bucket, sign * int(n_values))
+
+    def score(self, df):
+        """
+        Score incoming entries against the statistics, without folding them in.
+
+        Args:
+            df (pandas.DataFrame): Entries about to be stored
+
+        Returns:
+            pandas.DataFrame: Indexed like df: anomaly (bool), score (largest number of
+                spreads from typical over the measures, NaN when nothing could be
+                scored) and reason (None for entries that are not anomalous)
+        """
+        result = pd.DataFrame({"anomaly": False, "score": np.nan, "reason": None}, index=df.index)
+        if not len(df):
+            return result
+        codes, keys = self._key_codes(df)
+        values = self._values(df)
+        logs = np.log10(values)
+        scores = np.full(values.shape, np.nan)
+        typical = np.full(values.shape, np.nan)
+        with self._lock:
+            key_slots = self._slots_for(keys, create=False)
+            slots = key_slots[codes]
+            known = slots >= 0
+            stats = np.zeros((len(df), len(self.measures), 3))
+            stats[known] = self._stats[slots[known]]
+            # Median and quartiles once per key in the batch
+            quartiles = np.full((len(keys), len(self.measures), 3), np.nan)
+            for i, slot in enumerate(key_slots):
+                if slot < 0:
+                    continue
+                for m, sketch in enumerate(self._sketches[slot]):
+                    if sketch.count >= self.min_count:
+                        quartiles[i, m] = [sketch.quantile(0.25), sketch.quantile(0.5), sketch.quantile(0.75)]
+        count, mean, m2 = stats[..., 0], stats[..., 1], stats[..., 2]
+        std = np.sqrt(np.divide(m2, count, out=np.zeros_like(m2), where=count > 0))
+        z = np.abs(logs - mean) / np.maximum(std, MIN_LOG_SPREAD)
+        q1, median, q3 = (np.log10(quartiles[codes, :, j]) for j in range(3))
+        robust = np.abs(logs - median) / np.maximum((q3 - q1) / 1.349, MIN_LOG_SPREAD)
+        enough = count >= self.min_count
+        scores[enough] = np.minimum(z, robust)[enough]
+        typical[enough] = 10 ** median[enough]
+
+        scored = ~np.isnan(scores).all(axis=1)
+        worst = np.zeros(len(df), dtype=int)
+        worst[scored] = np.nanargmax(scores[scored], axis=1)
+        rows = np.arange(len(df))
+        result["score"] = np.where(scored, scores[rows, worst], np.nan)
+        result["anomaly"] = result["score"].to_numpy() > self.threshold
+        flagged = np.flatnonzero(result["anomaly"].to_numpy())
+        result.iloc[flagged, result.columns.get_loc("reason")] = [
+            f"{self.measures[worst[i]]} {values[i, worst[i]]:g} is far from the usual {typical[i, worst[i]]:.4g}"
+            for i in flagged
+        ]
+        return result
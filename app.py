@@ -1,7 +1,5 @@
 import os
-import json
 import time
-import tempfile
 import shutil
 from io import BytesIO
 from datetime import datetime
@@ -11,6 +9,22 @@ import plotly.express as px
 import streamlit as st
 from dotenv import load_dotenv
 
+from change_feed import ChangeFeed
+from compact_frame import NotesStore
+from cube import EmissionsCube
+from dataset import SharedDataset
+from factor_registry import default_registry
+from anomaly import AnomalyDetector
+from forecast import forecast_series
+from gases import GASES, GWP_BASES, gas_emissions, gwp_vector
+from ingest import iter_csv_chunks, price_chunk
+from matching import FactorMatcher
+from report_generator import forecast_figure
+from storage import EmissionsStore, open_store
+from timeseries import GRANULARITIES, TimeSeriesEngine
+from validation import validate
+from write_buffer import WriteBuffer
+
 #bootstrap
 load_dotenv()
 os.makedirs("data", exist_ok=True)
@@ -22,22 +36,82 @@ st.set_page_config(
 )
 
 DATA_PATH = "data/emissions.json"
-REQUIRED_COLUMNS = ["date", "scope", "category", "activity", "quantity", "unit", "emission_factor"]
+# emission_factor may be left out of uploads: missing factors come from the factor registry
+REQUIRED_COLUMNS = ["date", "scope", "category", "activity", "quantity", "unit"]
 ALLOWED_SCOPES = ["Scope 1", "Scope 2", "Scope 3"]
 
+@st.cache_resource
+def get_store() -> EmissionsStore:
+    return open_store()
+
+@st.cache_resource
+def get_writer() -> WriteBuffer:
+    # Shared by all sessions so simultaneous submissions are group-committed
+    return WriteBuffer(get_store())
+
+@st.cache_resource
+def get_notes() -> NotesStore:
+    # Notes are shared by all sessions and only read when displayed
+    return NotesStore(get_store())
+
+@st.cache_resource
+def get_feed() -> ChangeFeed:
+    # Follows writes made by other processes sharing the data directory
+    feed = ChangeFeed(get_store())
+    feed.start()
+    return feed
+
+@st.cache_resource
+def get_dataset() -> SharedDataset:
+    # One read-only copy of the ledger per process; sessions get views of it
+    return SharedDataset(get_store(), notes=get_notes(), feed=get_feed(), aggregates=EmissionsCube(), detector=AnomalyDetector())
+
+@st.cache_resource
+def get_timeseries() -> TimeSeriesEngine:
+    # Resampled series over the shared dataset, cached until its cube changes
+    dataset = get_dataset()
+
+    def rows(by):
+        df = dataset.view()
+        return df[[c for c in ["date", *by, "emissions_kgCO2e"] if c in df.columns]]
+
+    return TimeSeriesEngine(rows, lambda: dataset.aggregates.version)
+
+@st.cache_resource
+def get_matcher() -> FactorMatcher:
+    # Building the trigram index is the expensive part; it rebuilds itself when factors change
+    return FactorMatcher(default_registry())
+
+STORE = get_store()
+WRITER = get_writer()
+NOTES = get_notes()
+DATASET = get_dataset()
+FACTORS = default_registry()
+MATCHER = get_matcher()
+TIMESERIES = get_timeseries()
+
 #session state
 if "active_page" not in st.session_state:
     st.session_state.active_page = "Dashboard"
-if "emissions_data" not in st.session_state:
-    try:
-        raw = open(DATA_PATH, "r", encoding="utf-8").read().strip() if os.path.exists(DATA_PATH) else "[]"
-        st.session_state.emissions_data = pd.DataFrame(json.loads(raw or "[]"))
-    except Exception:
+load_bar = None if DATASET.loaded else st.progress(0.0, text="Loading emissions data...")
+try:
+    # Cheap view of the shared dataset, refreshed with other sessions' writes
+    st.session_state.emissions_data = DATASET.view(
+        progress=load_bar and (lambda done, total: load_bar.progress(min(done / total, 1.0) if total else 1.0, text="Loading emissions data..."))
+    )
+except MemoryError as e:
+    st.error(f"Emissions data is too large to load: {e}")
+    st.session_state.emissions_data = pd.DataFrame()
+except Exception:
+    if not st.session_state.get("load_failed"):
+        st.session_state.load_failed = True
         try:
             shutil.copy(DATA_PATH, f"data/emissions_backup_{int(time.time())}.json")
         except Exception:
             pass
-        st.session_state.emissions_data = pd.DataFrame()
+    st.session_state.emissions_data = pd.DataFrame()
+if load_bar is not None:
+    load_bar.empty()
 
 #styling
 PROD_CSS = """
@@ -490,40 +564,52 @@ def darkify(fig):
     return fig
 
 #persistence
-def atomic_save_json(path: str, obj) -> None:
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    payload = json.dumps(obj, indent=2, ensure_ascii=False)
-    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix="emissions_", suffix=".tmp")
+def persist_rows(rows: pd.DataFrame, allow_anomalies: bool = False) -> pd.DataFrame | None:
     try:
-        with os.fdopen(fd, "w", encoding="utf-8") as f:
-            f.write(payload)
-            f.flush()
-            os.fsync(f.fileno())
-        if os.path.exists(path):
-            ts = int(time.time())
-            shutil.copy(path, f"{path}.bak.{ts}")
-        os.replace(tmp, path)
-    finally:
-        if os.path.exists(tmp):
-            try: os.remove(tmp)
-            except Exception: pass
-
-
-def persist_dataframe(df: pd.DataFrame) -> bool:
+        if not allow_anomalies:
+            # Scored against running statistics of the ledger, before anything is written
+            flags = DATASET.detector.score(rows)
+            if flags["anomaly"].any():
+                st.warning(f"{int(flags['anomaly'].sum())} entries look anomalous and were not saved. "
+                           "Correct them, or tick the box to save them anyway.")
+                st.dataframe(rows.join(flags[["score", "reason"]])[flags["anomaly"]], use_container_width=True)
+                return None
+        rows = WRITER.submit(rows).wait()
+        DATASET.apply(inserted=rows)
+        st.session_state.emissions_data = DATASET.view()
+        return rows
+    except Exception as e:
+        st.error(f"Error saving data: {e}")
+        return None
+
+
+def delete_rows(entry_ids: list) -> bool:
     try:
-        atomic_save_json(DATA_PATH, df.to_dict(orient="records"))
+        WRITER.submit_delete(entry_ids).wait()
+        DATASET.apply(deleted=entry_ids)
+        st.session_state.emissions_data = DATASET.view()
         return True
     except Exception as e:
         st.error(f"Error saving data: {e}")
         return False
 
 #helpers
-@st.cache_data(ttl=120)
-def scope_breakdown(df: pd.DataFrame) -> pd.DataFrame:
-    if df.empty or "emissions_kgCO2e" not in df.columns:
-        return pd.DataFrame(columns=["scope", "emissions_kgCO2e"])
-    g = df.groupby("scope", as_index=False)["emissions_kgCO2e"].sum()
-    return g.sort_values("emissions_kgCO2e", ascending=False)
+def aggregates() -> EmissionsCube:
+    # A feed reset clears the cube until the next full load, which view() performs
+    if not DATASET.aggregates.ready:
+        st.session_state.emissions_data = DATASET.view()
+    return DATASET.aggregates
+
+
+def breakdown(by: list) -> pd.DataFrame:
+    # Roll-up of the cube the shared dataset maintains on every insert and delete
+    return aggregates().rollup(by).sort_values("emissions_kgCO2e", ascending=False)
+
+
+@st.cache_data(max_entries=4)
+def gas_totals(data_version: int, factors_version: int) -> pd.Series:
+    # Keyed by the cube and registry versions: one pass over the ledger per change, not per rerun
+    return gas_emissions(DATASET.view(), FACTORS).sum()
 
 
 def download_csv(df: pd.DataFrame) -> BytesIO:
@@ -582,8 +668,8 @@ if st.session_state.active_page == "Dashboard":
     st.markdown("<h1 style='font-size: 2.5rem; font-weight: 800; margin-bottom: 0.25rem;'>Dashboard</h1>", unsafe_allow_html=True)
     st.markdown("<p style='color: var(--muted); font-size: 1.125rem; margin-bottom: 2rem;'>Monitor your carbon footprint and track emissions analytics</p>", unsafe_allow_html=True)
 
-    df = st.session_state.emissions_data.copy()
-    if df.empty:
+    summary = aggregates().totals()
+    if summary["entries"] == 0:
         st.markdown(
             """
             <div class='stCard' style='text-align: center; padding: 3rem; background: linear-gradient(135deg, rgba(74, 222, 128, 0.05) 0%, rgba(34, 197, 94, 0.05) 100%); border: 2px dashed var(--border);'>
@@ -594,9 +680,7 @@ if st.session_state.active_page == "Dashboard":
             unsafe_allow_html=True
         )
     else:
-        if "emissions_kgCO2e" in df.columns:
-            df["emissions_kgCO2e"] = pd.to_numeric(df["emissions_kgCO2e"], errors="coerce").fillna(0)
-        total = float(df.get("emissions_kgCO2e", pd.Series([0])).sum())
+        total = summary["total"]
 
         # Metrics Row with improved spacing
         st.markdown("<div style='height: 0.5rem;'></div>", unsafe_allow_html=True)
@@ -606,18 +690,15 @@ if st.session_state.active_page == "Dashboard":
             st.markdown("<div class='metric-label'>Total Emissions</div>", unsafe_allow_html=True)
             st.markdown(f"<div class='metric-value'>{total:,.2f}<span style='font-size: 1.25rem; opacity: 0.8;'> kgCO2e</span></div></div>", unsafe_allow_html=True)
         with m2:
-            latest = "—"
-            if "date" in df.columns and not df["date"].isna().all():
-                df["date"] = pd.to_datetime(df["date"], errors="coerce")
-                d = df["date"].max()
-                latest = d.strftime("%Y-%m-%d") if pd.notna(d) else "—"
+            d = summary["latest"]
+            latest = d.strftime("%Y-%m-%d") if d is not None else "—"
             st.markdown("<div class='metric-card'><div class='metric-accent'></div>", unsafe_allow_html=True)
             st.markdown("<div class='metric-label'>Latest Entry</div>", unsafe_allow_html=True)
             st.markdown(f"<div class='metric-value' style='font-size: 1.5rem;'>{latest}</div></div>", unsafe_allow_html=True)
         with m3:
             st.markdown("<div class='metric-card'><div class='metric-accent'></div>", unsafe_allow_html=True)
             st.markdown("<div class='metric-label'>Total Entries</div>", unsafe_allow_html=True)
-            st.markdown(f"<div class='metric-value'>{len(df):,}</div></div>", unsafe_allow_html=True)
+            st.markdown(f"<div class='metric-value'>{summary['entries']:,}</div></div>", unsafe_allow_html=True)
 
         st.markdown("<div style='height: 3rem;'></div>", unsafe_allow_html=True)
 
@@ -626,8 +707,8 @@ if st.session_state.active_page == "Dashboard":
         
         # Scope Breakdown Chart - Full Width
         st.markdown("<div class='stCard'><h3 style='margin-top: 0; margin-bottom: 1rem; color: var(--primary);'>Emissions by Scope</h3>", unsafe_allow_html=True)
-        if total > 0 and "scope" in df.columns:
-            sb = scope_breakdown(df)
+        if total > 0:
+            sb = breakdown(["scope"])
             if not sb.empty:
                 fig1 = px.pie(sb, values="emissions_kgCO2e", names="scope", hole=.45)
                 darkify(fig1)
@@ -644,8 +725,8 @@ if st.session_state.active_page == "Dashboard":
         c1, c2 = st.columns(2)
         with c1:
             st.markdown("<div class='stCard'><h3 style='margin-top: 0; margin-bottom: 1rem; color: var(--primary);'>Emissions by Category</h3>", unsafe_allow_html=True)
-            if total > 0 and "category" in df.columns:
-                cat = df.groupby("category")["emissions_kgCO2e"].sum().reset_index().sort_values("emissions_kgCO2e", ascending=False)
+            if total > 0:
+                cat = breakdown(["category"])
                 if not cat.empty:
                     fig2 = px.bar(cat, x="category", y="emissions_kgCO2e", labels={"emissions_kgCO2e": "kgCO2e", "category": "Category"})
                     darkify(fig2)
@@ -658,16 +739,15 @@ if st.session_state.active_page == "Dashboard":
 
         with c2:
             st.markdown("<div class='stCard'><h3 style='margin-top: 0; margin-bottom: 1rem; color: var(--primary);'>Emissions Over Time</h3>", unsafe_allow_html=True)
-            if total > 0 and "date" in df.columns:
-                tdf = df.copy()
-                tdf["date"] = pd.to_datetime(tdf["date"], errors="coerce")
-                tdf = tdf.dropna(subset=["date"])
-                if not tdf.empty:
-                    tdf["month"] = tdf["date"].dt.to_period("M").astype(str)
-                    ts = tdf.groupby(["month", "scope"])["emissions_kgCO2e"].sum().reset_index()
+            if total > 0:
+                if summary["latest"] is not None:
+                    granularity = st.selectbox("Granularity", GRANULARITIES, index=GRANULARITIES.index("monthly"),
+                                               format_func=lambda g: g.replace("_", " ").title(), key="ts_granularity")
+                    ts = TIMESERIES.resample(granularity, ["scope"])
                     if not ts.empty:
-                        fig3 = px.line(ts, x="month", y="emissions_kgCO2e", color="scope", markers=True,
-                                       labels={"month": "Month", "emissions_kgCO2e": "kgCO2e"})
+                        fig3 = px.line(ts, x="period", y="emissions_kgCO2e", color="scope", markers=True,
+                                       hover_data=["label", "rolling_mean", "yoy_pct"],
+                                       labels={"period": "Period", "emissions_kgCO2e": "kgCO2e"})
                         darkify(fig3)
                         st.plotly_chart(fig3, use_container_width=True, config={'displayModeBar': False})
                     else:
@@ -678,6 +758,43 @@ if st.session_state.active_page == "Dashboard":
                 st.info("No emissions recorded yet.")
             st.markdown("</div>", unsafe_allow_html=True)
 
+        st.markdown("<div style='height: 1.5rem;'></div>", unsafe_allow_html=True)
+
+        # Forecast - Full Width
+        st.markdown("<div class='stCard'><h3 style='margin-top: 0; margin-bottom: 1rem; color: var(--primary);'>Emissions Forecast</h3>", unsafe_allow_html=True)
+        if summary["latest"] is not None:
+            split = st.selectbox("Project by", ["Total", "Scope", "Category", "Facility"], key="forecast_by")
+            by = () if split == "Total" else (split.lower(),)
+            projection = forecast_series(TIMESERIES.resample("monthly", by), by)
+            fig4 = forecast_figure(projection, by)
+            fig4.update_layout(title=None)
+            darkify(fig4)
+            st.plotly_chart(fig4, use_container_width=True, config={'displayModeBar': False})
+        else:
+            st.info("No valid dates found.")
+        st.markdown("</div>", unsafe_allow_html=True)
+
+        st.markdown("<div style='height: 1.5rem;'></div>", unsafe_allow_html=True)
+
+        # Emissions by gas - Full Width
+        st.markdown("<div class='stCard'><h3 style='margin-top: 0; margin-bottom: 1rem; color: var(--primary);'>Emissions by Gas</h3>", unsafe_allow_html=True)
+        if total > 0:
+            # What-if only: re-weights this chart, while stored entries stay priced on the registry's basis
+            basis = st.selectbox("GWP basis (what-if view)", GWP_BASES, index=GWP_BASES.index(FACTORS.gwp_basis), key="gwp_basis")
+            kg = gas_totals(aggregates().version, FACTORS.version)
+            gas = pd.DataFrame({"gas": GASES, "kg": kg.to_numpy(), "kgCO2e": kg.to_numpy() * gwp_vector(basis)})
+            gas = gas[gas["kg"] > 0]
+            fig5 = px.bar(gas, x="gas", y="kgCO2e", hover_data=["kg"], labels={"gas": "Gas", "kgCO2e": f"kgCO2e ({basis})"})
+            darkify(fig5)
+            st.plotly_chart(fig5, use_container_width=True, config={'displayModeBar': False})
+            st.caption(
+                f"Stored totals use {FACTORS.gwp_basis} GWPs; other bases re-weight this chart only. "
+                "Entries priced without a per-gas factor are shown as CO2e."
+            )
+        else:
+            st.info("No emissions recorded yet.")
+        st.markdown("</div>", unsafe_allow_html=True)
+
 elif st.session_state.active_page == "Data Entry":
     st.markdown("<h1 style='font-size: 2.5rem; font-weight: 800; margin-bottom: 0.25rem;'>Data Entry</h1>", unsafe_allow_html=True)
     st.markdown("<p style='color: var(--muted); font-size: 1.125rem; margin-bottom: 2rem;'>Add new emissions data or upload CSV files</p>", unsafe_allow_html=True)
@@ -723,6 +840,7 @@ elif st.session_state.active_page == "Data Entry":
                 verification_status = st.selectbox("Verification Status", ["Unverified", "Internally Verified", "Third-Party Verified"])
                 st.markdown("<div style='height: 0.5rem;'></div>", unsafe_allow_html=True)
                 notes = st.text_area("Notes", placeholder="Data source, methodology, assumptions…", height=100)
+                allow_unusual = st.checkbox("Save even if the values look unusual", value=False)
 
             st.markdown("<div style='height: 1.5rem;'></div>", unsafe_allow_html=True)
             cta1, cta2 = st.columns([1, 1])
@@ -732,38 +850,39 @@ elif st.session_state.active_page == "Data Entry":
                 _ = st.form_submit_button("Clear Form", type="secondary", use_container_width=True)
 
             if submitted:
-                if quantity <= 0:
-                    st.error("Quantity must be greater than zero.")
-                elif not unit.strip():
-                    st.error("Unit is required.")
-                elif scope not in ALLOWED_SCOPES:
-                    st.error("Invalid scope.")
-                else:
-                    try:
-                        emissions = float(quantity) * float(emission_factor)
-                        new_row = pd.DataFrame([{
-                            "date": date.strftime("%Y-%m-%d"),
-                            "scope": scope,
-                            "category": category,
-                            "activity": activity,
-                            "quantity": float(quantity),
-                            "unit": unit,
-                            "emission_factor": float(emission_factor),
-                            "emissions_kgCO2e": emissions,
-                            "country": country,
-                            "facility": facility,
-                            "responsible_person": responsible,
-                            "data_quality": data_quality,
-                            "verification_status": verification_status,
-                            "notes": notes,
-                        }])
-                        st.session_state.emissions_data = pd.concat([st.session_state.emissions_data, new_row], ignore_index=True)
-                        if persist_dataframe(st.session_state.emissions_data):
+                try:
+                    emissions = float(quantity) * float(emission_factor)
+                    new_row = pd.DataFrame([{
+                        "date": date.strftime("%Y-%m-%d"),
+                        "scope": scope,
+                        "category": category,
+                        "activity": activity,
+                        "quantity": float(quantity),
+                        "unit": unit,
+                        "emission_factor": float(emission_factor),
+                        "emissions_kgCO2e": emissions,
+                        "country": country,
+                        "facility": facility,
+                        "responsible_person": responsible,
+                        "data_quality": data_quality,
+                        "verification_status": verification_status,
+                        "notes": notes,
+                    }])
+                    errors = validate(new_row)
+                    if len(errors):
+                        for column, error in zip(errors["column"], errors["error"]):
+                            st.error(f"{column.replace('_', ' ').capitalize()} {error}.")
+                    else:
+                        # Same unit as the activity's registered factor, e.g. MWh -> kWh
+                        new_row, unit_errors = FACTORS.normalize_units(new_row)
+                        if unit_errors.any():
+                            st.error(f"{unit} cannot be converted to the unit of the {category} / {activity} emission factor.")
+                        elif persist_rows(new_row, allow_anomalies=allow_unusual) is not None:
                             st.success("Entry added successfully.")
                             st.session_state.active_page = "Dashboard"
                             st.rerun()
-                    except Exception as e:
-                        st.error(f"Error adding entry: {e}")
+                except Exception as e:
+                    st.error(f"Error adding entry: {e}")
         st.markdown("</div>", unsafe_allow_html=True)
         
         st.markdown("<div style='height: 3rem;'></div>", unsafe_allow_html=True)
@@ -771,24 +890,22 @@ elif st.session_state.active_page == "Data Entry":
         if not st.session_state.emissions_data.empty:
             st.markdown("<h3>Existing Emissions Data</h3>", unsafe_allow_html=True)
             st.markdown("<div class='stCard'>", unsafe_allow_html=True)
-            st.dataframe(st.session_state.emissions_data, use_container_width=True, hide_index=False)
+            st.dataframe(NOTES.attach(st.session_state.emissions_data), use_container_width=True, hide_index=False)
             st.markdown("</div>", unsafe_allow_html=True)
             
             st.markdown("<div style='height: 1rem;'></div>", unsafe_allow_html=True)
             d1, d2 = st.columns([3, 1])
             with d1:
-                buf = download_csv(st.session_state.emissions_data)
+                buf = download_csv(NOTES.attach(st.session_state.emissions_data))
                 st.download_button("Download current CSV", data=buf, file_name="emissions_export.csv", mime="text/csv")
             with d2:
-                idx = st.number_input("Row index", min_value=0, max_value=len(st.session_state.emissions_data)-1, step=1)
+                idx = st.number_input("Entry ID", min_value=0, max_value=int(st.session_state.emissions_data.index.max()), step=1)
                 if st.button("Delete", type="primary"):
-                    try:
-                        st.session_state.emissions_data = st.session_state.emissions_data.drop(int(idx)).reset_index(drop=True)
-                        if persist_dataframe(st.session_state.emissions_data):
-                            st.success(f"Deleted row {idx}")
-                            st.rerun()
-                    except Exception as e:
-                        st.error(f"Delete failed: {e}")
+                    if int(idx) not in st.session_state.emissions_data.index:
+                        st.error(f"No entry with ID {idx}")
+                    elif delete_rows([int(idx)]):
+                        st.success(f"Deleted entry {idx}")
+                        st.rerun()
 
     # CSV Upload
     with tabs[1]:
@@ -796,30 +913,71 @@ elif st.session_state.active_page == "Data Entry":
         st.markdown("<h3 style='margin-bottom: 1.5rem; color: var(--primary); font-size: 1.5rem;'>Upload CSV File</h3>", unsafe_allow_html=True)
         st.markdown("<p style='color: var(--muted); margin-bottom: 1.5rem;'>Upload a CSV file with your emissions data. The file must contain the required columns.</p>", unsafe_allow_html=True)
         uploaded = st.file_uploader("Choose a CSV file", type="csv")
+        allow_unusual_rows = st.checkbox("Import rows whose values look unusual", value=False)
+        match_rows = st.checkbox("Map unrecognized categories and activities to the closest emission factor", value=False)
         if uploaded is not None:
-            max_mb = 5
-            size_ok = getattr(uploaded, "size", 0) <= max_mb * 1024 * 1024
-            if not size_ok:
-                st.error(f"File too large. Limit is {max_mb} MB.")
-            else:
-                try:
-                    dfu = pd.read_csv(uploaded)
+            # Streamed a chunk at a time; rows already saved are removed again if a later chunk fails
+            import_bar = st.progress(0.0, text="Importing...")
+            saved, failed, mapped = [], False, []
+            try:
+                for dfu in iter_csv_chunks(uploaded, progress=lambda done, total: import_bar.progress(
+                        min(done / total, 1.0) if total else 1.0, text="Importing...")):
                     missing = [c for c in REQUIRED_COLUMNS if c not in dfu.columns]
                     if missing:
                         st.error(f"CSV must contain columns: {', '.join(REQUIRED_COLUMNS)}")
-                    else:
-                        dfu["quantity"] = pd.to_numeric(dfu["quantity"], errors="coerce")
-                        dfu["emission_factor"] = pd.to_numeric(dfu["emission_factor"], errors="coerce")
-                        dfu["date"] = pd.to_datetime(dfu["date"], errors="coerce").dt.strftime("%Y-%m-%d")
-                        if "emissions_kgCO2e" not in dfu.columns:
-                            dfu["emissions_kgCO2e"] = (dfu["quantity"].fillna(0) * dfu["emission_factor"].fillna(0)).clip(lower=0)
-                        st.session_state.emissions_data = pd.concat([st.session_state.emissions_data, dfu], ignore_index=True)
-                        if persist_dataframe(st.session_state.emissions_data):
-                            st.success("CSV uploaded successfully.")
-                            st.session_state.active_page = "Dashboard"
-                            st.rerun()
-                except Exception as e:
-                    st.error(f"Error processing CSV: {e}")
+                        failed = True
+                        break
+                    errors = validate(dfu)
+                    if len(errors):
+                        st.error(f"{errors['row'].nunique()} rows are invalid (line numbers count the header as line 1):")
+                        st.dataframe(errors.assign(line=errors["row"] + 2)[["line", "column", "error"]], use_container_width=True, hide_index=True)
+                        failed = True
+                        break
+                    dfu["quantity"] = pd.to_numeric(dfu["quantity"], errors="coerce")
+                    dfu["emission_factor"] = pd.to_numeric(dfu["emission_factor"], errors="coerce") if "emission_factor" in dfu.columns else float("nan")
+                    dfu["date"] = pd.to_datetime(dfu["date"], errors="coerce").dt.strftime("%Y-%m-%d")
+                    if "emissions_kgCO2e" not in dfu.columns:
+                        dfu["emissions_kgCO2e"] = (dfu["quantity"].fillna(0) * dfu["emission_factor"].fillna(0)).clip(lower=0)
+                    # Quantities in the factors' units, then rows without a factor are priced from the registry in one join
+                    dfu, flags = price_chunk(dfu, FACTORS, MATCHER if match_rows else None)
+                    if flags["remapped"].any():
+                        mapped.append(dfu.loc[flags["remapped"], ["matched_from", "category", "activity"]].drop_duplicates())
+                    if flags["unit_error"].any():
+                        st.error(f"Units of {int(flags['unit_error'].sum())} rows cannot be converted to their emission factor's unit:")
+                        st.dataframe(dfu.loc[flags["unit_error"], ["category", "activity", "quantity", "unit"]], use_container_width=True)
+                        failed = True
+                        break
+                    if flags["unpriced"].any():
+                        # Rejected like DataHandler.import_csv: saving them would record zero emissions
+                        unpriced = dfu.loc[flags["unpriced"], ["category", "activity", "unit"]]
+                        closest = MATCHER.best(unpriced.head(20))
+                        st.error(f"No emission factor found for {len(unpriced)} rows (closest known activities shown):")
+                        st.dataframe(unpriced.head(20).assign(
+                            line=unpriced.index[:20] + 2,
+                            closest_category=closest["category"],
+                            closest_activity=closest["activity"],
+                        )[["line", "category", "activity", "unit", "closest_category", "closest_activity"]], use_container_width=True, hide_index=True)
+                        failed = True
+                        break
+                    stored = persist_rows(dfu, allow_anomalies=allow_unusual_rows)
+                    if stored is None:
+                        failed = True
+                        break
+                    saved.extend(stored.index.tolist())
+            except Exception as e:
+                st.error(f"Error processing CSV: {e}")
+                failed = True
+            import_bar.empty()
+            if mapped:
+                st.info("Mapped rows to the closest emission factor:")
+                st.dataframe(pd.concat(mapped).drop_duplicates(), use_container_width=True)
+            if failed:
+                if saved and delete_rows(saved):
+                    st.info(f"Removed the {len(saved)} rows saved before the error.")
+            else:
+                st.success(f"CSV uploaded successfully ({len(saved)} rows).")
+                st.session_state.active_page = "Dashboard"
+                st.rerun()
 
         st.markdown("<div style='height: 1rem;'></div>", unsafe_allow_html=True)
         st.markdown("---", unsafe_allow_html=True)
@@ -886,6 +1044,11 @@ elif st.session_state.active_page == "AI Insights":
         st.markdown("<div style='height: 1.5rem;'></div>", unsafe_allow_html=True)
         if st.button("Get Assistance", key="data_assistant_btn", type="primary", use_container_width=True):
             if desc:
+                # Closest emission factors from the local index, before asking the agents
+                matches = MATCHER.match([desc])
+                if len(matches):
+                    st.markdown("<h4>Closest emission factors</h4>", unsafe_allow_html=True)
+                    st.dataframe(matches[["category", "activity", "unit", "confidence"]], use_container_width=True, hide_index=True)
                 with st.spinner("Analyzing..."):
                     try:
                         result = st.session_state.ai_agents.run_data_entry_crew(desc)
@@ -908,7 +1071,8 @@ elif st.session_state.active_page == "AI Insights":
             if st.button("Generate Summary", key="report_summary_btn", type="primary", use_container_width=True):
                 with st.spinner("Summarizing..."):
                     try:
-                        emissions_str = st.session_state.emissions_data.to_string()
+                        trend = TIMESERIES.resample("monthly")[["label", "emissions_kgCO2e", "rolling_mean", "change_pct", "yoy_pct", "year_to_date"]]
+                        emissions_str = "Monthly trend:\n" + trend.to_string(index=False) + "\n\nEntries:\n" + NOTES.attach(st.session_state.emissions_data).to_string()
                         result = st.session_state.ai_agents.run_report_summary_crew(emissions_str)
                         st.markdown("<div style='height: 1.5rem;'></div>", unsafe_allow_html=True)
                         st.markdown(f"<div class='stCard' style='background: var(--elev-hover);'>{str(result)}</div>", unsafe_allow_html=True)
@@ -980,7 +1144,7 @@ elif st.session_state.active_page == "AI Insights":
             if st.button("Generate Optimization Recommendations", key="emission_optimizer_btn", type="primary", use_container_width=True):
                 with st.spinner("Analyzing..."):
                     try:
-                        emissions_str = st.session_state.emissions_data.to_string()
+                        emissions_str = NOTES.attach(st.session_state.emissions_data).to_string()
                         result = st.session_state.ai_agents.run_optimization_crew(emissions_str)
                         st.markdown("<div style='height: 1.5rem;'></div>", unsafe_allow_html=True)
                         st.markdown(f"<div class='stCard' style='background: var(--elev-hover);'>{str(result)}</div>", unsafe_allow_html=True)
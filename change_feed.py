@@ -0,0 +1,107 @@
+"""
+Change feed for YourCarbonFootprint application.
+Tells every process which emissions entries other processes added or removed.
+"""
+
+import threading
+
+# Feed settings
+POLL_INTERVAL = 1.0  # seconds between background checks of the store version
+
+
+class ChangeFeed:
+    """
+    Publishes inserts and deletes from a shared store to in-process subscribers.
+
+    Each store exposes a cheap version token and a sequence-numbered log of
+    changes (the journal for the JSON store, a change table for SQLite, a
+    change log for parquet). The feed keeps a cursor into that log; when the
+    token moves it reads only the changes since the cursor and hands them to
+    every subscriber. When a store cannot describe the changes (after a
+    compaction or a full rewrite) subscribers are told to reset instead.
+
+    Changes may be delivered more than once, so subscribers must apply them
+    idempotently: skip inserted ids they already hold, ignore unknown deletes.
+    """
+
+    def __init__(self, store, interval=POLL_INTERVAL):
+        """
+        Initialize the ChangeFeed class.
+
+        Args:
+            store (EmissionsStore): Store to follow
+            interval (float, optional): Seconds between background polls
+        """
+        self.store = store
+        self.interval = interval
+        self._cursor = store.version()
+        self._subscribers = []
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, on_change, on_reset=None):
+        """
+        Register callbacks for changes.
+
+        Args:
+            on_change (callable): Called as on_change(inserted DataFrame, list of deleted ids)
+            on_reset (callable, optional): Called when the subscriber must reload everything
+        """
+        with self._lock:
+            self._subscribers.append((on_change, on_reset))
+
+    def poll(self):
+        """
+        Check the store once and publish what changed.
+
+        Returns:
+            bool: True if anything was published
+        """
+        with self._lock:
+            version = self.store.version()
+            if version == self._cursor:
+                return False
+            changes = self.store.changes_since(self._cursor)
+            if changes is None:
+                self._cursor = version
+                for _, on_reset in self._subscribers:
+                    if on_reset is not None:
+                        self._notify(on_reset)
+                return True
+            inserted, deleted, self._cursor = changes
+            if len(inserted) or deleted:
+                for on_change, _ in self._subscribers:
+                    self._notify(on_change, inserted, deleted)
+            return True
+
+    @staticmethod
+    def _notify(callback, *args):
+        """Call a subscriber, logging rather than propagating its errors."""
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"Error in change feed subscriber: {str(e)}")
+
+    def start(self):
+        """Poll in a background thread so idle processes stay current too."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        """Background loop: poll every interval."""
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error polling emissions changes: {str(e)}")
@@ -0,0 +1,156 @@
+"""
+Compact in-memory representation for YourCarbonFootprint application.
+Shrinks the per-session emissions DataFrame: categorical codes for repeated
+labels, notes kept in a shared side store, optional float32 measures.
+"""
+
+import threading
+
+import pandas as pd
+
+from config import COMPACT_FLOAT32
+
+# Low-cardinality labels stored as categoricals
+CATEGORICAL_COLUMNS = [
+    "scope", "category", "activity", "unit", "country", "facility",
+    "business_unit", "data_quality", "verification_status",
+]
+# Free text kept out of the frame until it is displayed
+SIDE_COLUMNS = ["notes"]
+# Inputs that may be downcast; emissions_kgCO2e stays float64 so totals keep their precision
+FLOAT32_COLUMNS = ["quantity", "emission_factor"]
+
+
+def compact_frame(df, float32=None):
+    """
+    Convert an emissions DataFrame to its compact form.
+
+    Args:
+        df (pandas.DataFrame): Emissions data indexed by entry_id
+        float32 (bool, optional): Store quantity and emission_factor as float32;
+            defaults to config.COMPACT_FLOAT32
+
+    Returns:
+        pandas.DataFrame: Compact copy without the side columns
+    """
+    if float32 is None:
+        float32 = COMPACT_FLOAT32
+    data = df.drop(columns=[c for c in SIDE_COLUMNS if c in df.columns])
+    converted = {}
+    if "date" in data.columns and not pd.api.types.is_datetime64_any_dtype(data["date"]):
+        converted["date"] = pd.to_datetime(data["date"], errors="coerce")
+    for col in CATEGORICAL_COLUMNS:
+        if col in data.columns and not isinstance(data[col].dtype, pd.CategoricalDtype):
+            converted[col] = data[col].astype("category")
+    for col in FLOAT32_COLUMNS:
+        if col in data.columns:
+            values = pd.to_numeric(data[col], errors="coerce")
+            converted[col] = values.astype("float32") if float32 else values
+    return data.assign(**converted) if converted else data
+
+
+def append_compact(df, rows, float32=None):
+    """
+    Append entries to a compact frame without losing its categorical dtypes.
+
+    pandas turns categoricals with different categories into object columns
+    on concat, so new labels are added to the existing categories first.
+
+    Args:
+        df (pandas.DataFrame): Compact emissions data
+        rows (pandas.DataFrame): New entries, compact or not
+        float32 (bool, optional): As for compact_frame
+
+    Returns:
+        pandas.DataFrame: Compact frame holding both
+    """
+    rows = compact_frame(rows, float32)
+    if df.empty:
+        return rows
+    df = df.copy(deep=False)
+    for col in CATEGORICAL_COLUMNS:
+        if col not in rows.columns:
+            continue
+        if col not in df.columns:
+            df[col] = pd.Categorical([None] * len(df))
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+        new = rows[col].cat.categories.difference(df[col].cat.categories)
+        if len(new):
+            df[col] = df[col].cat.add_categories(new)
+        rows[col] = rows[col].cat.set_categories(df[col].cat.categories)
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and col not in rows.columns:
+            rows[col] = pd.Categorical([None] * len(rows), categories=df[col].cat.categories)
+    return pd.concat([df, rows])
+
+
+class NotesStore:
+    """
+    Process-wide side store for free-text columns.
+
+    Notes are read from the emissions store the first time any session
+    displays them and then shared by every session, instead of every session
+    frame carrying a copy.
+    """
+
+    def __init__(self, store):
+        """
+        Initialize the NotesStore class.
+
+        Args:
+            store (EmissionsStore): Store to read notes from
+        """
+        self.store = store
+        self._notes = None
+        self._lock = threading.Lock()
+
+    def _loaded(self):
+        """Return the notes series, reading only that column from the store on first use."""
+        with self._lock:
+            if self._notes is None:
+                data = self.store.read(columns=SIDE_COLUMNS)
+                self._notes = data["notes"] if "notes" in data.columns else pd.Series(dtype=object)
+            return self._notes
+
+    def reset(self):
+        """Forget the loaded notes so the next display reads them again."""
+        with self._lock:
+            self._notes = None
+
+    def update(self, rows):
+        """
+        Record the notes of newly stored entries.
+
+        Args:
+            rows (pandas.DataFrame): Entries indexed by entry_id
+        """
+        with self._lock:
+            if self._notes is None or "notes" not in rows.columns:
+                return  # Not loaded yet: the next load reads them from the store
+            new = rows.loc[~rows.index.isin(self._notes.index), "notes"]
+            self._notes = pd.concat([self._notes, new])
+
+    def remove(self, entry_ids):
+        """
+        Forget the notes of deleted entries.
+
+        Args:
+            entry_ids (iterable): Ids of the deleted entries
+        """
+        with self._lock:
+            if self._notes is not None:
+                self._notes = self._notes.drop(index=self._notes.index.intersection(entry_ids))
+
+    def attach(self, df):
+        """
+        Add the notes column to a compact frame for display or export.
+
+        Args:
+            df (pandas.DataFrame): Compact emissions data indexed by entry_id
+
+        Returns:
+            pandas.DataFrame: Copy with a notes column
+        """
+        notes = self._loaded()
+        return df.assign(notes=notes.reindex(df.index))
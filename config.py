@@ -24,6 +24,39 @@ DATA_DIR = "data"
 EMISSIONS_FILE = os.path.join(DATA_DIR, "emissions.json")
 COMPANY_INFO_FILE = os.path.join(DATA_DIR, "company_info.json")
 
+# Storage backend for emissions data: "json" (journaled JSON), "parquet" or "sqlite"
+STORAGE_BACKEND = os.getenv("A4S_STORAGE_BACKEND", "json")
+
+# Backup snapshots kept per rule (newest N, then one per recent hour/day/week)
+SNAPSHOT_RETENTION = {"last": 3, "hourly": 24, "daily": 7, "weekly": 8}
+
+# Largest in-memory ledger the JSON loader will build, in MB (0 for no limit)
+LOAD_MEMORY_LIMIT_MB = int(os.getenv("A4S_LOAD_MEMORY_LIMIT_MB", "2048"))
+
+# Keep quantity and emission_factor as float32 in session data (halves their memory)
+COMPACT_FLOAT32 = os.getenv("A4S_COMPACT_FLOAT32", "0") == "1"
+
+# First month (1-12) of the fiscal year used by fiscal-year time series
+FISCAL_YEAR_START_MONTH = int(os.getenv("A4S_FISCAL_YEAR_START_MONTH", "1"))
+
+# Rows read, validated and stored at a time by CSV imports
+IMPORT_CHUNK_ROWS = int(os.getenv("A4S_IMPORT_CHUNK_ROWS", "50000"))
+
+# Worker processes a batch ingest parses and prices files in (0 for one per CPU)
+INGEST_WORKERS = int(os.getenv("A4S_INGEST_WORKERS", "0"))
+
+# Earliest date an emissions entry may have
+VALID_FROM_DATE = os.getenv("A4S_VALID_FROM_DATE", "1990-01-01")
+
+# Directory of external emission factor datasets (CSV or Parquet), loaded on first lookup
+FACTOR_DATASETS_DIR = os.getenv("A4S_FACTOR_DATASETS_DIR", os.path.join(DATA_DIR, "factors"))
+
+# IPCC assessment report whose 100-year GWPs convert gases to CO2e: "AR4", "AR5" or "AR6"
+GWP_BASIS = os.getenv("A4S_GWP_BASIS", "AR5")
+
+# Basis the stored entries were last restated under; once saved it takes precedence over GWP_BASIS
+GWP_BASIS_FILE = os.path.join(DATA_DIR, "gwp_basis.json")
+
 # Supported languages
 SUPPORTED_LANGUAGES = ["English", "Hindi"]
 
@@ -0,0 +1,89 @@
+"""
+Emissions cube for YourCarbonFootprint application.
+Pre-aggregates the ledger by month and the reporting dimensions for roll-up queries.
+"""
+
+import pandas as pd
+
+from aggregates import MEASURE, MaterializedAggregates
+
+# Finest grain of the cube
+CUBE_DIMENSIONS = ["month", "scope", "category", "activity", "facility", "country", "business_unit"]
+# Raw columns needed to build it
+CUBE_COLUMNS = ["date", "scope", "category", "activity", "facility", "country", "business_unit", MEASURE]
+
+
+class EmissionsCube(MaterializedAggregates):
+    """
+    Sums and counts for every (month, scope, category, activity, facility,
+    country, business_unit) cell, maintained on insert and delete.
+
+    Summaries, drill-downs and slices are roll-ups of the cells, so they cost
+    O(cells) rather than O(rows): the number of cells is bounded by the
+    distinct combinations in the ledger, not by how many entries it holds.
+    Missing dimension values form their own cells so that roll-ups over other
+    dimensions still count those rows.
+    """
+
+    dropna = False
+
+    def __init__(self, measure=MEASURE):
+        """
+        Initialize the EmissionsCube class.
+
+        Args:
+            measure (str, optional): Column to sum
+        """
+        super().__init__(groupings=[tuple(CUBE_DIMENSIONS)], measure=measure)
+        self._cells = None
+        self._cells_version = None
+
+    def _prepare(self, df):
+        """Derive the month column and add absent dimensions as missing values."""
+        data = super()._prepare(df)
+        absent = [c for c in CUBE_DIMENSIONS if c not in data.columns]
+        return data.assign(**{c: None for c in absent}) if absent else data
+
+    def cells(self):
+        """
+        Return the cube cells.
+
+        Returns:
+            pandas.DataFrame: One row per cell: the dimensions, the summed measure and "entries"
+        """
+        if self._cells_version != self.version:
+            self._cells, self._cells_version = self.breakdown(CUBE_DIMENSIONS), self.version
+        return self._cells
+
+    def rollup(self, by, filters=None, start_month=None, end_month=None):
+        """
+        Aggregate the cube to coarser dimensions.
+
+        Args:
+            by (list): Dimensions to keep; empty for a grand total
+            filters (dict, optional): Dimension -> required value (or list of values);
+                None values are ignored
+            start_month (str, optional): First month to include, YYYY-MM
+            end_month (str, optional): Last month to include, YYYY-MM
+
+        Returns:
+            pandas.DataFrame: The kept dimensions plus the summed measure and an "entries"
+                count, the same shape storage.aggregate_frame returns
+        """
+        cells = self.cells()
+        mask = pd.Series(True, index=cells.index)
+        for col, value in (filters or {}).items():
+            if value is None:
+                continue
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            mask &= cells[col].isin(values)
+        months = cells["month"].fillna("")
+        if start_month:
+            mask &= months >= start_month
+        if end_month:
+            mask &= (months != "") & (months <= end_month)
+        data = cells if mask.all() else cells[mask]
+        if not by:
+            return pd.DataFrame({self.measure: [data[self.measure].sum()], "entries": [int(data["entries"].sum())]})
+        grouped = data.groupby(list(by))[[self.measure, "entries"]].sum()
+        return grouped.reset_index()
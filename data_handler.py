@@ -3,6 +3,7 @@ Data handler for YourCarbonFootprint application.
 Manages data import, export, and processing.
 """
 
+import numpy as np
 import pandas as pd
 import json
 import os
@@ -13,33 +14,225 @@ from fpdf import FPDF
 import matplotlib.pyplot as plt
 import seaborn as sns
 from emission_factors import get_emission_factor, get_categories, get_activities
+from config import IMPORT_CHUNK_ROWS, INGEST_WORKERS
+from json_loader import JSONFormatError
+from storage import open_store, filter_frame, sort_by_date, date_slice, ENTRY_ID
+from cube import CUBE_COLUMNS, CUBE_DIMENSIONS, EmissionsCube
+from query import EmissionsQuery, QueryEngine
+from timeseries import TimeSeriesEngine, write_trend_pdf
+from forecast import FORECAST_HORIZON, forecast_series
+from anomaly import ANOMALY_KEYS, ANOMALY_MEASURES, AnomalyDetector
+from factor_registry import default_registry, save_gwp_basis
+from factor_datasets import default_catalog
+from ingest import (
+    IMPORT_COLUMNS, INGEST_REPORT_COLUMNS, REJECT_EXAMPLES,
+    expand_ranges, id_ranges, ingest_paths, iter_csv_chunks, prepare_files, price_chunk,
+)
+from gases import GASES, gas_emissions, gwp_vector
+from matching import FactorMatcher
+from restatement import FactorDependents, restate
+from validation import format_errors, validate
+from write_buffer import WriteBuffer
 
 # Constants
 DATA_DIR = "data"
 EMISSIONS_FILE = os.path.join(DATA_DIR, "emissions.json")
 COMPANY_INFO_FILE = os.path.join(DATA_DIR, "company_info.json")
 
+# Columns needed for reports and summaries
+REPORT_COLUMNS = ['date', 'scope', 'category', 'activity', 'quantity', 'unit', 'emission_factor', 'emissions_kgCO2e']
+
 # Ensure data directory exists
 os.makedirs(DATA_DIR, exist_ok=True)
 
 class DataHandler:
-    def __init__(self):
-        """Initialize the DataHandler class."""
-        self.load_emissions_data()
+    def __init__(self, storage_backend=None):
+        """
+        Initialize the DataHandler class.
+        
+        Args:
+            storage_backend (str, optional): "json", "parquet" or "sqlite"; defaults to config.STORAGE_BACKEND
+        """
+        self.store = open_store(storage_backend, DATA_DIR)
+        self.writer = WriteBuffer(self.store)
+        self._pending = []
+        self._unmerged = []
+        self._emissions_data = None
+        self.cube = EmissionsCube()
+        self.detector = AnomalyDetector()
+        self.factors = default_registry()
+        self.matcher = FactorMatcher(self.factors)
+        self.dependents = FactorDependents()
+        self._restated_version = self.factors.version  # registry version entries were last restated at
+        self.data_version = 0  # bumped on every change to the emissions data
+        self.queries = QueryEngine(self._execute, self._version)
+        self.timeseries = TimeSeriesEngine(self._series_rows, self._version)
         self.load_company_info()
     
-    def load_emissions_data(self):
-        """Load emissions data from file."""
-        if os.path.exists(EMISSIONS_FILE):
-            with open(EMISSIONS_FILE, 'r') as f:
-                try:
-                    self.emissions_data = pd.DataFrame(json.load(f))
-                    # Convert date strings to datetime objects
-                    if 'date' in self.emissions_data.columns:
-                        self.emissions_data['date'] = pd.to_datetime(self.emissions_data['date'])
-                except json.JSONDecodeError:
-                    self.create_empty_emissions_data()
+    @property
+    def emissions_data(self):
+        """Full emissions data sorted by date, loaded from the store on first access."""
+        if self._pending:
+            self.flush()
+        if self._emissions_data is None:
+            self.load_emissions_data()
+        elif self._unmerged:
+            # One concat for all entries committed since the last access
+            new = [e.assign(date=pd.to_datetime(e['date'], errors='coerce', format='mixed')) if 'date' in e.columns else e for e in self._unmerged]
+            self._emissions_data = sort_by_date(pd.concat([self._emissions_data, *new]))
+            self._unmerged = []
+        return self._emissions_data
+    
+    @emissions_data.setter
+    def emissions_data(self, value):
+        # Kept sorted so that date ranges are binary searches (see _query); unparseable dates
+        # become NaT rather than failing, so that no stored entry is dropped
+        if 'date' in value.columns and not pd.api.types.is_datetime64_any_dtype(value['date']):
+            value = value.assign(date=pd.to_datetime(value['date'], errors='coerce', format='mixed'))
+        self._emissions_data = sort_by_date(value)
+        self._unmerged = []
+        self.data_version += 1
+    
+    def _append_loaded(self, entries):
+        """Add stored entries to the in-memory data, cube and anomaly statistics if they have been loaded."""
+        if self._emissions_data is not None:
+            self._unmerged.append(entries)
+        if self.cube.ready:
+            self.cube.add(entries)
+        if self.detector.ready:
+            self.detector.add(entries)
+        if self.dependents.ready:
+            self.dependents.add(entries)
+        self.data_version += 1
+    
+    def flush(self):
+        """
+        Commit entries added with wait=False and wait until they are durable.
+        
+        Returns:
+            bool: True if every buffered entry was saved, False otherwise
+        """
+        self.writer.flush()
+        pending, self._pending = self._pending, []
+        success = True
+        for write in pending:
+            try:
+                self._append_loaded(write.wait())
+            except Exception as e:
+                print(f"Error saving emission entry: {str(e)}")
+                success = False
+        return success
+    
+    def _query(self, start_date=None, end_date=None, columns=None, filters=None):
+        """
+        Read a slice of the emissions data.
+        
+        Partitioned stores read only the partitions and columns needed; other
+        stores slice the date range out of the sorted in-memory data by binary
+        search and filter only the rows in it.
+        """
+        if self._pending:
+            self.flush()
+        if self.store.supports_pruning and self._emissions_data is None:
+            data = self.store.read(start_date, end_date, columns, filters)
         else:
+            data = date_slice(self.emissions_data, start_date, end_date)
+            data = filter_frame(data, columns=columns, filters=filters)
+        if 'date' in data.columns and not pd.api.types.is_datetime64_any_dtype(data['date']):
+            data = data.assign(date=pd.to_datetime(data['date'], errors='coerce', format='mixed'))
+        return data
+    
+    def _version(self):
+        """
+        Version of the data queries run against.
+        
+        Queries answered straight from a pruning store also depend on the
+        store's own version, which moves when other processes write.
+        """
+        if self.store.supports_pruning and self._emissions_data is None:
+            return (self.data_version, self.store.version())
+        return (self.data_version, None)
+    
+    def _execute(self, query):
+        """Run a query against the rows in its date range."""
+        # In-memory data is kept sorted by date; store reads already hold only the range,
+        # which date_slice returns whole
+        return query.run(self._query(query.start_date, query.end_date), sorted_by_date=True)
+    
+    def query(self, query):
+        """
+        Run an emissions query, reusing the cached result if the data has not changed.
+        
+        Args:
+            query (EmissionsQuery): Filters, group-by and measures
+            
+        Returns:
+            pandas.DataFrame: Query result; shared with the cache, so do not modify it in place
+        """
+        self._settle()
+        return self.queries.run(query)
+    
+    def _settle(self):
+        """Commit buffered writes and load or merge pending entries, so the data version is final."""
+        if self._pending:
+            self.flush()
+        if not self.store.supports_pruning or self._emissions_data is not None:
+            self.emissions_data
+    
+    def _series_rows(self, by):
+        """Rows the time series engine reduces to daily totals."""
+        return self.query(EmissionsQuery().select('date', *by, 'emissions_kgCO2e'))
+    
+    def resample(self, granularity='monthly', by=(), start_date=None, end_date=None, window=None):
+        """
+        Emissions per period, with rolling, period-over-period and cumulative figures.
+        
+        Args:
+            granularity (str, optional): "daily", "weekly", "monthly", "quarterly" or "fiscal_year"
+            by (tuple, optional): Columns to split into separate series, e.g. ('scope',)
+            start_date (datetime, optional): First period to return
+            end_date (datetime, optional): Last period to return
+            window (int, optional): Periods in the rolling mean
+            
+        Returns:
+            pandas.DataFrame: See timeseries.resample_totals; shared with the cache, so do not modify it in place
+        """
+        self._settle()
+        return self.timeseries.resample(granularity, by, window, start_date, end_date)
+    
+    def forecast(self, by=('facility', 'category', 'scope'), horizon=FORECAST_HORIZON):
+        """
+        Project monthly emissions for every combination of some columns.
+        
+        Args:
+            by (tuple, optional): Columns whose combinations form the series; () for the total
+            horizon (int, optional): Months to project
+            
+        Returns:
+            pandas.DataFrame: See forecast.forecast_series
+        """
+        return forecast_series(self.resample('monthly', by), by, horizon)
+    
+    def load_emissions_data(self, progress=None):
+        """
+        Load emissions data from file.
+
+        Args:
+            progress (callable, optional): Called as progress(done, total) while loading
+        """
+        self.cube.clear()
+        self.detector.clear()
+        self.dependents.clear()
+        try:
+            data = self.store.load(progress=progress)
+            if len(data) == 0:
+                self.create_empty_emissions_data()
+            else:
+                # The setter converts date strings to datetime objects and sorts
+                self.emissions_data = data
+        except (json.JSONDecodeError, JSONFormatError) as e:
+            # Malformed JSON or not a list of records; other errors must not pass as an empty ledger
+            print(f"Error loading emissions data: {str(e)}")
             self.create_empty_emissions_data()
     
     def create_empty_emissions_data(self):
@@ -47,7 +240,7 @@ class DataHandler:
         self.emissions_data = pd.DataFrame(columns=[
             'date', 'scope', 'category', 'activity', 'quantity', 
             'unit', 'emission_factor', 'emissions_kgCO2e', 'notes'
-        ])
+        ], index=pd.Index([], dtype='int64', name=ENTRY_ID)).astype({'date': 'datetime64[ns]'})
     
     def load_company_info(self):
         """Load company information from file."""
@@ -76,24 +269,50 @@ class DataHandler:
         }
     
     def save_emissions_data(self):
-        """Save emissions data to file."""
-        # Convert datetime objects to strings
-        data_to_save = self.emissions_data.copy()
-        if 'date' in data_to_save.columns:
-            data_to_save['date'] = data_to_save['date'].dt.strftime('%Y-%m-%d')
+        """
+        Rewrite the whole emissions ledger from memory.
         
-        with open(EMISSIONS_FILE, 'w') as f:
-            json.dump(data_to_save.to_dict('records'), f, indent=2)
+        Only needed after bulk edits to emissions_data; adding entries appends
+        to the journal instead.
+        """
+        self.store.rewrite(self.emissions_data)
+        self.cube.clear()
+        self.detector.clear()
+        self.dependents.clear()
+        self.data_version += 1
     
     def save_company_info(self):
         """Save company information to file."""
         with open(COMPANY_INFO_FILE, 'w') as f:
             json.dump(self.company_info, f, indent=2)
     
-    def add_emission_entry(self, date, scope, category, activity, quantity, unit, emission_factor, notes=""):
+    def check_anomalies(self, entries):
+        """
+        Score entries against the statistics of the stored ledger before they are saved.
+        
+        Args:
+            entries (pandas.DataFrame): Entries about to be added
+            
+        Returns:
+            pandas.DataFrame: anomaly, score and reason per entry (see anomaly.AnomalyDetector.score)
+        """
+        if self._pending:
+            self.flush()
+        if not self.detector.ready:
+            columns = ANOMALY_KEYS + ANOMALY_MEASURES
+            # Without loaded data only the scored columns are read, never the full ledger
+            data = self._query(columns=columns) if self._emissions_data is not None else self.store.read(columns=columns)
+            self.detector.rebuild(data)
+        return self.detector.score(entries)
+    
+    def add_emission_entry(self, date, scope, category, activity, quantity, unit, emission_factor, notes="", wait=True, allow_anomalies=False):
         """
         Add a new emission entry.
         
+        Entries are group-committed with other writes arriving at the same
+        time. When adding many entries in a loop, pass wait=False and call
+        flush() afterwards.
+        
         Args:
             date (datetime): Date of the emission
             scope (str): Emission scope (Scope 1, Scope 2, or Scope 3)
@@ -101,13 +320,46 @@ class DataHandler:
             activity (str): Specific activity
             quantity (float): Quantity of activity
             unit (str): Unit of measurement
-            emission_factor (float): Emission factor
+            emission_factor (float): Emission factor; None to look it up in the factor registry
             notes (str, optional): Additional notes
+            wait (bool, optional): Wait until the entry is durable
+            allow_anomalies (bool, optional): Save the entry even if its values look anomalous
             
         Returns:
-            bool: True if successful, False otherwise
+            bool: True if successful (or queued, with wait=False), False otherwise
         """
         try:
+            errors = validate(pd.DataFrame([{
+                'date': date, 'scope': scope, 'category': category, 'activity': activity,
+                'quantity': quantity, 'unit': unit, 'emission_factor': emission_factor
+            }]))
+            if len(errors):
+                print("Emission entry not added: " + "; ".join(f"{c} {e}" for c, e in zip(errors['column'], errors['error'])))
+                return False
+            
+            # Convert to the unit the activity's factor is registered in (e.g. MWh -> kWh)
+            converted, errors = self.factors.normalize_units(pd.DataFrame([{
+                'category': category, 'activity': activity, 'quantity': quantity, 'unit': unit,
+                'emission_factor': emission_factor
+            }]))
+            if errors[0]:
+                print(f"Emission entry not added, {unit} cannot be converted to the unit of the {category} / {activity} emission factor")
+                return False
+            quantity, unit = converted['quantity'].iloc[0], converted['unit'].iloc[0]
+            if emission_factor is not None:
+                emission_factor = converted['emission_factor'].iloc[0]
+            
+            factor_id = None
+            if emission_factor is None:
+                found = self.factors.resolve(category, activity, unit, year=pd.Timestamp(date).year)
+                if found is None and default_catalog().register(self.factors):
+                    # External factor datasets are only loaded once something is not built in
+                    found = self.factors.resolve(category, activity, unit, year=pd.Timestamp(date).year)
+                if found is None:
+                    print(f"No emission factor for {category} / {activity} ({unit})")
+                    return False
+                emission_factor, factor_id = found['factor'], found['factor_id']
+            
             # Calculate emissions
             emissions_kgCO2e = float(quantity) * float(emission_factor)
             
@@ -121,61 +373,337 @@ class DataHandler:
                 'unit': unit,
                 'emission_factor': float(emission_factor),
                 'emissions_kgCO2e': emissions_kgCO2e,
-                'notes': notes
+                'notes': notes,
+                'factor_id': factor_id
             }])
             
-            # Append to existing data
-            self.emissions_data = pd.concat([self.emissions_data, new_entry], ignore_index=True)
+            if not allow_anomalies:
+                flags = self.check_anomalies(new_entry)
+                if flags['anomaly'].any():
+                    print(f"Emission entry not added, it looks anomalous: {flags['reason'].iloc[0]}")
+                    return False
             
-            # Save data
-            self.save_emissions_data()
+            # Queue the entry for the next group commit
+            write = self.writer.submit(new_entry)
+            if wait:
+                self._append_loaded(write.wait())
+            else:
+                self._pending.append(write)
             
             return True
         except Exception as e:
             print(f"Error adding emission entry: {str(e)}")
             return False
     
-    def import_csv(self, file_path_or_buffer):
+    def delete_emission_entries(self, entry_ids):
         """
-        Import emissions data from CSV.
+        Delete emission entries.
         
         Args:
-            file_path_or_buffer: Path to CSV file or file-like object
+            entry_ids (list): Ids of the entries to delete
             
         Returns:
-            tuple: (success, message)
+            bool: True if successful, False otherwise
         """
         try:
-            # Read CSV
-            df = pd.read_csv(file_path_or_buffer)
-            
-            # Check required columns
-            required_columns = ['date', 'scope', 'category', 'activity', 'quantity', 'unit', 'emission_factor']
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            
-            if missing_columns:
-                return False, f"Missing required columns: {', '.join(missing_columns)}"
-            
-            # Convert date strings to datetime objects
-            df['date'] = pd.to_datetime(df['date'])
+            self.writer.submit_delete(entry_ids).wait()
+            if self._emissions_data is not None:
+                removed = self.emissions_data.index.intersection(entry_ids)
+                if self.cube.ready:
+                    self.cube.remove(self.emissions_data.loc[removed])
+                if self.detector.ready:
+                    self.detector.remove(self.emissions_data.loc[removed])
+                if self.dependents.ready:
+                    self.dependents.remove(self.emissions_data.loc[removed])
+                self.emissions_data = self.emissions_data.drop(index=removed)
+            else:
+                # Deleted values are unknown: rebuild the cube and statistics when next needed
+                self.cube.clear()
+                self.detector.clear()
+                self.dependents.clear()
+                self.data_version += 1
+            return True
+        except Exception as e:
+            print(f"Error deleting emission entries: {str(e)}")
+            return False
+    
+    def recalculate_emissions(self, factor_ids=None):
+        """
+        Restate stored entries after emission factors were added or revised.
+        
+        Only the entries priced by the changed factors, or by other factors
+        of the same category, activity and unit (which a new regional or
+        yearly factor may take over), are repriced, in one vectorized join.
+        The changed entries are replaced in a single batched commit: each is
+        deleted and stored again under a new entry id, so ids read before the
+        call (a selection about to be deleted, an export keyed by entry_id)
+        no longer name the restated entries. Read the data again afterwards.
+        
+        Args:
+            factor_ids (list, optional): factor_ids that changed; defaults to every factor
+                added or revised since the last recalculation
             
-            # Calculate emissions if not provided
-            if 'emissions_kgCO2e' not in df.columns:
-                df['emissions_kgCO2e'] = df['quantity'].astype(float) * df['emission_factor'].astype(float)
+        Returns:
+            pandas.DataFrame: Before/after delta per factor (see restatement.restate), or None on error
+        """
+        try:
+            version = self.factors.version
+            if factor_ids is None:
+                factor_ids = self.factors.changed_since(self._restated_version)
+            if not self.dependents.ready:
+                self.dependents.rebuild(self._query(columns=['factor_id']))
+            ids = self.dependents.entries(self.factors.related(factor_ids))
+            data = self.emissions_data
+            changed, summary = restate(data.loc[data.index.intersection(ids)], self.factors)
+            if len(changed):
+                stored = self.writer.submit_replace(changed, changed.index).wait()
+                old = data.loc[changed.index]
+                for maintained in (self.cube, self.detector, self.dependents):
+                    if maintained.ready:
+                        maintained.remove(old)
+                self.emissions_data = data.drop(index=changed.index)
+                self._append_loaded(stored)
+            self._restated_version = version
+            return summary
+        except Exception as e:
+            print(f"Error recalculating emissions: {str(e)}")
+            return None
+    
+    def set_gwp_basis(self, basis):
+        """
+        Switch the GWPs that convert gases to CO2e and restate the entries they priced.
+        
+        The basis is saved once the entries are restated, so the registry
+        starts from it after a restart (see factor_registry.load_gwp_basis).
+        If restating fails, the registry goes back to the previous basis.
+        
+        Args:
+            basis (str): "AR4", "AR5" or "AR6"
             
-            # Add notes column if not present
-            if 'notes' not in df.columns:
-                df['notes'] = ""
+        Returns:
+            pandas.DataFrame: Before/after delta per factor (see restatement.restate), or None on error
+        """
+        previous = self.factors.gwp_basis
+        try:
+            revised = self.factors.set_gwp_basis(basis)
+        except ValueError as e:
+            print(f"Error setting GWP basis: {str(e)}")
+            return None
+        summary = self.recalculate_emissions(revised)
+        if summary is None:
+            self.factors.set_gwp_basis(previous)
+            return None
+        try:
+            save_gwp_basis(basis)
+        except Exception as e:
+            print(f"Error saving GWP basis: {str(e)}")
+        return summary
+    
+    def emissions_by_gas(self, by=(), start_date=None, end_date=None, basis=None):
+        """
+        Sum emissions per gas.
+        
+        Entries priced by a factor known per gas are split into its gases;
+        all others are counted under the "CO2e" pseudo-gas.
+        
+        Args:
+            by (list, optional): Columns to group by
+            start_date (datetime, optional): Inclusive start date
+            end_date (datetime, optional): Inclusive end date
+            basis (str, optional): GWP basis of the kgCO2e column; defaults to the registry's
             
-            # Append to existing data
-            self.emissions_data = pd.concat([self.emissions_data, df], ignore_index=True)
+        Returns:
+            pandas.DataFrame: Group columns plus kg of every gas in GASES and kgCO2e, or None on error
+        """
+        try:
+            by = list(by)
+            data = self._query(start_date, end_date, columns=by + ['quantity', 'emissions_kgCO2e', 'factor_id'])
+            kg = gas_emissions(data, self.factors)
+            if by:
+                kg = pd.concat([data[by], kg], axis=1).groupby(by, dropna=False, sort=True)[GASES].sum().reset_index()
+            else:
+                kg = kg.sum().to_frame().T
+            kg['kgCO2e'] = kg[GASES].to_numpy(dtype=float) @ gwp_vector(basis or self.factors.gwp_basis)
+            return kg
+        except Exception as e:
+            print(f"Error summarizing emissions by gas: {str(e)}")
+            return None
+    
+    def import_csv(self, file_path_or_buffer, allow_anomalies=False, match_activities=False, chunk_rows=IMPORT_CHUNK_ROWS, progress=None):
+        """
+        Import emissions data from CSV.
+        
+        The file is streamed ``chunk_rows`` rows at a time: each chunk is
+        converted, priced and checked in vectorized form, then committed
+        while the next one is read, and added to the cube and statistics.
+        At most two chunks are in memory: a loaded ledger is dropped rather
+        than grown (the next access loads it again), and the anomaly
+        statistics read only their columns, so files larger than memory can
+        be imported. Nothing is imported if any row cannot be priced or
+        looks anomalous (unless allow_anomalies is set): chunks already
+        committed are deleted again, a chunk at a time.
+        
+        Args:
+            file_path_or_buffer: Path to CSV file or file-like object
+            allow_anomalies (bool, optional): Import rows whose values look anomalous too
+            match_activities (bool, optional): Replace categories and activities that have no
+                emission factor with their closest match (see matching.FactorMatcher)
+            chunk_rows (int, optional): Rows read and committed at a time
+            progress (callable, optional): Called as progress(bytes_read, total_bytes) after each chunk
             
-            # Save data
-            self.save_emissions_data()
+        Returns:
+            tuple: (success, message)
+        """
+        imported = []  # id ranges of the committed chunks, deleted again if a later chunk fails
+        write = None  # previous chunk, committed while this one is parsed and priced
+        try:
+            for df in iter_csv_chunks(file_path_or_buffer, chunk_rows, progress):
+                # Check required columns; emission_factor may be left out to use the factor registry
+                missing_columns = [col for col in IMPORT_COLUMNS if col not in df.columns]
+                
+                if missing_columns:
+                    return self._abort_import(imported, write, f"Missing required columns: {', '.join(missing_columns)}")
+                
+                # Check types, scopes, units, ranges and dates of the whole chunk at once
+                errors = validate(df)
+                if len(errors):
+                    return self._abort_import(imported, write, f"{errors['row'].nunique()} rows are invalid ({format_errors(errors)}).")
+                
+                # Convert date strings to datetime objects
+                df['date'] = pd.to_datetime(df['date'], format='mixed')
+                df['quantity'] = pd.to_numeric(df['quantity'])
+                
+                # Calculate emissions if not provided
+                if 'emission_factor' not in df.columns:
+                    df['emission_factor'] = float('nan')
+                if 'emissions_kgCO2e' not in df.columns:
+                    df['emissions_kgCO2e'] = df['quantity'].astype(float) * df['emission_factor'].astype(float)
+                
+                # Quantities in the factors' units, then rows without a factor priced from the registry
+                df, flags = price_chunk(df, self.factors, self.matcher if match_activities else None)
+                unit_errors = flags['unit_error'].to_numpy()
+                if unit_errors.any():
+                    examples = "; ".join(
+                        f"line {i + 2}: {row['category']} / {row['activity']} in {row['unit']}"
+                        for i, row in df[unit_errors].head(5).iterrows()
+                    )
+                    return self._abort_import(imported, write, f"Units of {int(unit_errors.sum())} rows cannot be converted to their emission factor's unit ({examples}).")
+                
+                unpriced = flags['unpriced'].to_numpy()
+                if unpriced.any():
+                    suggestions = self.matcher.best(df[unpriced].head(5))
+                    examples = "; ".join(
+                        f"line {i + 2}: {row['category']} / {row['activity']} ({row['unit']})"
+                        + ("" if pd.isna(suggestions.at[i, 'confidence']) else
+                           f", closest is {suggestions.at[i, 'category']} / {suggestions.at[i, 'activity']}")
+                        for i, row in df[unpriced].head(5).iterrows()
+                    )
+                    return self._abort_import(imported, write, f"No emission factor for {int(unpriced.sum())} rows ({examples}).")
+                
+                # Add notes column if not present
+                if 'notes' not in df.columns:
+                    df['notes'] = ""
+                
+                if not allow_anomalies:
+                    flags = self.check_anomalies(df)
+                    flagged = flags[flags['anomaly']]
+                    if len(flagged):
+                        # Line numbers in the file: header is line 1
+                        examples = "; ".join(f"line {i + 2}: {reason}" for i, reason in flagged['reason'].head(5).items())
+                        return self._abort_import(imported, write, f"{len(flagged)} rows look anomalous ({examples}). Correct them or import with allow_anomalies=True.")
+                
+                # Queue the chunk, then wait for the previous one and append it to the in-memory data
+                previous, write = write, self.writer.submit(df)
+                if previous is not None:
+                    self._settle_import(previous, imported)
+            
+            if write is not None:
+                write, last = None, write
+                self._settle_import(last, imported)
+            rows = sum(int((ranges[:, 1] - ranges[:, 0]).sum()) for ranges in imported)
+            return True, f"Successfully imported {rows} entries"
+        except Exception as e:
+            return self._abort_import(imported, write, f"Error importing CSV: {str(e)}")
+    
+    def _settle_import(self, write, imported):
+        """Wait for one imported chunk to be committed and add it to the cube and statistics."""
+        stored = write.wait()
+        if self._emissions_data is not None:
+            # Merging every chunk would grow the loaded ledger with the file
+            self._emissions_data = None
+            self._unmerged = []
+        self._append_loaded(stored)
+        imported.append(id_ranges(stored.index))
+    
+    def _abort_import(self, imported, write, message):
+        """Delete the chunks of a failed import that were already committed; returns (False, message)."""
+        if write is not None:
+            try:
+                self._settle_import(write, imported)
+            except Exception:
+                pass  # The chunk was not stored, so there is nothing to delete
+        # One chunk's ids at a time, so a rollback holds no more ids than a chunk has rows
+        removed = [self.delete_emission_entries(expand_ranges(ranges)) for ranges in reversed(imported)]
+        if not all(removed):
+            message += " Some rows were already imported and could not be removed."
+        return False, message
+    
+    def import_files(self, source, workers=INGEST_WORKERS, allow_anomalies=False, match_activities=False):
+        """
+        Import a batch of CSV and Excel files, such as the monthly files of every facility.
+        
+        Files are parsed, priced and validated in parallel worker processes
+        (see ingest.prepare_file), each pricing with a copy of this handler's
+        factor registry. Rows that cannot be imported are rejected per row
+        rather than failing their file; the accepted rows of all files are
+        then checked for anomalies together and stored in one commit.
+        
+        Args:
+            source (str): Directory or glob pattern, e.g. "exports/2025-*/*.csv"
+            workers (int, optional): Worker processes; 0 for one per CPU, 1 to work in this process
+            allow_anomalies (bool, optional): Import rows whose values look anomalous too
+            match_activities (bool, optional): Replace categories and activities that have no
+                emission factor with their closest match (see matching.FactorMatcher)
             
-            return True, f"Successfully imported {len(df)} entries"
+        Returns:
+            tuple: (success, message, report DataFrame with INGEST_REPORT_COLUMNS per file)
+        """
+        paths = ingest_paths(source)
+        if not paths:
+            return False, f"No files found in {source}", pd.DataFrame(columns=INGEST_REPORT_COLUMNS)
+        try:
+            results = prepare_files(paths, self.factors, workers, self.matcher if match_activities else None)
+            reports = [report for _, _, report in results]
+            frames = [df for df, _, _ in results if df is not None and len(df)]
+            owners = np.concatenate([np.full(len(df), i) for i, (df, _, _) in enumerate(results) if df is not None and len(df)] or [np.zeros(0, dtype=int)])
+            lines = np.concatenate([lines for _, lines, _ in results] or [np.zeros(0, dtype=np.int64)])
+            merged = pd.concat(frames, ignore_index=True) if frames else None
+            
+            if merged is not None and not allow_anomalies:
+                # Scored together, so that every file is judged against the same statistics
+                flags = self.check_anomalies(merged)
+                anomalous = flags['anomaly'].to_numpy()
+                for i in np.unique(owners[anomalous]):
+                    mine = anomalous & (owners == i)
+                    examples = "; ".join(f"line {line}: {reason}" for line, reason in zip(lines[mine][:REJECT_EXAMPLES], flags['reason'].to_numpy()[mine]))
+                    reports[i]["rejected"] += int(mine.sum())
+                    reports[i]["errors"] = "; ".join(e for e in (reports[i]["errors"], examples) if e)
+                merged, owners = merged[~anomalous], owners[~anomalous]
+            
+            if merged is not None and len(merged):
+                stored = self.writer.submit(merged).wait()
+                self._append_loaded(stored)
+                counts = np.bincount(owners, minlength=len(reports))
+                for report, count in zip(reports, counts):
+                    report["imported"] = int(count)
+            
+            report = pd.DataFrame(reports, columns=INGEST_REPORT_COLUMNS)
+            failed = int((report['imported'] == 0).sum())
+            message = (f"Imported {int(report['imported'].sum())} entries from {len(report) - failed} of {len(report)} files"
+                       f"; {int(report['rejected'].sum())} rows rejected")
+            return bool(report['imported'].sum()), message, report
         except Exception as e:
-            return False, f"Error importing CSV: {str(e)}"
+            return False, f"Error importing files: {str(e)}", pd.DataFrame(columns=INGEST_REPORT_COLUMNS)
     
     def export_csv(self, file_path=None, start_date=None, end_date=None):
         """
@@ -191,14 +719,11 @@ class DataHandler:
         """
         try:
             # Filter data by date range if specified
-            data = self.emissions_data.copy()
-            if start_date and end_date:
-                mask = (data['date'] >= pd.Timestamp(start_date)) & (data['date'] <= pd.Timestamp(end_date))
-                data = data.loc[mask]
+            data = self.get_filtered_data(start_date, end_date)
             
             # Convert datetime objects to strings
             if 'date' in data.columns:
-                data['date'] = data['date'].dt.strftime('%Y-%m-%d')
+                data = data.assign(date=data['date'].dt.strftime('%Y-%m-%d'))
             
             if file_path:
                 # Save to file
@@ -227,10 +752,7 @@ class DataHandler:
         """
         try:
             # Filter data by date range if specified
-            data = self.emissions_data.copy()
-            if start_date and end_date:
-                mask = (data['date'] >= pd.Timestamp(start_date)) & (data['date'] <= pd.Timestamp(end_date))
-                data = data.loc[mask]
+            data = self.get_filtered_data(start_date, end_date, columns=REPORT_COLUMNS)
             
             # Create PDF
             pdf = FPDF()
@@ -254,23 +776,27 @@ class DataHandler:
             pdf.cell(0, 10, "Summary", 0, 1)
             pdf.set_font("Arial", "", 12)
             
-            total_emissions = data['emissions_kgCO2e'].sum()
+            # Totals come from the cube; the period applies only when both ends are given
+            period = (start_date, end_date) if start_date and end_date else (None, None)
+            total_emissions = self.summarize([], *period)['emissions_kgCO2e'].iloc[0]
             pdf.cell(0, 10, f"Total Emissions: {total_emissions:.2f} kgCO2e", 0, 1)
             
             # Emissions by scope
-            scope_data = data.groupby('scope')['emissions_kgCO2e'].sum().reset_index()
+            scope_data = self.summarize(['scope'], *period)
             pdf.ln(5)
             pdf.cell(0, 10, "Emissions by Scope:", 0, 1)
             for _, row in scope_data.iterrows():
                 pdf.cell(0, 10, f"{row['scope']}: {row['emissions_kgCO2e']:.2f} kgCO2e ({row['emissions_kgCO2e'] / total_emissions * 100:.1f}%)", 0, 1)
             
             # Emissions by category
-            category_data = data.groupby('category')['emissions_kgCO2e'].sum().reset_index()
+            category_data = self.summarize(['category'], *period)
             pdf.ln(5)
             pdf.cell(0, 10, "Top Categories:", 0, 1)
             for _, row in category_data.nlargest(5, 'emissions_kgCO2e').iterrows():
                 pdf.cell(0, 10, f"{row['category']}: {row['emissions_kgCO2e']:.2f} kgCO2e ({row['emissions_kgCO2e'] / total_emissions * 100:.1f}%)", 0, 1)
             
+            write_trend_pdf(pdf, self.resample('monthly', (), *period))
+            
             # Data table
             pdf.ln(10)
             pdf.set_font("Arial", "B", 14)
@@ -309,6 +835,39 @@ class DataHandler:
             print(f"Error generating PDF report: {str(e)}")
             return False
     
+    def summarize(self, by, start_date=None, end_date=None, filters=None):
+        """
+        Sum emissions by groups.
+        
+        Answered from the cube when the period covers whole months and every
+        dimension is in the cube; otherwise from the matching rows.
+        
+        Args:
+            by (list): Columns to group by; "month" groups by YYYY-MM
+            start_date (datetime, optional): Inclusive start date
+            end_date (datetime, optional): Inclusive end date
+            filters (dict, optional): Column -> required value; None values are ignored
+            
+        Returns:
+            pandas.DataFrame: Group columns plus emissions_kgCO2e and an "entries" count
+        """
+        filters = {k: v for k, v in (filters or {}).items() if v is not None}
+        start = pd.Timestamp(start_date) if start_date else None
+        end = pd.Timestamp(end_date).normalize() if end_date else None
+        whole_months = (start is None or start == start.normalize().replace(day=1)) and \
+            (end is None or end == end + pd.offsets.MonthEnd(0))
+        if whole_months and set(by) | set(filters) <= set(CUBE_DIMENSIONS):
+            if self._pending:
+                self.flush()
+            if not self.cube.ready:
+                self.cube.rebuild(self._query(columns=CUBE_COLUMNS))
+            return self.cube.rollup(
+                by, filters,
+                start.strftime('%Y-%m') if start is not None else None,
+                end.strftime('%Y-%m') if end is not None else None,
+            )
+        return self.query(EmissionsQuery(start_date, end_date, filters, by).measure('emissions_kgCO2e'))
+    
     def get_emissions_summary(self):
         """
         Get emissions summary statistics.
@@ -316,7 +875,8 @@ class DataHandler:
         Returns:
             dict: Summary statistics
         """
-        if len(self.emissions_data) == 0:
+        totals = self.summarize([])
+        if totals['entries'].iloc[0] == 0:
             return {
                 "total_emissions": 0,
                 "scope_breakdown": {},
@@ -325,26 +885,21 @@ class DataHandler:
             }
         
         # Total emissions
-        total_emissions = self.emissions_data['emissions_kgCO2e'].sum()
+        total_emissions = totals['emissions_kgCO2e'].iloc[0]
         
         # Emissions by scope
-        scope_data = self.emissions_data.groupby('scope')['emissions_kgCO2e'].sum().to_dict()
+        scope_data = self.summarize(['scope']).set_index('scope')['emissions_kgCO2e'].to_dict()
         
         # Emissions by category
-        category_data = self.emissions_data.groupby('category')['emissions_kgCO2e'].sum().to_dict()
+        category_data = self.summarize(['category']).set_index('category')['emissions_kgCO2e'].to_dict()
         
         # Time series data (monthly)
-        time_data = self.emissions_data.copy()
-        if 'date' in time_data.columns and len(time_data) > 0:
-            time_data['month'] = time_data['date'].dt.strftime('%Y-%m')
-            time_series = time_data.groupby(['month', 'scope'])['emissions_kgCO2e'].sum().reset_index()
-            time_series_dict = {}
-            for _, row in time_series.iterrows():
-                if row['month'] not in time_series_dict:
-                    time_series_dict[row['month']] = {}
-                time_series_dict[row['month']][row['scope']] = row['emissions_kgCO2e']
-        else:
-            time_series_dict = {}
+        time_series = self.resample('monthly', ('scope',))
+        time_series = time_series[time_series['entries'] > 0]
+        time_series_dict = {
+            month: group.set_index('scope')['emissions_kgCO2e'].to_dict()
+            for month, group in time_series.groupby('label')
+        }
         
         return {
             "total_emissions": total_emissions,
@@ -353,7 +908,7 @@ class DataHandler:
             "time_series": time_series_dict
         }
     
-    def get_filtered_data(self, start_date=None, end_date=None, scope=None, category=None):
+    def get_filtered_data(self, start_date=None, end_date=None, scope=None, category=None, columns=None):
         """
         Get filtered emissions data.
         
@@ -362,21 +917,14 @@ class DataHandler:
             end_date (datetime, optional): End date for filtering
             scope (str, optional): Scope for filtering
             category (str, optional): Category for filtering
+            columns (list, optional): Columns to return; all if omitted
             
         Returns:
             pandas.DataFrame: Filtered data
         """
-        data = self.emissions_data.copy()
+        # Date range applies only when both ends are given
+        if not (start_date and end_date):
+            start_date = end_date = None
         
-        # Apply filters
-        if start_date and end_date:
-            mask = (data['date'] >= pd.Timestamp(start_date)) & (data['date'] <= pd.Timestamp(end_date))
-            data = data.loc[mask]
-        
-        if scope:
-            data = data[data['scope'] == scope]
-        
-        if category:
-            data = data[data['category'] == category]
-        
-        return data
+        query = EmissionsQuery(start_date, end_date, {'scope': scope, 'category': category}, columns=columns)
+        return self.query(query)
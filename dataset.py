@@ -0,0 +1,122 @@
+"""
+Shared emissions dataset for YourCarbonFootprint application.
+Holds one read-only copy of the ledger per process and keeps it current.
+"""
+
+import threading
+
+from change_feed import ChangeFeed
+from compact_frame import append_compact, compact_frame
+
+
+class SharedDataset:
+    """
+    Process-wide, read-only emissions dataset.
+
+    The ledger is loaded once in compact form and handed out as shallow views,
+    so sessions share one copy instead of each holding its own. The dataset
+    subscribes to a ChangeFeed: writes from other sessions and processes
+    arrive as inserted and deleted entries and are applied in place of a
+    reload; only a feed reset (compaction, rewrite) drops the data so the
+    next view() loads it again. Every view() polls the feed first, so a
+    session always sees writes made before it asked.
+
+    Views must be treated as read-only: sessions build new frames instead of
+    modifying them in place.
+    """
+
+    def __init__(self, store, notes=None, float32=None, feed=None, aggregates=None, detector=None):
+        """
+        Initialize the SharedDataset class.
+
+        Args:
+            store (EmissionsStore): Store to load from
+            notes (NotesStore, optional): Side store to keep current with new entries
+            float32 (bool, optional): Compact measures to float32; defaults to config.COMPACT_FLOAT32
+            feed (ChangeFeed, optional): Feed to follow; one is created if not given
+            aggregates (MaterializedAggregates, optional): Aggregates to keep in step with the data
+            detector (AnomalyDetector, optional): Anomaly statistics to keep in step with the data
+        """
+        self.store = store
+        self.notes = notes
+        self.float32 = float32
+        self.feed = feed or ChangeFeed(store)
+        self.aggregates = aggregates
+        self.detector = detector
+        self._frame = None
+        self._lock = threading.Lock()
+        self.feed.subscribe(self.apply, self._reset)
+
+    @property
+    def loaded(self):
+        """True once the ledger has been loaded."""
+        return self._frame is not None
+
+    def view(self, progress=None):
+        """
+        Return the current dataset, catching up with writes made elsewhere.
+
+        Args:
+            progress (callable, optional): Called as progress(done, total) if a full load is needed
+
+        Returns:
+            pandas.DataFrame: Compact emissions data indexed by entry_id
+        """
+        self.feed.poll()
+        with self._lock:
+            if self._frame is None:
+                self._reload(progress)
+            return self._frame.copy(deep=False)
+
+    def apply(self, inserted=None, deleted=None):
+        """
+        Apply inserted and deleted entries, from this process or the change feed.
+
+        Args:
+            inserted (pandas.DataFrame, optional): Stored entries indexed by entry_id
+            deleted (list, optional): Ids of deleted entries
+        """
+        with self._lock:
+            if self._frame is not None:
+                self._apply(inserted, deleted)
+
+    def _reset(self):
+        """Drop the data so the next view reloads it."""
+        with self._lock:
+            self._frame = None
+            for maintained in self._maintained():
+                maintained.clear()
+        if self.notes is not None:
+            self.notes.reset()
+
+    def _reload(self, progress=None):
+        """Load the full ledger (lock held)."""
+        # Writes racing the load are published by the feed afterwards, which
+        # is harmless because applying is idempotent
+        self._frame = compact_frame(self.store.load(progress=progress), self.float32)
+        for maintained in self._maintained():
+            maintained.rebuild(self._frame)
+
+    def _maintained(self):
+        """Aggregates and statistics kept in step with the data."""
+        return [m for m in (self.aggregates, self.detector) if m is not None]
+
+    def _apply(self, inserted=None, deleted=None):
+        """Apply inserts and deletes, skipping ids already applied (lock held)."""
+        frame = self._frame
+        if inserted is not None and len(inserted):
+            inserted = inserted[~inserted.index.isin(frame.index)]
+            if len(inserted):
+                frame = append_compact(frame, inserted, self.float32)
+                if self.notes is not None:
+                    self.notes.update(inserted)
+                for maintained in self._maintained():
+                    maintained.add(inserted)
+        if deleted:
+            removed = frame.index.intersection(deleted)
+            for maintained in self._maintained():
+                maintained.remove(frame.loc[removed])
+            frame = frame.drop(index=removed)
+            if self.notes is not None:
+                self.notes.remove(deleted)
+        self._frame = frame
@@ -1,8 +1,11 @@
 """
 Emission factors database for YourCarbonFootprint application.
 Based on DEFRA/IPCC datasets for common emission sources.
+Larger published tables can be dropped into config.FACTOR_DATASETS_DIR (see factor_datasets).
 """
 
+from factor_datasets import default_catalog
+
 # Emission factors by category (in kgCO2e per unit)
 EMISSION_FACTORS = {
     # Scope 1 - Direct emissions
@@ -19,10 +22,14 @@ EMISSION_FACTORS = {
         "CNG": {"factor": 2.53721, "unit": "kg"},
     },
     "Refrigerants": {
-        "R-410A": {"factor": 2088.0, "unit": "kg"},
-        "R-134a": {"factor": 1430.0, "unit": "kg"},
-        "R-404A": {"factor": 3922.0, "unit": "kg"},
-        "R-407C": {"factor": 1774.0, "unit": "kg"},
+        "R-410A": {"factor": 1923.5, "unit": "kg"},
+        "R-134a": {"factor": 1300.0, "unit": "kg"},
+        "R-404A": {"factor": 3942.8, "unit": "kg"},
+        "R-407C": {"factor": 1624.21, "unit": "kg"},
+    },
+    "Fugitive Emissions": {
+        "Natural Gas Leakage": {"factor": 25.21, "unit": "kg"},
+        "SF6 Leakage": {"factor": 23500.0, "unit": "kg"},
     },
     
     # Scope 2 - Indirect emissions from purchased energy
@@ -74,6 +81,75 @@ EMISSION_FACTORS = {
     },
 }
 
+# Factors by gas in kg of gas per unit (see gases.GASES); the kgCO2e factors above
+# are these weighted by AR5 GWPs. Activities not listed are only known in CO2e.
+GAS_FACTORS = {
+    ("Stationary Combustion", "Natural Gas"): {"CO2": 0.18279, "CH4": 9.812e-06, "N2O": 3.456e-07},
+    ("Stationary Combustion", "Diesel"): {"CO2": 2.66045, "CH4": 3.84e-05, "N2O": 9.94e-05},
+    ("Stationary Combustion", "LPG"): {"CO2": 1.55273, "CH4": 4.444e-05, "N2O": 5.282e-06},
+    ("Stationary Combustion", "Coal"): {"CO2": 2.37417, "CH4": 0.0004586, "N2O": 0.0001353},
+    ("Mobile Combustion", "Petrol/Gasoline"): {"CO2": 2.29226, "CH4": 0.0002894, "N2O": 5.503e-05},
+    ("Mobile Combustion", "Diesel"): {"CO2": 2.67469, "CH4": 9.663e-06, "N2O": 0.0001154},
+    ("Mobile Combustion", "LPG"): {"CO2": 1.55273, "CH4": 4.444e-05, "N2O": 5.282e-06},
+    ("Mobile Combustion", "CNG"): {"CO2": 2.53137, "CH4": 0.0001631, "N2O": 4.787e-06},
+    # Refrigerant blends by mass fraction of their components
+    ("Refrigerants", "R-410A"): {"HFC-32": 0.5, "HFC-125": 0.5},
+    ("Refrigerants", "R-134a"): {"HFC-134a": 1.0},
+    ("Refrigerants", "R-404A"): {"HFC-125": 0.44, "HFC-143a": 0.52, "HFC-134a": 0.04},
+    ("Refrigerants", "R-407C"): {"HFC-32": 0.23, "HFC-125": 0.25, "HFC-134a": 0.52},
+    ("Fugitive Emissions", "Natural Gas Leakage"): {"CH4": 0.9, "CO2": 0.01},
+    ("Fugitive Emissions", "SF6 Leakage"): {"SF6": 1.0},
+    ("Waste", "Landfill"): {"CH4": 0.01633},
+    ("Waste", "Composting"): {"CH4": 0.0002047, "N2O": 1.769e-05},
+    ("Waste", "Incineration"): {"CO2": 0.01048, "N2O": 2.132e-05},
+}
+
+# Other names used for activities in uploaded data, for fuzzy matching
+ACTIVITY_SYNONYMS = {
+    ("Stationary Combustion", "Natural Gas"): ["gas boiler", "natural gas heating", "pipeline gas", "methane"],
+    ("Stationary Combustion", "Diesel"): ["diesel genset", "diesel generator", "backup generator", "gas oil", "DG set"],
+    ("Stationary Combustion", "LPG"): ["propane", "butane", "cooking gas", "LPG cylinder"],
+    ("Stationary Combustion", "Coal"): ["coal boiler", "anthracite", "bituminous coal", "lignite"],
+    ("Mobile Combustion", "Petrol/Gasoline"): ["petrol", "gasoline", "fleet fuel petrol", "unleaded"],
+    ("Mobile Combustion", "Diesel"): ["fleet diesel", "truck diesel", "vehicle diesel", "DERV"],
+    ("Mobile Combustion", "LPG"): ["autogas", "vehicle LPG"],
+    ("Mobile Combustion", "CNG"): ["compressed natural gas", "CNG vehicle"],
+    ("Refrigerants", "R-410A"): ["R410A", "AC refrigerant leak"],
+    ("Refrigerants", "R-134a"): ["R134a", "HFC-134a", "chiller refrigerant"],
+    ("Refrigerants", "R-404A"): ["R404A", "cold storage refrigerant"],
+    ("Refrigerants", "R-407C"): ["R407C"],
+    ("Fugitive Emissions", "Natural Gas Leakage"): ["gas leak", "methane leak", "pipeline leakage"],
+    ("Fugitive Emissions", "SF6 Leakage"): ["SF6", "switchgear leakage", "sulphur hexafluoride"],
+    ("Electricity", "India Grid"): ["grid power India", "purchased electricity India", "mains power India"],
+    ("Electricity", "Indonesia Grid"): ["grid power Indonesia", "PLN electricity"],
+    ("Electricity", "Japan Grid"): ["grid power Japan", "purchased electricity Japan"],
+    ("Electricity", "Solar Power"): ["solar PPA", "rooftop solar", "photovoltaic"],
+    ("Electricity", "Wind Power"): ["wind PPA", "wind energy"],
+    ("Steam", "Purchased Steam"): ["district heating steam", "process steam"],
+    ("District Cooling", "District Cooling"): ["chilled water", "cooling service"],
+    ("Business Travel", "Short-haul Flight"): ["domestic flight", "short flight", "regional air travel"],
+    ("Business Travel", "Long-haul Flight"): ["international flight", "long flight", "intercontinental air travel"],
+    ("Business Travel", "Train"): ["rail travel", "intercity train"],
+    ("Business Travel", "Bus"): ["coach travel", "business bus"],
+    ("Business Travel", "Taxi"): ["cab", "ride hailing", "uber"],
+    ("Employee Commuting", "Car (Petrol/Gasoline)"): ["petrol car commute", "gasoline car"],
+    ("Employee Commuting", "Car (Diesel)"): ["diesel car commute", "diesel car"],
+    ("Employee Commuting", "Motorcycle"): ["motorbike", "scooter", "two wheeler"],
+    ("Employee Commuting", "Bus"): ["commuter bus", "public bus"],
+    ("Employee Commuting", "Train/Metro"): ["subway", "metro commute", "light rail"],
+    ("Waste", "Landfill"): ["general waste", "mixed waste to landfill", "municipal solid waste"],
+    ("Waste", "Recycling"): ["recycled waste", "dry mixed recycling"],
+    ("Waste", "Composting"): ["food waste compost", "organic waste"],
+    ("Waste", "Incineration"): ["waste to energy", "incinerated waste"],
+    ("Water", "Water Supply"): ["mains water", "potable water", "water consumption"],
+    ("Water", "Water Treatment"): ["wastewater", "sewage", "effluent treatment"],
+    ("Purchased Goods & Services", "Paper"): ["office paper", "printer paper", "cardboard"],
+    ("Purchased Goods & Services", "Plastic"): ["plastic packaging", "PET"],
+    ("Purchased Goods & Services", "Glass"): ["glass bottles", "glass packaging"],
+    ("Purchased Goods & Services", "Metal"): ["steel", "aluminium", "scrap metal"],
+    ("Purchased Goods & Services", "Food"): ["catering", "canteen food"],
+}
+
 # Scope categories
 SCOPE_CATEGORIES = {
     "Scope 1": [
@@ -112,6 +188,9 @@ def get_emission_factor(category, activity):
     """
     Get the emission factor for a specific activity within a category.
     
+    Built-in factors are checked first; external datasets are only loaded
+    when the activity is not built in.
+    
     Args:
         category (str): The emission category
         activity (str): The specific activity
@@ -121,7 +200,7 @@ def get_emission_factor(category, activity):
     """
     if category in EMISSION_FACTORS and activity in EMISSION_FACTORS[category]:
         return EMISSION_FACTORS[category][activity]
-    return None
+    return default_catalog().lookup(category, activity)
 
 # Get all activities for a category
 def get_activities(category):
@@ -134,9 +213,9 @@ def get_activities(category):
     Returns:
         list: List of activities for the category, or empty list if category not found
     """
-    if category in EMISSION_FACTORS:
-        return list(EMISSION_FACTORS[category].keys())
-    return []
+    activities = list(EMISSION_FACTORS.get(category, {}))
+    # Activities from external datasets follow the built-in ones
+    return activities + [a for a in default_catalog().activities(category) if a not in EMISSION_FACTORS.get(category, {})]
 
 # Get all categories for a scope
 def get_categories(scope):
@@ -149,9 +228,8 @@ def get_categories(scope):
     Returns:
         list: List of categories for the scope, or empty list if scope not found
     """
-    if scope in SCOPE_CATEGORIES:
-        return SCOPE_CATEGORIES[scope]
-    return []
+    categories = list(SCOPE_CATEGORIES.get(scope, []))
+    return categories + [c for c in default_catalog().categories(scope) if c not in categories]
 
 # Get unit for a specific activity
 def get_unit(category, activity):
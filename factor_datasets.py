@@ -0,0 +1,429 @@
+"""
+External emission factor datasets for YourCarbonFootprint application.
+Loads DEFRA, IPCC, EPA or EEIO factor tables from CSV or Parquet into compact
+arrays on first use, and caches the parsed form on disk.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from config import FACTOR_DATASETS_DIR
+
+# Columns of a factor dataset; factor may also be called emission_factor
+DATASET_REQUIRED = ["category", "activity", "factor", "unit"]
+DATASET_TEXT_COLUMNS = ["category", "activity", "unit", "region", "source", "scope"]
+DATASET_SUFFIXES = (".csv", ".parquet")
+CACHE_DIR_NAME = ".cache"  # parsed datasets, inside the datasets directory
+CACHE_FORMAT = 1  # bumped when the cached layout changes
+
+
+class FactorTable:
+    """
+    One factor dataset as arrays.
+
+    Every text column is interned: each distinct string is stored once in a
+    pool and rows hold int32 codes into it (-1 for missing). Factors are one
+    float64 array and years one int32 array (0 for any year). Rows are sorted
+    by category and activity, and each category maps to its slice of rows, so
+    listing the activities of a category or looking one up never scans the
+    table.
+    """
+
+    def __init__(self, codes, pools, factor, year, name=""):
+        """
+        Initialize the FactorTable class.
+
+        Args:
+            codes (dict): Text column -> int32 codes, rows sorted by category then activity
+            pools (dict): Text column -> numpy array of its distinct strings
+            factor (numpy.ndarray): kgCO2e per unit
+            year (numpy.ndarray): First year each factor applies to, 0 for all years
+            name (str, optional): Dataset name
+        """
+        self.codes = codes
+        self.pools = pools
+        self.factor = factor
+        self.year = year
+        self.name = name
+        category = codes["category"]
+        bounds = np.flatnonzero(np.r_[True, category[1:] != category[:-1], True]) if len(category) else np.array([0])
+        self._rows = {
+            str(pools["category"][category[start]]): (int(start), int(end))
+            for start, end in zip(bounds[:-1], bounds[1:]) if category[start] >= 0
+        }
+        self._activities = {}
+        self._positions = {}
+
+    def __len__(self):
+        return len(self.factor)
+
+    @classmethod
+    def from_frame(cls, df, name=""):
+        """
+        Build a table from a DataFrame of factors.
+
+        Args:
+            df (pandas.DataFrame): Columns category, activity, factor (or emission_factor)
+                and unit; region, year, source and scope are optional
+            name (str, optional): Dataset name
+
+        Returns:
+            FactorTable: Compact table
+
+        Raises:
+            ValueError: If required columns are missing
+        """
+        if "factor" not in df.columns and "emission_factor" in df.columns:
+            df = df.rename(columns={"emission_factor": "factor"})
+        missing = [c for c in DATASET_REQUIRED if c not in df.columns]
+        if missing:
+            raise ValueError(f"Factor dataset {name!r} is missing columns: {', '.join(missing)}")
+        df = df[df["category"].notna() & df["activity"].notna()]
+        df = df.sort_values(["category", "activity"], kind="stable")
+        codes, pools = {}, {}
+        for col in DATASET_TEXT_COLUMNS:
+            if col in df.columns:
+                col_codes, uniques = pd.factorize(df[col].astype(str).where(df[col].notna()))
+                codes[col] = col_codes.astype(np.int32)
+                pools[col] = np.asarray(uniques, dtype=str)
+            else:
+                codes[col] = np.full(len(df), -1, dtype=np.int32)
+                pools[col] = np.zeros(0, dtype=str)
+        factor = pd.to_numeric(df["factor"], errors="coerce").to_numpy(dtype=np.float64)
+        year = pd.to_numeric(df["year"], errors="coerce").fillna(0).to_numpy(dtype=np.int32) if "year" in df.columns else np.zeros(len(df), dtype=np.int32)
+        return cls(codes, pools, factor, year, name)
+
+    @classmethod
+    def load(cls, path, name=""):
+        """
+        Read a table saved with save().
+
+        Args:
+            path (str): .npz file
+            name (str, optional): Dataset name
+
+        Returns:
+            FactorTable: The table
+        """
+        with np.load(path, allow_pickle=False) as data:
+            codes = {col: data[f"codes_{col}"] for col in DATASET_TEXT_COLUMNS}
+            pools = {col: data[f"pool_{col}"] for col in DATASET_TEXT_COLUMNS}
+            return cls(codes, pools, data["factor"], data["year"], name)
+
+    def save(self, path):
+        """
+        Write the table to an .npz file atomically.
+
+        Args:
+            path (str): Destination
+        """
+        arrays = {"factor": self.factor, "year": self.year}
+        for col in DATASET_TEXT_COLUMNS:
+            arrays[f"codes_{col}"] = self.codes[col]
+            arrays[f"pool_{col}"] = self.pools[col]
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _code(self, col, value):
+        """Code of a string in a column's pool, -2 if absent; pools are indexed on first use."""
+        if col not in self._positions:
+            self._positions[col] = {str(v): i for i, v in enumerate(self.pools[col])}
+        return self._positions[col].get(value, -2)
+
+    def _text(self, col, row):
+        """Decoded value of a text column in one row, None if missing."""
+        code = self.codes[col][row]
+        return None if code < 0 else str(self.pools[col][code])
+
+    def categories(self, scope=None):
+        """
+        Categories in the dataset.
+
+        Args:
+            scope (str, optional): Only categories with rows for this scope
+
+        Returns:
+            list: Category names, sorted
+        """
+        if scope is None:
+            return list(self._rows)
+        rows = self.codes["scope"] == self._code("scope", scope)
+        return sorted({str(c) for c in self.pools["category"][np.unique(self.codes["category"][rows])]})
+
+    def activities(self, category):
+        """
+        Activities of a category.
+
+        Args:
+            category (str): Category name
+
+        Returns:
+            list: Activity names, sorted; empty if the category is not in the dataset
+        """
+        if category not in self._activities:
+            start, end = self._rows.get(category, (0, 0))
+            codes = np.unique(self.codes["activity"][start:end])
+            self._activities[category] = sorted(str(a) for a in self.pools["activity"][codes[codes >= 0]])
+        return self._activities[category]
+
+    def lookup(self, category, activity, region=None, year=None):
+        """
+        Factor of one activity.
+
+        Args:
+            category (str): Category name
+            activity (str): Activity name
+            region (str, optional): Prefer this region's factor over a global one
+            year (int, optional): Latest factor up to this year; the latest overall if omitted
+
+        Returns:
+            dict: factor, unit, region, year and source, or None if not found
+        """
+        start, end = self._rows.get(category, (0, 0))
+        rows = np.arange(start, end)[self.codes["activity"][start:end] == self._code("activity", activity)]
+        if year is not None:
+            rows = rows[self.year[rows] <= int(year)]
+        regions = self.codes["region"][rows]
+        place = self._code("region", region) if region is not None else -2
+        for candidates in (rows[regions == place], rows[regions == -1], rows):
+            if len(candidates):
+                row = candidates[np.argmax(self.year[candidates])]
+                return {
+                    "factor": float(self.factor[row]),
+                    "unit": self._text("unit", row),
+                    "region": self._text("region", row),
+                    "year": int(self.year[row]) or None,
+                    "source": self._text("source", row) or self.name,
+                }
+        return None
+
+    def frame(self):
+        """
+        Decode the table, e.g. to register it with a FactorRegistry.
+
+        Returns:
+            pandas.DataFrame: category, activity, factor, unit, region, year, source and scope
+        """
+        data = {}
+        for col in DATASET_TEXT_COLUMNS:
+            pool = np.append(self.pools[col].astype(object), None)
+            data[col] = pool[self.codes[col]]
+        data["factor"] = self.factor
+        data["year"] = np.where(self.year > 0, self.year, None)
+        frame = pd.DataFrame(data)
+        frame["source"] = frame["source"].fillna(self.name)
+        return frame[["category", "activity", "factor", "unit", "region", "year", "source", "scope"]]
+
+
+def _cache_path(path, cache_dir):
+    """Cache file of a dataset file, named after its path, size and modification time."""
+    stat = os.stat(path)
+    digest = hashlib.sha1(f"{CACHE_FORMAT}|{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode()).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{stem}-{digest}.npz")
+
+
+def load_dataset(path, cache_dir=None, name=None):
+    """
+    Load a factor dataset, from the disk cache when the file has not changed.
+
+    Args:
+        path (str): CSV or Parquet file
+        cache_dir (str, optional): Where parsed tables are cached; None to not cache
+        name (str, optional): Dataset name; defaults to the file name without suffix
+
+    Returns:
+        FactorTable: The dataset
+
+    Raises:
+        ValueError: If the file is not CSV or Parquet or lacks required columns
+    """
+    name = name or os.path.splitext(os.path.basename(path))[0]
+    cached = _cache_path(path, cache_dir) if cache_dir else None
+    if cached and os.path.exists(cached):
+        try:
+            return FactorTable.load(cached, name)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable factor cache {cached}: {str(e)}")
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == ".csv":
+        df = pd.read_csv(path)
+    elif suffix == ".parquet":
+        df = pd.read_parquet(path)
+    else:
+        raise ValueError(f"Unsupported factor dataset format: {path}")
+    table = FactorTable.from_frame(df, name)
+    if cached:
+        # Older caches of the same file are stale
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if os.path.isdir(cache_dir):
+            for old in os.listdir(cache_dir):
+                if old.startswith(f"{stem}-") and old.endswith(".npz") and len(old) == len(stem) + 21:
+                    os.remove(os.path.join(cache_dir, old))
+        try:
+            table.save(cached)
+        except OSError as e:
+            print(f"Could not cache factor dataset {name}: {str(e)}")
+    return table
+
+
+class FactorCatalog:
+    """
+    The factor datasets in a directory, each parsed on first use.
+
+    Listing the directory is all creating the catalog costs; a dataset is
+    read (from its disk cache when possible) the first time a lookup needs
+    it, and kept in memory afterwards.
+    """
+
+    def __init__(self, directory=FACTOR_DATASETS_DIR):
+        """
+        Initialize the FactorCatalog class.
+
+        Args:
+            directory (str, optional): Directory holding .csv and .parquet datasets
+        """
+        self.directory = directory
+        self.cache_dir = os.path.join(directory, CACHE_DIR_NAME)
+        self._lock = threading.Lock()
+        self._paths = None
+        self._tables = {}
+        self._registered = set()  # (id of registry, dataset name)
+
+    def names(self):
+        """
+        Datasets available, without loading any.
+
+        Returns:
+            list: Dataset names, sorted
+        """
+        with self._lock:
+            if self._paths is None:
+                files = sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else []
+                self._paths = {
+                    os.path.splitext(f)[0]: os.path.join(self.directory, f)
+                    for f in files if f.lower().endswith(DATASET_SUFFIXES)
+                }
+            return sorted(self._paths)
+
+    def table(self, name):
+        """
+        One dataset, loaded on first access.
+
+        Args:
+            name (str): Dataset name (file name without suffix)
+
+        Returns:
+            FactorTable: The dataset, or None if there is no such dataset or it cannot be read
+        """
+        if name not in self.names():
+            return None
+        with self._lock:
+            if name not in self._tables:
+                try:
+                    self._tables[name] = load_dataset(self._paths[name], self.cache_dir, name)
+                except Exception as e:
+                    print(f"Error loading factor dataset {name}: {str(e)}")
+                    self._tables[name] = None
+            return self._tables[name]
+
+    def tables(self):
+        """Every dataset that could be loaded."""
+        return [t for t in (self.table(n) for n in self.names()) if t is not None]
+
+    def refresh(self):
+        """Forget the directory listing and loaded datasets, e.g. after adding a file."""
+        with self._lock:
+            self._paths = None
+            self._tables = {}
+            self._registered = set()
+
+    def categories(self, scope=None):
+        """
+        Categories across all datasets.
+
+        Args:
+            scope (str, optional): Only categories with rows for this scope
+
+        Returns:
+            list: Category names, sorted
+        """
+        return sorted({c for t in self.tables() for c in t.categories(scope)})
+
+    def activities(self, category):
+        """
+        Activities of a category across all datasets.
+
+        Args:
+            category (str): Category name
+
+        Returns:
+            list: Activity names, sorted
+        """
+        return sorted({a for t in self.tables() for a in t.activities(category)})
+
+    def lookup(self, category, activity, region=None, year=None):
+        """
+        Factor of one activity from the first dataset (by name) that has it.
+
+        Returns:
+            dict: As FactorTable.lookup, or None if no dataset has the activity
+        """
+        for t in self.tables():
+            found = t.lookup(category, activity, region, year)
+            if found is not None:
+                return found
+        return None
+
+    def register(self, registry, names=None):
+        """
+        Register datasets with a FactorRegistry, each at most once.
+
+        Args:
+            registry (FactorRegistry): Registry to add the factors to
+            names (list, optional): Datasets to register; defaults to all
+
+        Returns:
+            int: Number of factors registered by this call
+        """
+        count = 0
+        for name in names or self.names():
+            if (id(registry), name) in self._registered:
+                continue
+            table = self.table(name)
+            if table is not None:
+                count += registry.register_frame(table.frame())
+            self._registered.add((id(registry), name))
+        return count
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_catalog():
+    """
+    Return the process-wide catalog of config.FACTOR_DATASETS_DIR.
+
+    Returns:
+        FactorCatalog: Shared catalog; nothing is read until a lookup needs it
+    """
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = FactorCatalog()
+        return _default
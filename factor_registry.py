@@ -0,0 +1,490 @@
+"""
+Emission factor registry for YourCarbonFootprint application.
+Indexes factors by category, activity, unit, region, year and source, and prices whole tables at once.
+"""
+
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+
+from config import GWP_BASIS, GWP_BASIS_FILE
+from emission_factors import EMISSION_FACTORS, GAS_FACTORS
+from gases import GASES, gas_vector, gwp_vector
+from storage import atomic_write_json
+from units import conversion_ratios, dimension, normalize_unit
+
+# Fields identifying one factor
+FACTOR_KEY = ["category", "activity", "unit", "region", "year", "source"]
+DEFAULT_SOURCE = "DEFRA/IPCC"
+# Year used for entries without a date: the latest factor applies
+_LATEST_YEAR = 9999
+_YEAR_SPAN = 10000  # packs (factor group, year) into one sortable integer
+
+
+def factor_id(category, activity, unit, region=None, year=None, source=DEFAULT_SOURCE):
+    """
+    Stable identifier of a factor key, stored on the entries it priced.
+
+    Returns:
+        str: The key fields joined by "|", empty for global region or any year
+    """
+    parts = [category, activity, unit, region, year, source]
+    return "|".join("" if p is None else str(p) for p in parts)
+
+
+def _distinct(columns):
+    """
+    Distinct combinations of aligned columns.
+
+    Args:
+        columns (list): pandas.Series of equal length
+
+    Returns:
+        tuple: (position of each row's combination, list of combination tuples
+            with missing values as None)
+    """
+    codes = np.zeros(len(columns[0]), dtype=np.int64)
+    for col in columns:
+        col_codes, uniques = pd.factorize(col)
+        codes = pd.factorize(codes * (len(uniques) + 1) + col_codes + 1)[0]
+    first = np.unique(codes, return_index=True)[1]
+    combos = [
+        tuple(None if pd.isna(k) else str(k) for k in combo)
+        for combo in zip(*(col.iloc[first].tolist() for col in columns))
+    ]
+    return codes, combos
+
+
+class FactorRegistry:
+    """
+    Emission factors keyed by (category, activity, unit, region, year, source).
+
+    Region None is a global factor and year None applies from the first year;
+    otherwise a factor applies from its year until a later one is registered.
+    Exact lookups are one dict access. resolve() and apply() pick, for an
+    entry's region and year, the regional factor of the latest year up to the
+    entry's year, falling back to the global one; when several sources cover
+    the same key the most recently registered wins unless a source is asked for.
+
+    Registering a new value for an existing key is a revision: the key (and so
+    its factor_id) stays, and its revision number goes up.
+
+    A factor may be given per gas instead; its kgCO2e value is then the gas
+    vector weighted by the GWPs of the registry's basis, and switching the
+    basis revises all of them with one matrix product.
+    """
+
+    def __init__(self, gwp_basis=None):
+        """
+        Initialize the FactorRegistry class.
+
+        Args:
+            gwp_basis (str, optional): GWP basis of gas factors; defaults to config.GWP_BASIS
+        """
+        self._lock = threading.Lock()
+        self.gwp_basis = gwp_basis or GWP_BASIS
+        self._gwp = gwp_vector(self.gwp_basis)
+        self._factors = {}  # key tuple -> {"factor", "revision", "seq", "gases"}
+        self._years = {}  # (category, activity, unit, region) -> sorted [(year, seq, key)]
+        self._seq = 0
+        self.version = 0  # bumped on every registration
+        self._changed = {}  # key tuple -> version of its last new or revised value
+        self._table = None
+        self._table_version = None
+        self._profiles = None
+        self._profiles_version = None
+
+    def register(self, category, activity, factor, unit, region=None, year=None, source=DEFAULT_SOURCE, gases=None):
+        """
+        Add or revise a factor.
+
+        Args:
+            category (str): Emission category
+            activity (str): Specific activity
+            factor (float): kgCO2e per unit
+            unit (str): Unit the factor is per
+            region (str, optional): Country or region; None for a global factor
+            year (int, optional): First year the factor applies to; None for all years
+            source (str, optional): Publisher and edition, e.g. "DEFRA 2024"
+            gases (dict, optional): Gas -> kg of gas per unit (see gases.GASES); when given,
+                factor is ignored and derived from the registry's GWP basis
+
+        Returns:
+            str: factor_id of the key
+        """
+        key = (category, activity, unit, region, None if year is None else int(year), source)
+        vector = None if gases is None else gas_vector(gases)
+        with self._lock:
+            if vector is not None:
+                factor = float(vector @ self._gwp)
+            touched = self._register(key, factor, vector)
+            if touched:
+                self._years[touched].sort(key=lambda e: e[:2])
+        return factor_id(*key)
+
+    def _register(self, key, factor, gases=None):
+        """Add or revise one factor (lock held); returns the year list left to sort, if any."""
+        self._seq += 1
+        self.version += 1
+        current = self._factors.get(key)
+        if current is None:
+            self._factors[key] = {"factor": float(factor), "revision": 1, "seq": self._seq, "gases": gases}
+            self._years.setdefault(key[:4], []).append((key[4] or 0, self._seq, key))
+            self._changed[key] = self.version
+            return key[:4]
+        same_gases = (gases is None) == (current["gases"] is None) and (gases is None or np.array_equal(gases, current["gases"]))
+        if current["factor"] != float(factor) or not same_gases:
+            current.update(factor=float(factor), revision=current["revision"] + 1, gases=gases)
+            self._changed[key] = self.version
+        return None
+
+    def gas_profiles(self):
+        """
+        Gas vectors of the factors registered per gas.
+
+        Returns:
+            pandas.DataFrame: Indexed by factor_id, one column of kg per unit for each gas
+                in GASES; cached until the next registration
+        """
+        with self._lock:
+            if self._profiles_version != self.version:
+                keys = [key for key, f in self._factors.items() if f["gases"] is not None]
+                vectors = [self._factors[key]["gases"] for key in keys]
+                self._profiles = pd.DataFrame(
+                    np.array(vectors).reshape(len(keys), len(GASES)),
+                    index=pd.Index([factor_id(*key) for key in keys], name="factor_id"), columns=GASES
+                )
+                self._profiles_version = self.version
+            return self._profiles
+
+    def set_gwp_basis(self, basis):
+        """
+        Restate every gas factor under another set of GWPs.
+
+        All kgCO2e values are recomputed in one (factors x gases) @ (gases)
+        product; the factors whose value changes are revised.
+
+        Args:
+            basis (str): "AR4", "AR5" or "AR6"
+
+        Returns:
+            list: factor_ids of the revised factors
+        """
+        gwp = gwp_vector(basis)
+        with self._lock:
+            keys = [key for key, f in self._factors.items() if f["gases"] is not None]
+            factors = np.array([self._factors[key]["gases"] for key in keys]).reshape(len(keys), len(GASES)) @ gwp
+            self.gwp_basis, self._gwp = basis, gwp
+            revised = []
+            for key, factor in zip(keys, factors):
+                if self._factors[key]["factor"] != float(factor):
+                    self._register(key, factor, self._factors[key]["gases"])
+                    revised.append(factor_id(*key))
+            return revised
+
+    def register_frame(self, df):
+        """
+        Register every row of a table of factors.
+
+        Rows are registered under one lock, and each year list is sorted once
+        at the end, so tens of thousands of rows take well under a second.
+
+        Args:
+            df (pandas.DataFrame): Columns category, activity, factor and unit; region,
+                year and source are optional
+
+        Returns:
+            int: Number of rows registered
+        """
+        data = df.assign(**{c: None for c in ("region", "year") if c not in df.columns})
+        if "source" not in data.columns:
+            data = data.assign(source=DEFAULT_SOURCE)
+        data = data[["category", "activity", "factor", "unit", "region", "year", "source"]]
+        data = data.astype(object).where(data.notna(), None)
+        touched = set()
+        with self._lock:
+            for category, activity, factor, unit, region, year, source in data.itertuples(index=False, name=None):
+                key = (category, activity, unit, region, None if year is None else int(year), source)
+                touched.add(self._register(key, factor))
+            touched.discard(None)
+            for group in touched:
+                self._years[group].sort(key=lambda e: e[:2])
+        return len(data)
+
+    def get(self, category, activity, unit, region=None, year=None, source=DEFAULT_SOURCE):
+        """
+        Exact lookup.
+
+        Returns:
+            dict: factor, unit, factor_id and revision, or None if the key is not registered
+        """
+        key = (category, activity, unit, region, year, source)
+        factor = self._factors.get(key)
+        if factor is None:
+            return None
+        return {"factor": factor["factor"], "unit": unit, "factor_id": factor_id(*key), "revision": factor["revision"]}
+
+    def resolve(self, category, activity, unit, region=None, year=None, source=None):
+        """
+        Find the factor that applies to one entry.
+
+        Args:
+            category (str): Emission category
+            activity (str): Specific activity
+            unit (str): Unit of the entry's quantity
+            region (str, optional): Entry's country or region
+            year (int, optional): Entry's year; the latest factor if omitted
+            source (str, optional): Only consider this source
+
+        Returns:
+            dict: As get(), or None if no factor applies
+        """
+        year = _LATEST_YEAR if year is None else int(year)
+        with self._lock:
+            for place in ([region, None] if region is not None else [None]):
+                candidates = [
+                    e for e in self._years.get((category, activity, unit, place), [])
+                    if e[0] <= year and (source is None or e[2][5] == source)
+                ]
+                if candidates:
+                    key = max(candidates, key=lambda e: (e[0], e[1]))[2]
+                    return self.get(*key)
+        return None
+
+    def changed_since(self, version):
+        """
+        Factors added or revised after a registry version.
+
+        Args:
+            version (int): Earlier value of self.version
+
+        Returns:
+            list: factor_ids
+        """
+        with self._lock:
+            return [factor_id(*key) for key, changed in self._changed.items() if changed > version]
+
+    def related(self, factor_ids):
+        """
+        Every factor that can price the same entries as some factors.
+
+        A new factor for a region or year takes entries over from the other
+        factors of its category, activity and unit, so restating after a change
+        concerns all of them.
+
+        Args:
+            factor_ids (iterable): factor_ids
+
+        Returns:
+            set: factor_ids sharing category, activity and unit with any of them
+        """
+        with self._lock:
+            groups = {}
+            for key in self._factors:
+                groups.setdefault(key[:3], []).append(factor_id(*key))
+            wanted = set(factor_ids)
+            return {
+                fid for ids in groups.values() if wanted.intersection(ids) for fid in ids
+            }
+
+    def table(self):
+        """
+        Return every registered factor.
+
+        Returns:
+            pandas.DataFrame: FACTOR_KEY columns plus factor, factor_id, revision and seq
+                (registration order); cached until the next registration
+        """
+        with self._lock:
+            if self._table_version != self.version:
+                rows = [key + (f["factor"], factor_id(*key), f["revision"], f["seq"]) for key, f in self._factors.items()]
+                self._table = pd.DataFrame(rows, columns=FACTOR_KEY + ["factor", "factor_id", "revision", "seq"])
+                self._table_version = self.version
+            return self._table
+
+    def normalize_units(self, df):
+        """
+        Convert entries to the unit their factor is registered in.
+
+        Each distinct (category, activity, unit) is matched once to a registered
+        unit of the same dimension (e.g. MWh entries to a kWh factor), then the
+        quantity, unit and any emission_factor columns are converted in one
+        vectorized pass, leaving emissions unchanged. Entries whose activity has
+        no factor only get their unit spelling normalized ("litre" -> "liter").
+
+        Args:
+            df (pandas.DataFrame): Entries with category, activity, quantity and unit
+
+        Returns:
+            tuple: (converted copy of df, boolean error mask of entries whose unit cannot
+                be converted to a registered unit while they have no emission_factor of
+                their own; those entries are left unchanged)
+        """
+        result = df.copy()
+        if not len(result):
+            return result, np.zeros(0, dtype=bool)
+        factors = self.table()
+        registered = {}
+        for category, activity, unit in factors[["category", "activity", "unit"]].drop_duplicates().itertuples(index=False):
+            registered.setdefault((category, activity), []).append(unit)
+
+        codes, combos = _distinct([result["category"], result["activity"], result["unit"]])
+        targets = []
+        for category, activity, unit in combos:
+            units = registered.get((category, activity))
+            if not units:
+                targets.append(normalize_unit(unit) or unit)
+            elif unit in units:
+                targets.append(unit)
+            else:
+                same = [u for u in units if dimension(u) is not None and dimension(u) == dimension(unit)]
+                targets.append(same[0] if same else units[0])
+        targets = pd.Series(np.array(targets + [None], dtype=object)[codes], index=result.index)
+
+        ratios, errors = conversion_ratios(result["unit"], targets)
+        if "emission_factor" in result.columns:
+            # Entries priced by the user stay in their own unit when it cannot be converted
+            own = pd.to_numeric(result["emission_factor"], errors="coerce").notna().to_numpy()
+            errors &= ~own
+        convert = ~np.isnan(ratios)
+        scale = np.where(convert, ratios, 1.0)
+        result["quantity"] = pd.to_numeric(result["quantity"], errors="coerce").to_numpy(dtype=float) * scale
+        if "emission_factor" in result.columns:
+            result["emission_factor"] = pd.to_numeric(result["emission_factor"], errors="coerce").to_numpy(dtype=float) / scale
+        result["unit"] = np.where(convert, targets.to_numpy(dtype=object), result["unit"].to_numpy(dtype=object))
+        return result, errors
+
+    def apply(self, df, region_column="country", source=None, overwrite=True):
+        """
+        Attach factors to a whole table of entries in one vectorized join.
+
+        Entries are matched on category, activity and unit, then on region
+        (the region_column value, or the global factor) and the latest factor
+        year up to the entry's year, as resolve() does per entry.
+
+        Args:
+            df (pandas.DataFrame): Entries with category, activity, unit, quantity and
+                optionally date and the region column
+            region_column (str, optional): Column holding each entry's region
+            source (str, optional): Only use factors from this source
+            overwrite (bool, optional): Re-price entries that already have an emission_factor;
+                otherwise only entries without one are priced
+
+        Returns:
+            pandas.DataFrame: Copy of df with emission_factor, emissions_kgCO2e and factor_id
+                set on the priced entries; factor_id is missing where no factor applies
+        """
+        result = df.copy()
+        if "factor_id" not in result.columns:
+            result["factor_id"] = None
+        factors = self.table()
+        if source is not None:
+            factors = factors[factors["source"] == source]
+        if not len(result) or not len(factors):
+            return result
+        todo = np.ones(len(result), dtype=bool)
+        if not overwrite and "emission_factor" in result.columns:
+            todo = pd.to_numeric(result["emission_factor"], errors="coerce").isna().to_numpy()
+
+        # Factors grouped by (category, activity, unit, region); within a group
+        # one per year, the most recently registered source winning
+        factors = factors.assign(year=factors["year"].fillna(0).astype(int)).sort_values("seq")
+        factors = factors.drop_duplicates(["category", "activity", "unit", "region", "year"], keep="last")
+        groups = {}
+        group = np.array([groups.setdefault(key[:3] + (None if pd.isna(key[3]) else key[3],), len(groups)) for key in zip(
+            factors["category"], factors["activity"], factors["unit"], factors["region"]
+        )], dtype=np.int64)
+        # One sorted array of group * _YEAR_SPAN + year, searched for every entry at once
+        positions = np.argsort(group * _YEAR_SPAN + factors["year"].to_numpy(), kind="stable")
+        slots = (group * _YEAR_SPAN + factors["year"].to_numpy())[positions]
+        values = factors["factor"].to_numpy(dtype=float)[positions]
+        ids = factors["factor_id"].to_numpy(dtype=object)[positions]
+
+        # Entry keys are factorized so only the distinct combinations are looked up
+        columns = [result[c] if c in result.columns else pd.Series(None, index=result.index, dtype=object)
+                   for c in ("category", "activity", "unit", region_column)]
+        codes, combos = _distinct(columns)
+        regional = np.array([groups.get(c, -1) for c in combos] + [-1], dtype=np.int64)[codes]
+        fallback = np.array([groups.get(c[:3] + (None,), -1) for c in combos] + [-1], dtype=np.int64)[codes]
+        dates = pd.to_datetime(result["date"], errors="coerce") if "date" in result.columns else pd.Series(pd.NaT, index=result.index)
+        years = dates.dt.year.fillna(_LATEST_YEAR).astype(int).to_numpy()
+
+        factor = np.full(len(result), np.nan)
+        chosen = np.full(len(result), None, dtype=object)
+        for candidate in (regional, fallback):
+            # Latest factor year up to the entry's year within the entry's group
+            pending = todo & (candidate >= 0) & np.isnan(factor)
+            query = candidate[pending] * _YEAR_SPAN + years[pending]
+            found = np.searchsorted(slots, query, side="right") - 1
+            hit = (found >= 0) & (slots[np.maximum(found, 0)] // _YEAR_SPAN == candidate[pending])
+            rows = np.flatnonzero(pending)[hit]
+            factor[rows] = values[found[hit]]
+            chosen[rows] = ids[found[hit]]
+
+        priced = ~np.isnan(factor)
+        if not priced.any():
+            return result
+        quantity = pd.to_numeric(result["quantity"], errors="coerce").to_numpy(dtype=float)
+        for col, new in (("emission_factor", factor), ("emissions_kgCO2e", quantity * factor)):
+            old = pd.to_numeric(result[col], errors="coerce").to_numpy(dtype=float) if col in result.columns else np.full(len(result), np.nan)
+            result[col] = np.where(priced, new, old)
+        result["factor_id"] = np.where(priced, chosen, result["factor_id"].to_numpy(dtype=object))
+        return result
+
+
+def load_gwp_basis(path=GWP_BASIS_FILE):
+    """
+    Read the GWP basis the stored entries were last restated under.
+
+    Args:
+        path (str, optional): Settings file; defaults to config.GWP_BASIS_FILE
+
+    Returns:
+        str: The saved basis, or config.GWP_BASIS if none was saved
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["basis"]
+    except FileNotFoundError:
+        return GWP_BASIS
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"Error reading GWP basis: {str(e)}")
+        return GWP_BASIS
+
+
+def save_gwp_basis(basis, path=GWP_BASIS_FILE):
+    """
+    Record the GWP basis the stored entries are restated under.
+
+    Args:
+        basis (str): "AR4", "AR5" or "AR6"
+        path (str, optional): Settings file; defaults to config.GWP_BASIS_FILE
+    """
+    atomic_write_json(path, {"basis": basis})
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_registry():
+    """
+    Return the process-wide registry, seeded from emission_factors.EMISSION_FACTORS.
+
+    Gas factors are converted under the saved GWP basis (see load_gwp_basis),
+    so a restart prices new entries like the restated ones.
+
+    Returns:
+        FactorRegistry: Shared registry
+    """
+    global _default
+    with _default_lock:
+        if _default is None:
+            registry = FactorRegistry(load_gwp_basis())
+            for category, activities in EMISSION_FACTORS.items():
+                for activity, ef in activities.items():
+                    registry.register(category, activity, ef["factor"], ef["unit"], gases=GAS_FACTORS.get((category, activity)))
+            _default = registry
+        return _default
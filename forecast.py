@@ -0,0 +1,161 @@
+"""
+Forecasting for YourCarbonFootprint application.
+Projects monthly emissions for many series at once with batched least squares.
+"""
+
+import numpy as np
+import pandas as pd
+
+from aggregates import MEASURE
+from timeseries import period_label
+
+# Forecast settings
+FORECAST_HORIZON = 12  # months projected past the latest month
+CONFIDENCE_Z = 1.96  # normal quantile of the bands (95%)
+SEASONAL_MIN_MONTHS = 24  # history a series needs before seasonality is fitted
+TREND_MIN_MONTHS = 3  # history a series needs before a trend is fitted
+FORECAST_COLUMNS = ["period", "label", "actual", "forecast", "lower", "upper"]
+
+
+def _design(months, model):
+    """
+    Regressors for month numbers: a level, then a trend, then 11 month-of-year dummies.
+
+    Args:
+        months (numpy.ndarray): Months since 1970-01 (ints)
+        model (str): "level", "trend" or "seasonal"
+
+    Returns:
+        numpy.ndarray: One row per month, one column per regressor
+    """
+    columns = [np.ones(len(months))]
+    if model != "level":
+        # Years rather than months keep the normal equations well conditioned
+        columns.append((months - months[0]) / 12.0)
+    if model == "seasonal":
+        month_of_year = months % 12
+        columns.extend((month_of_year == m).astype(float) for m in range(1, 12))
+    return np.column_stack(columns)
+
+
+def _fit(values, weights, history, future):
+    """
+    Weighted least squares for a batch of series sharing one design.
+
+    The normal equations of every series are stacked into (series, p, p)
+    arrays and solved in one call, so the cost is a handful of array
+    operations however many series there are.
+
+    Args:
+        values (numpy.ndarray): (series, months) observations; anything where weight is 0
+        weights (numpy.ndarray): (series, months) 1 for observed months, 0 otherwise
+        history (numpy.ndarray): (months, p) design of the observed months
+        future (numpy.ndarray): (horizon, p) design of the projected months
+
+    Returns:
+        tuple: (fitted (series, months), forecast (series, horizon), standard error (series, horizon))
+    """
+    p = history.shape[1]
+    xtx = np.einsum("tp,st,tq->spq", history, weights, history)
+    # A tiny ridge keeps series whose observed months miss a dummy solvable
+    xtx += np.eye(p) * 1e-9
+    xty = np.einsum("tp,st->sp", history, weights * values)
+    coef = np.linalg.solve(xtx, xty[..., None])[..., 0]
+    fitted = coef @ history.T
+    forecast = coef @ future.T
+    observed = weights.sum(axis=1)
+    dof = np.maximum(observed - p, 1)
+    sigma2 = (weights * (values - fitted) ** 2).sum(axis=1) / dof
+    # Prediction variance: noise plus the uncertainty of the coefficients
+    leverage = np.einsum("hp,spq,hq->sh", future, np.linalg.inv(xtx), future)
+    stderr = np.sqrt(sigma2[:, None] * (1 + leverage))
+    return fitted, forecast, stderr
+
+
+def forecast_series(monthly, by=(), horizon=FORECAST_HORIZON, z=CONFIDENCE_Z):
+    """
+    Project every monthly series forward with confidence bands.
+
+    Each series gets the richest model its history supports: level, trend and
+    month-of-year seasonality from SEASONAL_MIN_MONTHS, level and trend from
+    TREND_MIN_MONTHS, otherwise its mean. Series on the same model are fitted
+    together, so thousands of series cost three batched solves. Months before
+    a series' first entry are left out of its fit; empty months after it count
+    as zero.
+
+    Args:
+        monthly (pandas.DataFrame): Monthly output of timeseries.resample_totals
+        by (tuple, optional): Group columns of the series
+        horizon (int, optional): Months to project
+        z (float, optional): Width of the bands in standard errors
+
+    Returns:
+        pandas.DataFrame: Group columns plus FORECAST_COLUMNS: history months carry
+            actual and the fitted value, projected months the forecast and its
+            band; forecasts and bands are clipped at zero
+    """
+    by = list(by)
+    if not len(monthly) or horizon < 1:
+        return pd.DataFrame(columns=by + FORECAST_COLUMNS)
+    periods = pd.DatetimeIndex(monthly["period"])
+    months = (periods.year - 1970) * 12 + periods.month - 1
+    first, last = int(months.min()), int(months.max())
+    grid = np.arange(first, last + 1)
+    ahead = np.arange(last + 1, last + 1 + horizon)
+
+    # One row per series, one column per month
+    if by:
+        keys = pd.MultiIndex.from_frame(monthly[by].astype(object))
+        codes, series = pd.factorize(keys)
+    else:
+        codes, series = np.zeros(len(monthly), dtype=int), pd.Index([()])
+    values = np.zeros((len(series), len(grid)))
+    weights = np.zeros((len(series), len(grid)))
+    values[codes, months - first] = monthly[MEASURE].astype(float).to_numpy()
+    weights[codes, months - first] = 1.0
+    observed = weights.sum(axis=1)
+
+    fitted = np.zeros_like(values)
+    projected = np.zeros((len(series), horizon))
+    stderr = np.zeros((len(series), horizon))
+    tiers = [
+        ("seasonal", observed >= SEASONAL_MIN_MONTHS),
+        ("trend", (observed >= TREND_MIN_MONTHS) & (observed < SEASONAL_MIN_MONTHS)),
+        ("level", observed < TREND_MIN_MONTHS),
+    ]
+    for model, rows in tiers:
+        if not rows.any():
+            continue
+        design = _design(np.concatenate([grid, ahead]), model)
+        fit = _fit(values[rows], weights[rows], design[:len(grid)], design[len(grid):])
+        fitted[rows], projected[rows], stderr[rows] = fit
+    stderr[observed < 2] = np.nan
+
+    # Long format: history then projections for every series
+    n_series = len(series)
+    history = pd.DataFrame({
+        "code": np.repeat(np.arange(n_series), len(grid)),
+        "month": np.tile(grid, n_series),
+        "actual": np.where(weights > 0, values, np.nan).ravel(),
+        "forecast": fitted.ravel(),
+        "lower": np.nan,
+        "upper": np.nan,
+    })
+    history = history[weights.ravel() > 0]
+    future = pd.DataFrame({
+        "code": np.repeat(np.arange(n_series), horizon),
+        "month": np.tile(ahead, n_series),
+        "actual": np.nan,
+        "forecast": projected.ravel(),
+        "lower": (projected - z * stderr).ravel(),
+        "upper": (projected + z * stderr).ravel(),
+    })
+    result = pd.concat([history, future]).sort_values(["code", "month"], kind="stable")
+    result[["forecast", "lower", "upper"]] = result[["forecast", "lower", "upper"]].clip(lower=0)
+    result["period"] = pd.to_datetime(result["month"].to_numpy().astype("datetime64[M]"))
+    result["label"] = period_label(result["period"], "monthly").values
+    if by:
+        keys = series.to_frame(index=False).iloc[result["code"].to_numpy()].reset_index(drop=True)
+        keys.columns = by
+        result = pd.concat([keys, result.reset_index(drop=True)], axis=1)
+    return result[by + FORECAST_COLUMNS].reset_index(drop=True)
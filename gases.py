@@ -0,0 +1,84 @@
+"""
+Greenhouse gases for YourCarbonFootprint application.
+Converts per-gas emissions to CO2e under a chosen set of global warming potentials.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Gases tracked separately; "CO2e" holds emissions only known in CO2e
+GASES = ["CO2", "CH4", "N2O", "HFC-32", "HFC-125", "HFC-134a", "HFC-143a", "SF6", "CO2e"]
+
+# 100-year global warming potentials by IPCC assessment report
+GWP = {
+    "AR4": {"CO2": 1, "CH4": 25, "N2O": 298, "HFC-32": 675, "HFC-125": 3500, "HFC-134a": 1430, "HFC-143a": 4470, "SF6": 22800, "CO2e": 1},
+    "AR5": {"CO2": 1, "CH4": 28, "N2O": 265, "HFC-32": 677, "HFC-125": 3170, "HFC-134a": 1300, "HFC-143a": 4800, "SF6": 23500, "CO2e": 1},
+    "AR6": {"CO2": 1, "CH4": 27.9, "N2O": 273, "HFC-32": 771, "HFC-125": 3740, "HFC-134a": 1530, "HFC-143a": 5810, "SF6": 25200, "CO2e": 1},
+}
+GWP_BASES = list(GWP)
+# One row per basis, one column per gas
+GWP_MATRIX = np.array([[GWP[basis][gas] for gas in GASES] for basis in GWP_BASES], dtype=float)
+
+
+def gwp_vector(basis):
+    """
+    GWPs of GASES under one basis.
+
+    Args:
+        basis (str): "AR4", "AR5" or "AR6"
+
+    Returns:
+        numpy.ndarray: One GWP per gas
+
+    Raises:
+        ValueError: If the basis is unknown
+    """
+    if basis not in GWP:
+        raise ValueError(f"Unknown GWP basis {basis!r}; expected one of {', '.join(GWP_BASES)}")
+    return GWP_MATRIX[GWP_BASES.index(basis)]
+
+
+def gas_vector(gases):
+    """
+    Vector over GASES of a {gas: kg per unit} dict.
+
+    Args:
+        gases (dict): Gas -> kg of gas per unit
+
+    Returns:
+        numpy.ndarray: kg per unit of every gas in GASES
+
+    Raises:
+        ValueError: If a gas is not in GASES
+    """
+    unknown = [g for g in gases if g not in GASES]
+    if unknown:
+        raise ValueError(f"Unknown gases: {', '.join(unknown)}")
+    return np.array([float(gases.get(g, 0.0)) for g in GASES])
+
+
+def gas_emissions(df, registry):
+    """
+    Emissions of every gas for a table of entries.
+
+    Entries priced by a registry factor that has a gas vector get quantity x
+    vector; every other entry is only known in CO2e and counts its
+    emissions_kgCO2e under "CO2e". Multiplying the result by gwp_vector(basis)
+    restates the whole table under any basis in one matrix product.
+
+    Args:
+        df (pandas.DataFrame): Entries with quantity, emissions_kgCO2e and factor_id
+        registry (FactorRegistry): Registry that priced the entries
+
+    Returns:
+        pandas.DataFrame: Indexed like df, one column of kg per gas in GASES
+    """
+    profiles = registry.gas_profiles()
+    ids = df["factor_id"] if "factor_id" in df.columns else pd.Series(None, index=df.index, dtype=object)
+    rows = profiles.index.get_indexer(ids.astype(object))
+    vectors = np.vstack([profiles.to_numpy(dtype=float), np.zeros((1, len(GASES)))])[rows]
+    quantity = pd.to_numeric(df["quantity"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    kg = quantity[:, None] * vectors
+    emissions = pd.to_numeric(df["emissions_kgCO2e"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    kg[rows < 0, GASES.index("CO2e")] = emissions[rows < 0]
+    return pd.DataFrame(kg, index=df.index, columns=GASES)
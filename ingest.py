@@ -0,0 +1,270 @@
+"""
+Streaming import for YourCarbonFootprint application.
+Reads emissions CSV files a chunk at a time and prices each chunk before it is stored,
+and prepares batches of files in parallel worker processes.
+"""
+
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from config import IMPORT_CHUNK_ROWS
+from factor_datasets import default_catalog
+from factor_registry import FactorRegistry
+from matching import FactorMatcher
+from validation import format_errors, validate
+
+# Columns an imported file must have; emission_factor may be left out to use the factor registry
+IMPORT_COLUMNS = ["date", "scope", "category", "activity", "quantity", "unit"]
+# Problems price_chunk flags per row
+CHUNK_FLAGS = ["remapped", "unit_error", "unpriced"]
+# Files a batch ingest picks up from a directory
+INGEST_PATTERNS = ["*.csv", "*.xlsx", "*.xls"]
+INGEST_REPORT_COLUMNS = ["file", "rows", "imported", "rejected", "seconds", "errors"]
+REJECT_EXAMPLES = 5  # rejected rows described per file in the report
+
+_worker = {}  # registry and matcher of a worker process, set by _init_worker
+
+
+def _size(handle):
+    """Total bytes of a seekable file, or None."""
+    try:
+        position = handle.tell()
+        total = handle.seek(0, os.SEEK_END)
+        handle.seek(position)
+        return total
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def iter_csv_chunks(source, chunk_rows=IMPORT_CHUNK_ROWS, progress=None):
+    """
+    Parse a CSV file ``chunk_rows`` rows at a time.
+
+    Only one chunk is held in memory. Chunks are indexed by row number, so
+    row i of the file is on line i + 2 (the header is line 1).
+
+    Args:
+        source: Path to a CSV file or file-like object
+        chunk_rows (int, optional): Rows per yielded chunk
+        progress (callable, optional): Called as progress(bytes_read, total_bytes) after each chunk;
+            total_bytes is None for files that cannot seek
+
+    Yields:
+        pandas.DataFrame: Consecutive chunks of rows
+    """
+    handle = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+    try:
+        total = _size(handle)
+        with pd.read_csv(handle, chunksize=chunk_rows) as reader:
+            for chunk in reader:
+                yield chunk
+                if progress:
+                    # The parser reads ahead, so the position is approximate until the end
+                    read = None if total is None else min(handle.tell(), total)
+                    progress(read, total)
+    finally:
+        if handle is not source:
+            handle.close()
+    if progress:
+        progress(total, total)
+
+
+def price_chunk(df, registry, matcher=None):
+    """
+    Convert units and price the rows of a chunk in vectorized form.
+
+    Rows without an emission_factor are priced from the registry in one
+    join; external factor datasets are only loaded once something is not
+    built in.
+
+    Args:
+        df (pandas.DataFrame): Rows with IMPORT_COLUMNS and emission_factor (NaN to look up)
+        registry (FactorRegistry): Registry pricing the rows
+        matcher (FactorMatcher, optional): Replaces unknown categories and activities with
+            their closest match when given
+
+    Returns:
+        tuple: (priced copy of df, DataFrame of CHUNK_FLAGS per row indexed like df)
+    """
+    flags = pd.DataFrame(False, index=df.index, columns=CHUNK_FLAGS)
+    if matcher is not None:
+        df, remapped = matcher.remap(df)
+        flags["remapped"] = remapped
+    df, unit_errors = registry.normalize_units(df)
+    flags["unit_error"] = np.asarray(unit_errors)
+    df = registry.apply(df, overwrite=False)
+    unpriced = df["emission_factor"].isna()
+    if unpriced.any() and default_catalog().register(registry):
+        df = registry.apply(df, overwrite=False)
+        unpriced = df["emission_factor"].isna()
+    flags["unpriced"] = unpriced.to_numpy()
+    return df, flags
+
+
+def id_ranges(entry_ids):
+    """
+    Compress entry ids into runs of consecutive ids.
+
+    Args:
+        entry_ids (array-like): Entry ids
+
+    Returns:
+        numpy.ndarray: (runs, 2) array of [first, last + 1) ranges
+    """
+    ids = np.sort(np.asarray(entry_ids, dtype=np.int64))
+    if not len(ids):
+        return np.zeros((0, 2), dtype=np.int64)
+    breaks = np.flatnonzero(np.diff(ids) != 1) + 1
+    return np.column_stack([ids[np.r_[0, breaks]], ids[np.r_[breaks - 1, len(ids) - 1]] + 1])
+
+
+def expand_ranges(ranges):
+    """
+    Entry ids of ranges from id_ranges.
+
+    Args:
+        ranges (numpy.ndarray): (runs, 2) array returned by id_ranges
+
+    Returns:
+        numpy.ndarray: Entry ids
+    """
+    ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+    lengths = ranges[:, 1] - ranges[:, 0]
+    # Each id is its run's first id plus its offset within the run
+    return np.repeat(ranges[:, 0] - np.r_[0, np.cumsum(lengths)[:-1]], lengths) + np.arange(lengths.sum())
+
+
+def ingest_paths(source):
+    """
+    Files of a batch ingest.
+
+    Args:
+        source (str): Directory (its INGEST_PATTERNS files) or glob pattern
+
+    Returns:
+        list: Sorted file paths
+    """
+    if os.path.isdir(source):
+        paths = [p for pattern in INGEST_PATTERNS for p in glob.glob(os.path.join(source, pattern))]
+    else:
+        paths = glob.glob(source, recursive=True)
+    return sorted(set(p for p in paths if os.path.isfile(p)))
+
+
+def read_table(path):
+    """
+    Read a whole CSV or Excel file.
+
+    Args:
+        path (str): .csv, .xlsx or .xls file
+
+    Returns:
+        pandas.DataFrame: Its rows
+
+    Raises:
+        ValueError: If the file is neither CSV nor Excel
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == ".csv":
+        return pd.read_csv(path)
+    if suffix in (".xlsx", ".xls"):
+        return pd.read_excel(path)  # needs openpyxl (xlsx) or xlrd (xls)
+    raise ValueError(f"Unsupported file format: {path}")
+
+
+def prepare_file(path, registry, matcher=None):
+    """
+    Parse, price and validate one file of a batch ingest.
+
+    Rows that fail the entry schema (see validation.ENTRY_SCHEMA), have a
+    unit that cannot be converted or have no emission factor are rejected;
+    the rest are returned ready to store.
+
+    Args:
+        path (str): CSV or Excel file
+        registry (FactorRegistry): Registry pricing the rows
+        matcher (FactorMatcher, optional): Replaces unknown categories and activities when given
+
+    Returns:
+        tuple: (accepted rows, line number of each accepted row, report dict with
+            INGEST_REPORT_COLUMNS)
+    """
+    start = time.perf_counter()
+    report = {"file": path, "rows": 0, "imported": 0, "rejected": 0, "seconds": 0.0, "errors": ""}
+    try:
+        df = read_table(path)
+        report["rows"] = len(df)
+        missing = [col for col in IMPORT_COLUMNS if col not in df.columns]
+        if missing:
+            raise ValueError(f"Missing required columns: {', '.join(missing)}")
+        df = df.reset_index(drop=True)
+        errors = validate(df)
+        invalid = df.index.isin(errors["row"])
+        df = df[~invalid].copy()
+        df["date"] = pd.to_datetime(df["date"], format="mixed")
+        df["quantity"] = pd.to_numeric(df["quantity"])
+        df["emission_factor"] = pd.to_numeric(df["emission_factor"], errors="coerce") if "emission_factor" in df.columns else float("nan")
+        if "emissions_kgCO2e" not in df.columns:
+            df["emissions_kgCO2e"] = df["quantity"] * df["emission_factor"]
+        if "notes" not in df.columns:
+            df["notes"] = ""
+        df, flags = price_chunk(df, registry, matcher)
+        unpriced = flags["unit_error"] | flags["unpriced"]
+        errors = pd.concat([errors, pd.DataFrame({
+            "row": df.index[unpriced.to_numpy()],
+            "column": np.where(flags["unit_error"][unpriced], "unit", "activity"),
+            "error": np.where(flags["unit_error"][unpriced], "cannot be converted to the emission factor's unit", "has no emission factor"),
+        })], ignore_index=True).sort_values("row", kind="stable")
+        report["rejected"] = int(invalid.sum() + unpriced.sum())
+        report["errors"] = format_errors(errors, limit=REJECT_EXAMPLES)
+        df = df[~unpriced.to_numpy()]
+        # Line numbers in the file: header is line 1
+        lines = df.index.to_numpy() + 2
+    except Exception as e:
+        report["errors"] = str(e)
+        df, lines = None, np.zeros(0, dtype=np.int64)
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    return df, lines, report
+
+
+def _init_worker(factors, gwp_basis):
+    """Build a worker process's registry from the parent's factor table."""
+    registry = FactorRegistry(gwp_basis)
+    registry.register_frame(factors)
+    _worker["registry"] = registry
+    _worker["matcher"] = FactorMatcher(registry)
+
+
+def _prepare_in_worker(path, match_activities):
+    """prepare_file with the worker process's registry."""
+    return prepare_file(path, _worker["registry"], _worker["matcher"] if match_activities else None)
+
+
+def prepare_files(paths, registry, workers=0, matcher=None):
+    """
+    Run prepare_file over many files in parallel worker processes.
+
+    Each worker prices with its own registry built once from a copy of
+    ``registry``'s factor table.
+
+    Args:
+        paths (list): CSV or Excel files
+        registry (FactorRegistry): Registry pricing the rows
+        workers (int, optional): Worker processes; 0 for one per CPU, 1 to work in this process
+        matcher (FactorMatcher, optional): Replaces unknown categories and activities when given;
+            workers build their own over their registry
+
+    Returns:
+        list: prepare_file results, in the order of paths
+    """
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        return [prepare_file(path, registry, matcher) for path in paths]
+    factors = registry.table().sort_values("seq")
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(factors, registry.gwp_basis)) as pool:
+        return list(pool.map(_prepare_in_worker, paths, [matcher is not None] * len(paths)))
@@ -0,0 +1,170 @@
+"""
+Streaming JSON loader for YourCarbonFootprint application.
+Parses a JSON list of records incrementally into DataFrame chunks.
+"""
+
+import json
+import os
+
+import pandas as pd
+
+# Loader settings
+READ_BLOCK_BYTES = 1 << 20  # bytes read from disk at a time
+CHUNK_BYTES = 8 << 20  # parsed JSON text buffered before it becomes a DataFrame chunk
+
+_WHITESPACE = " \t\n\r"
+
+
+class JSONFormatError(ValueError):
+    """The file is valid JSON text so far but not a list of records."""
+
+
+class _ColumnBuffer:
+    """Column-wise buffer for records parsed since the last chunk."""
+
+    def __init__(self):
+        self.columns = {}
+        self.rows = 0
+
+    def add(self, record):
+        """Append one record, padding columns it lacks with None."""
+        for key in record:
+            if key not in self.columns:
+                self.columns[key] = [None] * self.rows
+        for key, values in self.columns.items():
+            values.append(record.get(key))
+        self.rows += 1
+
+    def drain(self):
+        """Turn the buffered rows into a DataFrame and reset."""
+        frame = pd.DataFrame(self.columns)
+        self.columns = {}
+        self.rows = 0
+        return frame
+
+
+def iter_json_chunks(path, chunk_bytes=CHUNK_BYTES, progress=None):
+    """
+    Parse a JSON list of records one record at a time.
+
+    The file is read in blocks and never held in memory as a whole; records
+    go straight into column buffers that become a DataFrame chunk every
+    ``chunk_bytes`` of parsed text.
+
+    Args:
+        path (str): JSON file holding a list of objects
+        chunk_bytes (int, optional): Parsed text per yielded chunk
+        progress (callable, optional): Called as progress(bytes_read, total_bytes)
+
+    Yields:
+        pandas.DataFrame: Consecutive chunks of records
+
+    Raises:
+        JSONFormatError: If the file is not a JSON list of objects
+    """
+    decoder = json.JSONDecoder()
+    total = os.path.getsize(path)
+    buffer = _ColumnBuffer()
+    text = ""
+    pos = 0
+    eof = False
+    parsed_bytes = 0
+
+    with open(path, "r", encoding="utf-8") as f:
+
+        def refill():
+            """Drop consumed text and read the next block."""
+            nonlocal text, pos, eof
+            block = f.read(READ_BLOCK_BYTES)
+            eof = not block
+            text = text[pos:] + block
+            pos = 0
+            if progress:
+                progress(min(f.buffer.tell(), total), total)
+
+        def skip_whitespace():
+            """Advance past whitespace, reading more text as needed."""
+            nonlocal pos
+            while True:
+                while pos < len(text) and text[pos] in _WHITESPACE:
+                    pos += 1
+                if pos < len(text) or eof:
+                    return
+                refill()
+
+        skip_whitespace()
+        if pos >= len(text):
+            return  # Empty file: no records
+        if text[pos] != "[":
+            raise JSONFormatError(f"{path} does not contain a JSON list")
+        pos += 1
+
+        while True:
+            skip_whitespace()
+            if pos >= len(text):
+                raise JSONFormatError(f"Unexpected end of file in {path}")
+            if text[pos] == "]":
+                break
+            if text[pos] == ",":
+                pos += 1
+                continue
+            if not eof and len(text) - pos < READ_BLOCK_BYTES:
+                refill()
+            try:
+                record, end = decoder.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Record spans the block boundary: read more and retry
+                refill()
+                continue
+            if not isinstance(record, dict):
+                raise JSONFormatError(f"{path} contains a non-object record")
+            buffer.add(record)
+            parsed_bytes += end - pos
+            pos = end
+            if parsed_bytes >= chunk_bytes:
+                yield buffer.drain()
+                parsed_bytes = 0
+
+    if buffer.rows:
+        yield buffer.drain()
+    if progress:
+        progress(total, total)
+
+
+def load_json_frame(path, chunk_bytes=CHUNK_BYTES, memory_limit=None, progress=None, transform=None):
+    """
+    Load a JSON list of records into one DataFrame without reading it whole.
+
+    Args:
+        path (str): JSON file holding a list of objects
+        chunk_bytes (int, optional): Parsed text per intermediate chunk
+        memory_limit (int, optional): Largest DataFrame size in bytes to build
+        progress (callable, optional): Called as progress(bytes_read, total_bytes)
+        transform (callable, optional): Applied to each chunk before it is kept, e.g. to
+            drop rows or columns; chunks are indexed by record position in the file
+
+    Returns:
+        pandas.DataFrame: All records (what transform kept of them), indexed by position
+
+    Raises:
+        MemoryError: If the data would exceed memory_limit
+        JSONFormatError: If the file is not a JSON list of objects
+    """
+    frames = []
+    used = 0
+    position = 0
+    for frame in iter_json_chunks(path, chunk_bytes, progress):
+        frame.index = pd.RangeIndex(position, position + len(frame))
+        position += len(frame)
+        if transform is not None:
+            frame = transform(frame)
+        if memory_limit is not None:
+            used += int(frame.memory_usage(deep=True).sum())
+            if used > memory_limit:
+                raise MemoryError(f"Loading {path} needs more than {memory_limit / 2**20:.0f} MB")
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame()
+    return frames[0] if len(frames) == 1 else pd.concat(frames)
@@ -0,0 +1,263 @@
+"""
+Fuzzy matching for YourCarbonFootprint application.
+Maps free-text categories and activities to the activities of the emission factor registry.
+"""
+
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from emission_factors import ACTIVITY_SYNONYMS
+from factor_registry import default_registry
+
+# Matching settings
+MATCH_TOP = 3  # candidates returned per text
+MATCH_MIN_CONFIDENCE = 0.5  # confidence needed before remap() replaces an activity
+MATCH_MIN_MARGIN = 0.1  # lead over the runner-up needed before remap() replaces an activity
+MATCH_COLUMNS = ["text", "rank", "category", "activity", "unit", "confidence"]
+_SCORE_CELLS = 1 << 22  # (texts, documents) scores computed at once: 32 MB of float64
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def trigrams(text):
+    """
+    Character trigrams of a text, each word padded with spaces.
+
+    Args:
+        text (str): Free text
+
+    Returns:
+        collections.Counter: Trigram -> occurrences
+    """
+    grams = Counter()
+    for word in _WORD.findall(str(text).lower()):
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _expand(starts, lengths):
+    """
+    Positions of many ranges at once.
+
+    Args:
+        starts (numpy.ndarray): First position of each range
+        lengths (numpy.ndarray): Length of each range
+
+    Returns:
+        tuple: (range of each position, positions), concatenated in range order
+    """
+    owner = np.repeat(np.arange(len(starts)), lengths)
+    position = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + starts[owner]
+    return owner, position
+
+
+class FactorMatcher:
+    """
+    Trigram index over the registry's (category, activity) keys.
+
+    Every activity is indexed under several documents: "category activity",
+    the activity alone, and each of its synonyms with and without the
+    category. Documents are TF-IDF weighted trigram vectors held in an
+    inverted index (trigram -> documents and weights, in CSR arrays), so
+    scoring a batch of texts is one gather over the postings of their
+    trigrams and one bincount. Confidence is the cosine similarity of the
+    best document of an activity, between 0 and 1. The index is rebuilt when
+    the registry changes.
+    """
+
+    def __init__(self, registry=None, synonyms=None):
+        """
+        Initialize the FactorMatcher class.
+
+        Args:
+            registry (FactorRegistry, optional): Registry to match against; defaults to the shared one
+            synonyms (dict, optional): (category, activity) -> other names; defaults to ACTIVITY_SYNONYMS
+        """
+        self.registry = registry or default_registry()
+        self.synonyms = ACTIVITY_SYNONYMS if synonyms is None else synonyms
+        self._lock = threading.Lock()
+        self._version = None
+
+    def _build(self):
+        """Index the registry's activities (lock held)."""
+        table = self.registry.table()
+        keys = table.drop_duplicates(["category", "activity"]).sort_values(["category", "activity"])
+        self._keys = list(zip(keys["category"], keys["activity"], keys["unit"]))
+        texts, owners = [], []
+        for k, (category, activity, _) in enumerate(self._keys):
+            names = [activity] + list(self.synonyms.get((category, activity), []))
+            for text in [f"{category} {activity}"] + names + [f"{category} {name}" for name in names[1:]]:
+                texts.append(text)
+                owners.append(k)
+        # Documents are ordered by activity, so per-activity maxima are one reduceat
+        self._key_starts = np.flatnonzero(np.r_[True, np.diff(owners) != 0])
+
+        counts = [trigrams(t) for t in texts]
+        self._vocabulary = {}
+        doc, term, tf = [], [], []
+        for d, grams in enumerate(counts):
+            for gram, n in grams.items():
+                doc.append(d)
+                term.append(self._vocabulary.setdefault(gram, len(self._vocabulary)))
+                tf.append(n)
+        doc, term, tf = np.array(doc), np.array(term), np.array(tf, dtype=float)
+        frequency = np.bincount(term, minlength=len(self._vocabulary))
+        self._idf = np.log((1 + len(texts)) / (1 + frequency)) + 1
+        self._unseen_idf = np.log(1 + len(texts)) + 1
+        weight = tf * self._idf[term]
+        weight /= np.sqrt(np.bincount(doc, weights=weight ** 2))[doc]
+
+        # Postings sorted by trigram: postings of trigram t are offsets[t]:offsets[t + 1]
+        order = np.argsort(term, kind="stable")
+        self._offsets = np.r_[0, np.cumsum(np.bincount(term, minlength=len(self._vocabulary)))]
+        self._post_doc = doc[order]
+        self._post_weight = weight[order]
+        self._n_docs = len(texts)
+        self._version = self.registry.version
+
+    def _scores(self, texts):
+        """(texts, activities) cosine similarities (lock held)."""
+        # Trigrams are worked out once per distinct word, then gathered for every occurrence
+        words = pd.Series(texts, dtype=object).str.lower().str.findall(_WORD.pattern).explode().dropna()
+        codes, distinct = pd.factorize(words)
+        # Trigrams no activity has are numbered after the vocabulary
+        unseen = {}
+        grams = []
+        for word in distinct:
+            ids = []
+            for gram in trigrams(word).elements():
+                t = self._vocabulary.get(gram)
+                ids.append(len(self._vocabulary) + unseen.setdefault(gram, len(unseen)) if t is None else t)
+            grams.append(ids)
+        word_lengths = np.array([len(g) for g in grams] + [0], dtype=np.int64)
+        word_starts = np.r_[0, np.cumsum(word_lengths)][:-1]
+        flat = np.concatenate([np.array(g, dtype=np.int64) for g in grams] + [np.zeros(0, dtype=np.int64)])
+        occurrence, position = _expand(word_starts[codes], word_lengths[codes])
+        text = words.index.to_numpy(dtype=np.int64)[occurrence]
+        term = flat[position]
+
+        # Term frequencies per (text, trigram); trigrams no activity has still count towards the norm
+        span = len(self._vocabulary) + len(unseen)
+        pairs, tf = np.unique(text * span + term, return_counts=True)
+        text, term = pairs // span, pairs % span
+        idf = np.r_[self._idf, np.full(len(unseen), self._unseen_idf)]
+        weight = tf * idf[term]
+        norms = np.sqrt(np.bincount(text, weights=weight ** 2, minlength=len(texts)))
+        seen = term < len(self._vocabulary)
+        text, term, weight = text[seen], term[seen], weight[seen] / norms[text[seen]]
+
+        # Expand every (text, trigram) pair into the trigram's postings
+        pair, position = _expand(self._offsets[term], self._offsets[term + 1] - self._offsets[term])
+        cells = text[pair] * self._n_docs + self._post_doc[position]
+        scores = np.bincount(cells, weights=weight[pair] * self._post_weight[position], minlength=len(texts) * self._n_docs)
+        scores = scores.reshape(len(texts), self._n_docs)
+        return np.maximum.reduceat(scores, self._key_starts, axis=1)
+
+    def match(self, texts, top=MATCH_TOP):
+        """
+        Rank the registry's activities for free texts.
+
+        Args:
+            texts (list): Free texts, e.g. "diesel genset" or "Electricity grid power HQ";
+                each distinct text is scored once
+            top (int, optional): Candidates per text
+
+        Returns:
+            pandas.DataFrame: MATCH_COLUMNS, best candidates first for every distinct text;
+                candidates sharing no trigram with the text are left out
+        """
+        uniques = pd.unique(pd.Series(texts, dtype=object).fillna("").astype(str))
+        frames = []
+        with self._lock:
+            if self._version != self.registry.version:
+                self._build()
+            keys = self._keys
+            # Texts per pass, so the score matrix stays the same size however many documents there are
+            step = max(1, _SCORE_CELLS // max(self._n_docs, 1))
+            for begin in range(0, len(uniques), step):
+                chunk = uniques[begin:begin + step]
+                scores = self._scores(chunk)
+                n = min(top, scores.shape[1])
+                best = np.argsort(-scores, axis=1, kind="stable")[:, :n]
+                frames.append(pd.DataFrame({
+                    "text": np.repeat(chunk, n),
+                    "rank": np.tile(np.arange(1, n + 1), len(chunk)),
+                    "key": best.ravel(),
+                    "confidence": np.take_along_axis(scores, best, axis=1).ravel(),
+                }))
+        if not frames:
+            return pd.DataFrame(columns=MATCH_COLUMNS)
+        result = pd.concat(frames, ignore_index=True)
+        result = result[result["confidence"] > 0].reset_index(drop=True)
+        matched = pd.DataFrame([keys[k] for k in result["key"]], columns=["category", "activity", "unit"])
+        result = pd.concat([result.drop(columns="key"), matched], axis=1)
+        result["confidence"] = result["confidence"].clip(upper=1.0).round(3)
+        return result[MATCH_COLUMNS]
+
+    def best(self, df):
+        """
+        Best activity for every row of a table from its category and activity text.
+
+        Args:
+            df (pandas.DataFrame): Rows with category and activity columns
+
+        Returns:
+            pandas.DataFrame: Indexed like df: category, activity, unit and confidence of the
+                best candidate, and margin, its lead in confidence over the best other
+                activity; missing where nothing matched
+        """
+        texts = (df["category"].fillna("").astype(str) + " " + df["activity"].fillna("").astype(str)).str.strip()
+        ranked = self.match(texts)
+        best = ranked[ranked["rank"] == 1].set_index("text")
+        # The same activity filed under another category is not a competing answer
+        others = ranked[(ranked["rank"] > 1) & (ranked["activity"] != best["activity"].reindex(ranked["text"]).to_numpy())]
+        runner_up = others.groupby("text")["confidence"].max()
+        best["margin"] = (best["confidence"] - runner_up.reindex(best.index).fillna(0)).round(3)
+        return best.reindex(texts.to_numpy()).drop(columns="rank").set_axis(df.index)
+
+    def remap(self, df, min_confidence=MATCH_MIN_CONFIDENCE, min_margin=MATCH_MIN_MARGIN):
+        """
+        Replace unknown categories and activities with their best match.
+
+        Rows whose (category, activity) is already in the registry are kept.
+        Remapped rows keep the original text in a matched_from column. A
+        match is only taken when it is clearly ahead of the runner-up; a
+        close second (e.g. two countries' grid electricity) leaves the row
+        as it was, for best() to offer as a suggestion.
+
+        Args:
+            df (pandas.DataFrame): Rows with category and activity columns
+            min_confidence (float, optional): Confidence a match needs
+            min_margin (float, optional): Lead over the runner-up a match needs
+
+        Returns:
+            tuple: (copy of df, boolean mask of the remapped rows)
+        """
+        result = df.copy()
+        if not len(result):
+            return result, np.zeros(0, dtype=bool)
+        with self._lock:
+            if self._version != self.registry.version:
+                self._build()
+            known = pd.MultiIndex.from_tuples([k[:2] for k in self._keys])
+        pairs = pd.MultiIndex.from_frame(result[["category", "activity"]].astype(object))
+        unknown = ~pairs.isin(known)
+        if not unknown.any():
+            return result, unknown
+        best = self.best(result[unknown])
+        accept = ((best["confidence"] >= min_confidence) & (best["margin"] >= min_margin)).to_numpy()
+        rows = result.index[unknown][accept]
+        if "matched_from" not in result.columns:
+            result["matched_from"] = None
+        result.loc[rows, "matched_from"] = (
+            result.loc[rows, "category"].astype(str) + " / " + result.loc[rows, "activity"].astype(str)
+        )
+        result.loc[rows, "category"] = best.loc[accept, "category"].to_numpy()
+        result.loc[rows, "activity"] = best.loc[accept, "activity"].to_numpy()
+        remapped = np.zeros(len(result), dtype=bool)
+        remapped[np.flatnonzero(unknown)[accept]] = True
+        return result, remapped
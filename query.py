@@ -0,0 +1,202 @@
+"""
+Query layer for YourCarbonFootprint application.
+Composable emissions queries with a result cache keyed on the data version.
+"""
+
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from storage import date_slice, filter_frame
+
+# Columns a query can filter on
+QUERY_FILTERS = ["scope", "category", "facility", "country", "verification_status"]
+# Aggregations a measure can use
+MEASURE_FUNCTIONS = ["sum", "mean", "min", "max", "count"]
+QUERY_CACHE_SIZE = 128  # results kept per engine
+
+
+class EmissionsQuery:
+    """
+    Immutable description of an emissions query.
+
+    Builder methods return new queries, so a base query can be refined in
+    several directions:
+
+        base = EmissionsQuery().between(start, end).where(scope="Scope 1")
+        by_month = base.group_by("month").measure("emissions_kgCO2e", "sum")
+
+    Without group_by the query returns the matching rows; with it, one row
+    per group holding each measure (named ``<column>`` for sums, otherwise
+    ``<column>_<function>``) and an "entries" count.
+    """
+
+    def __init__(self, start_date=None, end_date=None, filters=None, by=(), measures=(), columns=None):
+        """
+        Initialize the EmissionsQuery class.
+
+        Args:
+            start_date (datetime, optional): Inclusive start date
+            end_date (datetime, optional): Inclusive end date
+            filters (dict, optional): Column -> required value or list of values
+            by (tuple, optional): Columns to group by; "month" groups by YYYY-MM
+            measures (tuple, optional): (column, function) pairs
+            columns (tuple, optional): Columns to return for row queries
+        """
+        self.start_date = pd.Timestamp(start_date) if start_date else None
+        self.end_date = pd.Timestamp(end_date) if end_date else None
+        self.filters = {k: v for k, v in (filters or {}).items() if v is not None}
+        self.by = tuple(by)
+        self.measures = tuple(measures)
+        self.columns = tuple(columns) if columns else None
+
+    def _replace(self, **changes):
+        """Return a copy with some fields changed."""
+        fields = {
+            "start_date": self.start_date, "end_date": self.end_date, "filters": self.filters,
+            "by": self.by, "measures": self.measures, "columns": self.columns,
+        }
+        fields.update(changes)
+        return EmissionsQuery(**fields)
+
+    def between(self, start_date=None, end_date=None):
+        """Restrict to an inclusive date range."""
+        return self._replace(start_date=start_date, end_date=end_date)
+
+    def where(self, **filters):
+        """
+        Add equality filters, e.g. where(scope="Scope 1", country=["IN", "JP"]).
+
+        Raises:
+            ValueError: If a column cannot be filtered on
+        """
+        unknown = [c for c in filters if c not in QUERY_FILTERS]
+        if unknown:
+            raise ValueError(f"Cannot filter on: {', '.join(unknown)}")
+        return self._replace(filters={**self.filters, **filters})
+
+    def group_by(self, *by):
+        """Group the matching rows."""
+        return self._replace(by=by)
+
+    def measure(self, column, function="sum"):
+        """
+        Add a measure to a grouped query.
+
+        Raises:
+            ValueError: If the function is not supported
+        """
+        if function not in MEASURE_FUNCTIONS:
+            raise ValueError(f"Unsupported measure function: {function}")
+        return self._replace(measures=self.measures + ((column, function),))
+
+    def select(self, *columns):
+        """Return only some columns from a row query."""
+        return self._replace(columns=columns)
+
+    def key(self):
+        """Hashable identity of the query, used as cache key."""
+        filters = tuple(sorted(
+            (col, tuple(v) if isinstance(v, (list, tuple, set)) else v) for col, v in self.filters.items()
+        ))
+        return (self.start_date, self.end_date, filters, self.by, self.measures, self.columns)
+
+    def run(self, df, sorted_by_date=False):
+        """
+        Evaluate the query over a DataFrame.
+
+        Args:
+            df (pandas.DataFrame): Emissions data
+            sorted_by_date (bool, optional): The data is sorted by storage.sort_by_date,
+                so the date range can be sliced by binary search
+
+        Returns:
+            pandas.DataFrame: Matching rows, or one row per group
+        """
+        if sorted_by_date:
+            data = date_slice(df, self.start_date, self.end_date)
+        else:
+            data = filter_frame(df, self.start_date, self.end_date)
+        scalar = {k: v for k, v in self.filters.items() if not isinstance(v, (list, tuple, set))}
+        data = filter_frame(data, filters=scalar)
+        for col, values in self.filters.items():
+            if col not in scalar and col in data.columns:
+                data = data[data[col].isin(list(values))]
+        if not self.by and not self.measures:
+            return filter_frame(data, columns=list(self.columns) if self.columns else None)
+        if "month" in self.by and "month" not in data.columns:
+            data = data.assign(month=pd.to_datetime(data["date"], errors="coerce").dt.strftime("%Y-%m"))
+        measures = self.measures or (("emissions_kgCO2e", "sum"),)
+        values = {}
+        for column, function in measures:
+            numbers = pd.to_numeric(data[column], errors="coerce") if column in data.columns else pd.Series(float("nan"), index=data.index)
+            values[column if function == "sum" else f"{column}_{function}"] = (numbers, function)
+        frame = pd.DataFrame({name: series for name, (series, _) in values.items()}, index=data.index)
+        if not self.by:
+            result = {name: [getattr(frame[name], function)()] for name, (_, function) in values.items()}
+            result["entries"] = [len(frame)]
+            return pd.DataFrame(result)
+        keys = [data[c] for c in self.by]
+        grouped = frame.groupby(keys, observed=True)
+        result = grouped.agg({name: function for name, (_, function) in values.items()})
+        result["entries"] = grouped.size()
+        return result.reset_index()
+
+
+class QueryEngine:
+    """
+    LRU cache of query results in front of an emissions data source.
+
+    Results are keyed on the query plus the source's data version, which is
+    bumped on every write, so a repeated query is a dict lookup and no write
+    can be answered from a stale entry. Cached frames are shared: treat them
+    as read-only.
+    """
+
+    def __init__(self, execute, version, max_entries=QUERY_CACHE_SIZE):
+        """
+        Initialize the QueryEngine class.
+
+        Args:
+            execute (callable): Runs an EmissionsQuery and returns a DataFrame
+            version (callable): Returns the current data version
+            max_entries (int, optional): Results to keep
+        """
+        self.execute = execute
+        self.version = version
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def run(self, query):
+        """
+        Return the result of a query, from the cache when possible.
+
+        Args:
+            query (EmissionsQuery): Query to run
+
+        Returns:
+            pandas.DataFrame: Query result
+        """
+        key = (self.version(), query.key())
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+        result = self.execute(query)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return result
+
+    def clear(self):
+        """Drop every cached result."""
+        with self._lock:
+            self._cache.clear()
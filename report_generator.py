@@ -13,12 +13,28 @@ import os
 from datetime import datetime
 import base64
 from io import BytesIO
+from data_handler import REPORT_COLUMNS
+from storage import aggregate_frame
+from timeseries import resample_frame, write_trend_pdf
+from forecast import FORECAST_HORIZON, forecast_series
 
 class ReportGenerator:
     def __init__(self, data_handler):
         """Initialize the ReportGenerator class."""
         self.data_handler = data_handler
     
+    def _breakdown(self, data, by):
+        """Sum emissions by groups: from the data handler's cube, or over the given rows."""
+        if data is None:
+            return self.data_handler.summarize(by)
+        return aggregate_frame(data, by)
+    
+    def _resample(self, data, granularity, by=()):
+        """Resample emissions: from the data handler's cached series, or over the given rows."""
+        if data is None:
+            return self.data_handler.resample(granularity, by)
+        return resample_frame(data, granularity, by)
+    
     def generate_pdf_report(self, file_path=None, start_date=None, end_date=None, company_info=None):
         """
         Generate PDF report.
@@ -34,7 +50,7 @@ class ReportGenerator:
         """
         try:
             # Get filtered data
-            data = self.data_handler.get_filtered_data(start_date, end_date)
+            data = self.data_handler.get_filtered_data(start_date, end_date, columns=REPORT_COLUMNS)
             
             if len(data) == 0:
                 return False, "No data available for the selected period."
@@ -66,23 +82,27 @@ class ReportGenerator:
             pdf.cell(0, 10, "Summary", 0, 1)
             pdf.set_font("Arial", "", 12)
             
-            total_emissions = data['emissions_kgCO2e'].sum()
+            # Totals come from the cube; the period applies only when both ends are given
+            period = (start_date, end_date) if start_date and end_date else (None, None)
+            total_emissions = self.data_handler.summarize([], *period)['emissions_kgCO2e'].iloc[0]
             pdf.cell(0, 10, f"Total Emissions: {total_emissions:.2f} kgCO2e", 0, 1)
             
             # Emissions by scope
-            scope_data = data.groupby('scope')['emissions_kgCO2e'].sum().reset_index()
+            scope_data = self.data_handler.summarize(['scope'], *period)
             pdf.ln(5)
             pdf.cell(0, 10, "Emissions by Scope:", 0, 1)
             for _, row in scope_data.iterrows():
                 pdf.cell(0, 10, f"{row['scope']}: {row['emissions_kgCO2e']:.2f} kgCO2e ({row['emissions_kgCO2e'] / total_emissions * 100:.1f}%)", 0, 1)
             
             # Emissions by category
-            category_data = data.groupby('category')['emissions_kgCO2e'].sum().reset_index()
+            category_data = self.data_handler.summarize(['category'], *period)
             pdf.ln(5)
             pdf.cell(0, 10, "Top Categories:", 0, 1)
             for _, row in category_data.nlargest(5, 'emissions_kgCO2e').iterrows():
                 pdf.cell(0, 10, f"{row['category']}: {row['emissions_kgCO2e']:.2f} kgCO2e ({row['emissions_kgCO2e'] / total_emissions * 100:.1f}%)", 0, 1)
             
+            write_trend_pdf(pdf, self.data_handler.resample('monthly', (), *period))
+            
             # Data table
             pdf.ln(10)
             pdf.set_font("Arial", "B", 14)
@@ -141,17 +161,17 @@ class ReportGenerator:
         except Exception as e:
             return False, f"Error generating PDF report: {str(e)}"
     
-    def create_scope_pie_chart(self, data):
+    def create_scope_pie_chart(self, data=None):
         """
         Create pie chart of emissions by scope.
         
         Args:
-            data (pandas.DataFrame): Emissions data
+            data (pandas.DataFrame, optional): Emissions data; the whole ledger's cube if omitted
             
         Returns:
             plotly.graph_objects.Figure: Pie chart figure
         """
-        scope_data = data.groupby('scope')['emissions_kgCO2e'].sum().reset_index()
+        scope_data = self._breakdown(data, ['scope'])
         fig = px.pie(
             scope_data, 
             values='emissions_kgCO2e', 
@@ -171,17 +191,17 @@ class ReportGenerator:
         )
         return fig
     
-    def create_category_bar_chart(self, data):
+    def create_category_bar_chart(self, data=None):
         """
         Create bar chart of emissions by category.
         
         Args:
-            data (pandas.DataFrame): Emissions data
+            data (pandas.DataFrame, optional): Emissions data; the whole ledger's cube if omitted
             
         Returns:
             plotly.graph_objects.Figure: Bar chart figure
         """
-        category_data = data.groupby('category')['emissions_kgCO2e'].sum().reset_index()
+        category_data = self._breakdown(data, ['category'])
         category_data = category_data.sort_values('emissions_kgCO2e', ascending=False)
         fig = px.bar(
             category_data, 
@@ -200,43 +220,41 @@ class ReportGenerator:
         )
         return fig
     
-    def create_time_series_chart(self, data):
+    def create_time_series_chart(self, data=None, granularity='monthly'):
         """
         Create time series chart of emissions over time.
         
         Args:
-            data (pandas.DataFrame): Emissions data
+            data (pandas.DataFrame, optional): Emissions data; the whole ledger if omitted
+            granularity (str, optional): "daily", "weekly", "monthly", "quarterly" or "fiscal_year"
             
         Returns:
             plotly.graph_objects.Figure: Line chart figure
         """
-        if 'date' not in data.columns or len(data) == 0:
+        time_data = self._resample(data, granularity, ('scope',))
+        if len(time_data) == 0:
             # Create empty figure if no data
             fig = go.Figure()
             fig.update_layout(
                 title='Emissions Over Time',
-                xaxis_title="Month",
+                xaxis_title="Period",
                 yaxis_title="Emissions (kgCO2e)",
                 font=dict(size=12),
                 margin=dict(t=50, b=50, l=50, r=20)
             )
             return fig
         
-        # Group by month and scope
-        time_data = data.copy()
-        time_data['month'] = pd.to_datetime(time_data['date']).dt.strftime('%Y-%m')
-        time_data = time_data.groupby(['month', 'scope'])['emissions_kgCO2e'].sum().reset_index()
-        
         fig = px.line(
             time_data, 
-            x='month', 
+            x='period', 
             y='emissions_kgCO2e',
             color='scope',
             markers=True,
+            hover_data=['label', 'rolling_mean', 'yoy_pct'],
             title='Emissions Over Time'
         )
         fig.update_layout(
-            xaxis_title="Month",
+            xaxis_title="Period",
             yaxis_title="Emissions (kgCO2e)",
             legend_title="Scope",
             font=dict(size=12),
@@ -244,18 +262,18 @@ class ReportGenerator:
         )
         return fig
     
-    def create_activity_treemap(self, data):
+    def create_activity_treemap(self, data=None):
         """
         Create treemap of emissions by scope, category, and activity.
         
         Args:
-            data (pandas.DataFrame): Emissions data
+            data (pandas.DataFrame, optional): Emissions data; the whole ledger's cube if omitted
             
         Returns:
             plotly.graph_objects.Figure: Treemap figure
         """
         fig = px.treemap(
-            data,
+            self._breakdown(data, ['scope', 'category', 'activity']),
             path=['scope', 'category', 'activity'],
             values='emissions_kgCO2e',
             color='scope',
@@ -272,17 +290,18 @@ class ReportGenerator:
         )
         return fig
     
-    def create_monthly_comparison_chart(self, data):
+    def create_monthly_comparison_chart(self, data=None):
         """
-        Create bar chart comparing emissions by month.
+        Create bar chart comparing emissions by month, with a 3-month rolling average.
         
         Args:
-            data (pandas.DataFrame): Emissions data
+            data (pandas.DataFrame, optional): Emissions data; the whole ledger if omitted
             
         Returns:
             plotly.graph_objects.Figure: Bar chart figure
         """
-        if 'date' not in data.columns or len(data) == 0:
+        monthly_data = self._resample(data, 'monthly')
+        if len(monthly_data) == 0:
             # Create empty figure if no data
             fig = go.Figure()
             fig.update_layout(
@@ -294,17 +313,19 @@ class ReportGenerator:
             )
             return fig
         
-        # Group by month
-        monthly_data = data.copy()
-        monthly_data['month'] = pd.to_datetime(monthly_data['date']).dt.strftime('%Y-%m')
-        monthly_data = monthly_data.groupby('month')['emissions_kgCO2e'].sum().reset_index()
-        
         fig = px.bar(
             monthly_data,
-            x='month',
+            x='label',
             y='emissions_kgCO2e',
+            hover_data=['change_pct', 'yoy_pct'],
             title='Monthly Emissions Comparison'
         )
+        fig.add_trace(go.Scatter(
+            x=monthly_data['label'],
+            y=monthly_data['rolling_mean'],
+            mode='lines',
+            name='3-month average'
+        ))
         fig.update_layout(
             xaxis_title="Month",
             yaxis_title="Emissions (kgCO2e)",
@@ -312,3 +333,68 @@ class ReportGenerator:
             margin=dict(t=50, b=50, l=50, r=20)
         )
         return fig
+    
+    def create_forecast_chart(self, data=None, by=(), horizon=FORECAST_HORIZON, max_series=8):
+        """
+        Create line chart of monthly emissions projected forward with confidence bands.
+        
+        Args:
+            data (pandas.DataFrame, optional): Emissions data; the whole ledger if omitted
+            by (tuple, optional): Columns whose combinations are charted as separate series
+            horizon (int, optional): Months to project
+            max_series (int, optional): Largest series to chart, by total emissions
+            
+        Returns:
+            plotly.graph_objects.Figure: Line chart figure
+        """
+        by = tuple(by)
+        if data is None:
+            projection = self.data_handler.forecast(by, horizon)
+        else:
+            projection = forecast_series(resample_frame(data, 'monthly', by), by, horizon)
+        return forecast_figure(projection, by, max_series)
+
+
+def forecast_figure(projection, by=(), max_series=8):
+    """
+    Chart a forecast: history as solid lines, projections dashed with shaded bands.
+    
+    Args:
+        projection (pandas.DataFrame): Output of forecast.forecast_series
+        by (tuple, optional): Group columns of the series
+        max_series (int, optional): Largest series to chart, by total emissions
+        
+    Returns:
+        plotly.graph_objects.Figure: Line chart figure
+    """
+    fig = go.Figure()
+    fig.update_layout(
+        title='Emissions Forecast',
+        xaxis_title="Month",
+        yaxis_title="Emissions (kgCO2e)",
+        font=dict(size=12),
+        margin=dict(t=50, b=50, l=50, r=20)
+    )
+    if len(projection) == 0:
+        return fig
+    
+    if by:
+        names = projection[by[0]].astype(str)
+        for col in by[1:]:
+            names = names + ' / ' + projection[col].astype(str)
+        top = projection.groupby(names)['actual'].sum().nlargest(max_series).index
+    else:
+        names = pd.Series('Total', index=projection.index)
+        top = ['Total']
+    for name in top:
+        series = projection[names == name]
+        history = series[series['actual'].notna()]
+        future = series[series['actual'].isna()]
+        fig.add_trace(go.Scatter(x=history['period'], y=history['actual'], mode='lines+markers', name=name))
+        fig.add_trace(go.Scatter(
+            x=pd.concat([future['period'], future['period'][::-1]]),
+            y=pd.concat([future['upper'], future['lower'][::-1]]),
+            fill='toself', opacity=0.2, line=dict(width=0), showlegend=False, hoverinfo='skip'
+        ))
+        fig.add_trace(go.Scatter(x=future['period'], y=future['forecast'], mode='lines', line=dict(dash='dash'), name=f"{name} (forecast)"))
+    return fig
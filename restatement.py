@@ -0,0 +1,144 @@
+"""
+Restatement for YourCarbonFootprint application.
+Tracks which entries each registry factor priced and recomputes them when factors are revised.
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Columns needed to restate an entry
+RESTATE_COLUMNS = ["date", "category", "activity", "unit", "quantity", "emission_factor", "emissions_kgCO2e", "factor_id"]
+DELTA_COLUMNS = ["category", "activity", "factor_id", "entries", "before_kgCO2e", "after_kgCO2e", "change_kgCO2e"]
+
+
+class FactorDependents:
+    """
+    Reverse index from factor_id to the ids of the entries it priced.
+
+    Maintained on insert and delete like the cube, so finding the entries a
+    factor revision touches is a dict lookup rather than a ledger scan.
+    Entries priced with a factor of their own (no factor_id) are not indexed.
+    """
+
+    def __init__(self):
+        """Initialize the FactorDependents class."""
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Forget everything; the index is not ready until rebuilt."""
+        with self._lock:
+            self._entries = {}
+            self.ready = False
+
+    def rebuild(self, df):
+        """
+        Index the ledger from scratch.
+
+        Args:
+            df (pandas.DataFrame): Emissions data indexed by entry_id, with a factor_id column
+        """
+        self.clear()
+        self._update(df, add=True)
+        self.ready = True
+
+    def add(self, df):
+        """
+        Index newly stored entries.
+
+        Args:
+            df (pandas.DataFrame): Inserted entries indexed by entry_id
+        """
+        self._update(df, add=True)
+
+    def remove(self, df):
+        """
+        Drop deleted entries.
+
+        Args:
+            df (pandas.DataFrame): Deleted entries indexed by entry_id
+        """
+        self._update(df, add=False)
+
+    def _update(self, df, add):
+        """Add or drop the entry ids of some rows, one set operation per factor."""
+        if df is None or not len(df) or "factor_id" not in df.columns:
+            return
+        ids = pd.Series(df.index.to_numpy(), index=df["factor_id"].to_numpy())
+        ids = ids[ids.index.notna() & (ids.index != "")]
+        with self._lock:
+            for fid, group in ids.groupby(level=0):
+                entries = self._entries.setdefault(fid, set())
+                if add:
+                    entries.update(group.tolist())
+                else:
+                    entries.difference_update(group.tolist())
+                    if not entries:
+                        del self._entries[fid]
+
+    def entries(self, factor_ids):
+        """
+        Ids of the entries priced by some factors.
+
+        Args:
+            factor_ids (iterable): factor_ids
+
+        Returns:
+            numpy.ndarray: Sorted entry ids
+        """
+        with self._lock:
+            found = [np.fromiter(self._entries[f], dtype=np.int64) for f in set(factor_ids) if f in self._entries]
+        return np.sort(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+
+    def counts(self):
+        """
+        Number of entries per factor.
+
+        Returns:
+            dict: factor_id -> entries
+        """
+        with self._lock:
+            return {fid: len(entries) for fid, entries in self._entries.items()}
+
+
+def restate(rows, registry, region_column="country"):
+    """
+    Reprice entries with the registry's current factors.
+
+    All rows are repriced in one registry.apply join; only rows whose factor,
+    emissions or factor_id actually changed are returned.
+
+    Args:
+        rows (pandas.DataFrame): Entries to restate, indexed by entry_id
+        registry (FactorRegistry): Registry holding the revised factors
+        region_column (str, optional): Column holding each entry's region
+
+    Returns:
+        tuple: (changed entries with their new values, indexed by entry_id;
+            delta summary with DELTA_COLUMNS per new factor_id)
+    """
+    if not len(rows):
+        return rows, pd.DataFrame(columns=DELTA_COLUMNS)
+    repriced = registry.apply(rows, region_column=region_column)
+    before = pd.to_numeric(rows["emissions_kgCO2e"], errors="coerce").to_numpy(dtype=float)
+    after = pd.to_numeric(repriced["emissions_kgCO2e"], errors="coerce").to_numpy(dtype=float)
+    old_factor = pd.to_numeric(rows["emission_factor"], errors="coerce").to_numpy(dtype=float)
+    new_factor = pd.to_numeric(repriced["emission_factor"], errors="coerce").to_numpy(dtype=float)
+    changed = (
+        ~np.isclose(before, after, rtol=1e-12, atol=0, equal_nan=True)
+        | ~np.isclose(old_factor, new_factor, rtol=1e-12, atol=0, equal_nan=True)
+        | (rows["factor_id"].to_numpy(dtype=object) != repriced["factor_id"].to_numpy(dtype=object))
+    )
+    delta = pd.DataFrame({
+        "category": repriced["category"].to_numpy()[changed],
+        "activity": repriced["activity"].to_numpy()[changed],
+        "factor_id": repriced["factor_id"].to_numpy(dtype=object)[changed],
+        "entries": 1,
+        "before_kgCO2e": np.nan_to_num(before[changed]),
+        "after_kgCO2e": np.nan_to_num(after[changed]),
+    })
+    summary = delta.groupby(["category", "activity", "factor_id"], dropna=False, sort=True).sum().reset_index()
+    summary["change_kgCO2e"] = summary["after_kgCO2e"] - summary["before_kgCO2e"]
+    return repriced[changed], summary[DELTA_COLUMNS]
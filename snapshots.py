@@ -0,0 +1,248 @@
+"""
+Backup snapshots for YourCarbonFootprint application.
+Stores ledger snapshots as deduplicated, content-addressed chunks.
+
+Usage:
+    python snapshots.py list
+    python snapshots.py take
+    python snapshots.py prune
+    python snapshots.py restore <snapshot_id>
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import zlib
+from datetime import datetime
+
+from config import DATA_DIR, SNAPSHOT_RETENTION
+from storage import atomic_write_json, file_lock, frame_from_records, json_default, open_store, records_from_frame
+
+# Chunking settings: a chunk ends after a record whose hash hits the mask,
+# so an inserted or deleted record only changes the chunk it falls in
+CHUNK_MASK = 63  # about 64 records per chunk on average
+MAX_CHUNK_RECORDS = 1024
+
+# Bucket formats for the retention rules
+RETENTION_BUCKETS = {
+    "hourly": "%Y-%m-%d %H",
+    "daily": "%Y-%m-%d",
+    "weekly": "%G-%V",
+    "monthly": "%Y-%m",
+}
+
+
+def chunk_records(records):
+    """
+    Split records into content-defined chunks.
+
+    Args:
+        records (list): Record dicts
+
+    Returns:
+        list: Chunks as bytes, one canonical JSON line per record
+    """
+    chunks, lines = [], []
+    for record in records:
+        line = json.dumps(record, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=json_default).encode("utf-8")
+        lines.append(line)
+        if (zlib.crc32(line) & CHUNK_MASK) == 0 or len(lines) >= MAX_CHUNK_RECORDS:
+            chunks.append(b"\n".join(lines))
+            lines = []
+    if lines:
+        chunks.append(b"\n".join(lines))
+    return chunks
+
+
+class SnapshotManager:
+    """
+    Content-addressed snapshot repository.
+
+    Each snapshot is a small manifest listing chunk hashes; chunks are
+    compressed and stored once under ``chunks/`` no matter how many snapshots
+    reference them. Old snapshots are thinned out by a retention policy and
+    chunks no manifest references are garbage-collected.
+    """
+
+    def __init__(self, root, retention=None):
+        """
+        Initialize the SnapshotManager class.
+
+        Args:
+            root (str): Repository directory
+            retention (dict, optional): Snapshots to keep, e.g. {"last": 3, "hourly": 24,
+                "daily": 7, "weekly": 8}; defaults to config.SNAPSHOT_RETENTION
+        """
+        self.root = root
+        self.retention = retention or SNAPSHOT_RETENTION
+        self.chunk_dir = os.path.join(root, "chunks")
+        self.manifest_dir = os.path.join(root, "manifests")
+        self.lock_path = os.path.join(root, "lock")
+        self._lock = threading.RLock()
+
+    def _chunk_path(self, digest):
+        """Return the file path of a chunk."""
+        return os.path.join(self.chunk_dir, digest[:2], digest)
+
+    def take(self, records, source=""):
+        """
+        Store a snapshot of the ledger and apply the retention policy.
+
+        Args:
+            records (list): Record dicts
+            source (str, optional): Where the records came from
+
+        Returns:
+            str: Snapshot id
+        """
+        digests = []
+        with file_lock(self.lock_path, self._lock):
+            for chunk in chunk_records(records):
+                digest = hashlib.sha256(chunk).hexdigest()
+                path = self._chunk_path(digest)
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp = path + ".tmp"
+                    with open(tmp, "wb") as f:
+                        f.write(zlib.compress(chunk))
+                    os.replace(tmp, path)
+                digests.append(digest)
+            created = datetime.now()
+            snapshot_id = f"{created.strftime('%Y%m%dT%H%M%S%f')}-{hashlib.sha256(''.join(digests).encode()).hexdigest()[:8]}"
+            manifest = {
+                "id": snapshot_id,
+                "created": created.isoformat(),
+                "source": source,
+                "rows": len(records),
+                "chunks": digests,
+            }
+            atomic_write_json(os.path.join(self.manifest_dir, f"{snapshot_id}.json"), manifest)
+            self._prune()
+        return snapshot_id
+
+    def list(self):
+        """
+        List snapshots, newest first.
+
+        Returns:
+            list: Manifest dicts
+        """
+        if not os.path.isdir(self.manifest_dir):
+            return []
+        manifests = []
+        for name in os.listdir(self.manifest_dir):
+            if name.endswith(".json"):
+                with open(os.path.join(self.manifest_dir, name), "r", encoding="utf-8") as f:
+                    manifests.append(json.load(f))
+        return sorted(manifests, key=lambda m: m["created"], reverse=True)
+
+    def read(self, snapshot_id):
+        """
+        Reassemble the records of a snapshot.
+
+        Args:
+            snapshot_id (str): Snapshot id
+
+        Returns:
+            list: Record dicts
+        """
+        with open(os.path.join(self.manifest_dir, f"{snapshot_id}.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        records = []
+        for digest in manifest["chunks"]:
+            with open(self._chunk_path(digest), "rb") as f:
+                chunk = zlib.decompress(f.read())
+            records.extend(json.loads(line) for line in chunk.split(b"\n"))
+        return records
+
+    def select_kept(self, manifests):
+        """
+        Pick the snapshots the retention policy keeps.
+
+        "last" keeps the newest N; each bucket rule keeps the newest snapshot
+        of each of the N most recent hours/days/weeks/months.
+
+        Args:
+            manifests (list): Manifest dicts, newest first
+
+        Returns:
+            set: Ids of snapshots to keep
+        """
+        keep = {m["id"] for m in manifests[:self.retention.get("last", 0)]}
+        for rule, fmt in RETENTION_BUCKETS.items():
+            limit = self.retention.get(rule, 0)
+            buckets = set()
+            for manifest in manifests:
+                bucket = datetime.fromisoformat(manifest["created"]).strftime(fmt)
+                if bucket in buckets:
+                    continue
+                if len(buckets) >= limit:
+                    break
+                buckets.add(bucket)
+                keep.add(manifest["id"])
+        return keep
+
+    def prune(self):
+        """
+        Apply the retention policy and delete unreferenced chunks.
+
+        Returns:
+            int: Number of snapshots removed
+        """
+        with file_lock(self.lock_path, self._lock):
+            return self._prune()
+
+    def _prune(self):
+        """Prune with the repository lock held."""
+        manifests = self.list()
+        keep = self.select_kept(manifests)
+        removed = 0
+        referenced = set()
+        for manifest in manifests:
+            if manifest["id"] in keep:
+                referenced.update(manifest["chunks"])
+            else:
+                os.remove(os.path.join(self.manifest_dir, f"{manifest['id']}.json"))
+                removed += 1
+        if removed and os.path.isdir(self.chunk_dir):
+            for prefix in os.listdir(self.chunk_dir):
+                for digest in os.listdir(os.path.join(self.chunk_dir, prefix)):
+                    if digest not in referenced:
+                        os.remove(os.path.join(self.chunk_dir, prefix, digest))
+        return removed
+
+
+def main():
+    """Command-line entry point for listing, taking, pruning and restoring snapshots."""
+    parser = argparse.ArgumentParser(description="Manage emissions ledger snapshots.")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Data directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List snapshots")
+    commands.add_parser("take", help="Snapshot the current ledger")
+    commands.add_parser("prune", help="Apply the retention policy")
+    restore = commands.add_parser("restore", help="Replace the ledger with a snapshot")
+    restore.add_argument("snapshot_id")
+    args = parser.parse_args()
+
+    manager = SnapshotManager(os.path.join(args.data_dir, "snapshots"))
+    if args.command == "list":
+        for manifest in manager.list():
+            print(f"{manifest['id']}  {manifest['created']}  {manifest['rows']} rows  {manifest['source']}")
+    elif args.command == "prune":
+        print(f"Removed {manager.prune()} snapshots")
+    else:
+        store = open_store(data_dir=args.data_dir)
+        if args.command == "take":
+            print(manager.take(records_from_frame(store.load()), source="manual"))
+        else:
+            records = manager.read(args.snapshot_id)
+            # Keep the state being replaced, in case the restore was a mistake
+            manager.take(records_from_frame(store.load()), source="pre-restore")
+            store.rewrite(frame_from_records(records))
+            print(f"Restored {len(records)} rows from {args.snapshot_id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1636 @@
+"""
+Storage backends for YourCarbonFootprint application.
+Persists emissions entries without rewriting the whole ledger on every change.
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import shutil
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+import pandas as pd
+
+from config import DATA_DIR, LOAD_MEMORY_LIMIT_MB, STORAGE_BACKEND
+from json_loader import load_json_frame
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: only needed for the parquet backend
+    pa = None
+    pq = None
+
+# Constants
+ENTRY_ID = "entry_id"
+JOURNAL_SUFFIX = ".journal"
+META_SUFFIX = ".meta"
+LOCK_SUFFIX = ".lock"
+COMPACT_THRESHOLD = 5000  # journaled rows before a background compaction
+BACKUP_ROWS = 5000  # rows a parquet or SQLite store writes between background backups
+PARTITION_FILE_LIMIT = 32  # part files in one month before they are merged
+CHANGE_LOG_ROWS = 10000  # change records SQLite keeps for readers catching up
+CHANGE_LOG_BYTES = 1 << 20  # parquet change log size before it is reset
+READ_RETRIES = 3  # lock-free parquet read attempts before one under the writer lock
+NUMERIC_COLUMNS = ["quantity", "emission_factor", "emissions_kgCO2e"]
+TEXT_COLUMNS = [
+    "date", "scope", "category", "activity", "unit", "notes", "business_unit", "project",
+    "country", "facility", "responsible_person", "data_quality", "verification_status",
+]
+INDEXED_COLUMNS = ["date", "scope", "category", "facility", "country"]
+
+
+def json_default(value):
+    """Serialize the odd non-JSON value that ends up in a records list."""
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y-%m-%d")
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def atomic_write_json(path, obj, indent=None):
+    """
+    Write JSON to a file atomically (temp file, fsync, rename).
+
+    Args:
+        path (str): Destination file
+        obj: JSON-serializable object
+        indent (int, optional): Pretty-print indentation
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    separators = None if indent else (",", ":")
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix="emissions_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(obj, f, indent=indent, separators=separators, ensure_ascii=False, default=json_default)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            try: os.remove(tmp)
+            except Exception: pass
+
+
+@contextmanager
+def file_lock(path, thread_lock):
+    """
+    Hold a thread lock plus, where supported, an exclusive lock on a file.
+
+    Args:
+        path (str): Lock file, created if missing
+        thread_lock (threading.Lock): In-process lock taken first
+    """
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def filter_frame(df, start_date=None, end_date=None, columns=None, filters=None):
+    """
+    Filter emissions data by date range and column values.
+
+    Args:
+        df (pandas.DataFrame): Emissions data
+        start_date (datetime, optional): Inclusive start date
+        end_date (datetime, optional): Inclusive end date
+        columns (list, optional): Columns to keep
+        filters (dict, optional): Column -> required value
+
+    Returns:
+        pandas.DataFrame: Filtered data
+    """
+    mask = None
+    if (start_date or end_date) and "date" in df.columns:
+        dates = pd.to_datetime(df["date"], errors="coerce")
+        mask = pd.Series(True, index=df.index)
+        if start_date:
+            mask &= dates >= pd.Timestamp(start_date)
+        if end_date:
+            mask &= dates <= pd.Timestamp(end_date)
+    for col, value in (filters or {}).items():
+        if value is not None and col in df.columns:
+            mask = (df[col] == value) if mask is None else mask & (df[col] == value)
+    data = df if mask is None or mask.all() else df.loc[mask]
+    if columns:
+        data = data[[c for c in columns if c in data.columns]]
+    return data
+
+
+def sort_by_date(df):
+    """
+    Sort emissions data on its date column, keeping the existing order within a day.
+
+    Missing dates go last. Frames that are already sorted are returned as is.
+
+    Args:
+        df (pandas.DataFrame): Emissions data with a datetime64 date column
+
+    Returns:
+        pandas.DataFrame: Data sorted for date_slice
+    """
+    if "date" not in df.columns:
+        return df
+    dated = int(df["date"].notna().sum())
+    head = df["date"].iloc[:dated]
+    if head.notna().all() and head.is_monotonic_increasing:
+        return df
+    return df.sort_values("date", kind="stable", na_position="last")
+
+
+def date_slice(df, start_date=None, end_date=None):
+    """
+    Select an inclusive date range from data sorted by sort_by_date.
+
+    Both ends are found by binary search and the result is a positional
+    slice, so the cost is O(log n) plus the rows returned, with no mask and
+    no copy of the rest of the ledger.
+
+    Args:
+        df (pandas.DataFrame): Emissions data sorted on a datetime64 date column
+        start_date (datetime, optional): Inclusive start date
+        end_date (datetime, optional): Inclusive end date
+
+    Returns:
+        pandas.DataFrame: Rows within the range
+    """
+    if not (start_date or end_date) or "date" not in df.columns:
+        return df
+    dates = df["date"].to_numpy()
+    # numpy orders NaT after every date, matching na_position="last"
+    lo = np.searchsorted(dates, pd.Timestamp(start_date).to_datetime64().astype(dates.dtype), "left") if start_date else 0
+    bound = pd.Timestamp(end_date).to_datetime64() if end_date else np.datetime64("NaT")
+    bound = bound.astype(dates.dtype)
+    hi = np.searchsorted(dates, bound, "right" if end_date else "left")
+    return df.iloc[lo:hi]
+
+
+def aggregate_frame(df, by, measure="emissions_kgCO2e"):
+    """
+    Sum a measure by groups, in pandas.
+
+    Args:
+        df (pandas.DataFrame): Emissions data
+        by (list): Columns to group by; "month" is derived from date as YYYY-MM
+        measure (str, optional): Column to sum
+
+    Returns:
+        pandas.DataFrame: Group columns plus the summed measure and an "entries" count
+    """
+    data = df
+    if "month" in by and "month" not in df.columns:
+        data = df.assign(month=pd.to_datetime(df["date"], errors="coerce").dt.strftime("%Y-%m"))
+    values = pd.to_numeric(data[measure], errors="coerce").fillna(0) if measure in data.columns else pd.Series(0.0, index=data.index)
+    data = data.assign(**{measure: values})
+    if not by:
+        return pd.DataFrame({measure: [values.sum()], "entries": [len(data)]})
+    grouped = data.groupby(list(by), observed=True)[measure].agg(["sum", "size"]).reset_index()
+    return grouped.rename(columns={"sum": measure, "size": "entries"})
+
+
+def records_from_frame(df):
+    """
+    Convert an emissions DataFrame to JSON-ready records.
+
+    Datetime columns are written as YYYY-MM-DD strings, missing values as
+    None, and an ``entry_id`` index is kept as a regular field.
+
+    Args:
+        df (pandas.DataFrame): Emissions data
+
+    Returns:
+        list: List of record dicts
+    """
+    data = df.reset_index() if df.index.name == ENTRY_ID else df.copy()
+    for col in data.columns:
+        if pd.api.types.is_datetime64_any_dtype(data[col]):
+            data[col] = data[col].dt.strftime("%Y-%m-%d")
+    data = data.astype(object).where(data.notna(), None)
+    return data.to_dict("records")
+
+
+def frame_from_records(records):
+    """
+    Build an emissions DataFrame indexed by ``entry_id`` from records.
+
+    Args:
+        records (list): Record dicts, as stored on disk
+
+    Returns:
+        pandas.DataFrame: Emissions data
+    """
+    df = pd.DataFrame(records)
+    if ENTRY_ID in df.columns:
+        df = df.set_index(ENTRY_ID)
+    df.index = df.index.astype("int64")
+    df.index.name = ENTRY_ID
+    return df
+
+
+class EmissionsStore:
+    """
+    Base class for emissions stores.
+
+    Subclasses implement load, append, delete and rewrite. Stores that can
+    read a slice of the ledger without loading all of it set
+    ``supports_pruning`` and override read.
+    """
+
+    supports_pruning = False
+    supports_aggregation = False
+    snapshots = None  # SnapshotManager backing up the ledger, if any
+    _backup_rows = 0  # rows written since the last backup
+    _backup_thread = None
+
+    def load(self, progress=None):
+        """Load the full ledger as a DataFrame indexed by entry_id; progress(done, total) is called as it goes."""
+        raise NotImplementedError
+
+    def append(self, rows):
+        """Append entries and return them indexed by their new entry ids."""
+        raise NotImplementedError
+
+    def delete(self, entry_ids):
+        """Delete entries by id."""
+        raise NotImplementedError
+
+    def rewrite(self, df):
+        """Replace the whole ledger with a DataFrame."""
+        raise NotImplementedError
+
+    def commit(self, rows=None, entry_ids=None):
+        """
+        Append and delete entries as one batch.
+
+        Stores that can make both durable in a single write override this.
+        A commit that raises must have changed nothing: clean-up after the
+        commit point logs its failures instead, so that callers such as
+        WriteBuffer can safely retry a failed commit.
+
+        Args:
+            rows (pandas.DataFrame, optional): New entries
+            entry_ids (iterable, optional): Ids of the entries to delete
+
+        Returns:
+            pandas.DataFrame: The new entries indexed by their entry ids, or None
+        """
+        stored = self.append(rows) if rows is not None else None
+        if entry_ids:
+            self.delete(entry_ids)
+        return stored
+
+    def is_empty(self):
+        """Return True if the store has never been written to."""
+        raise NotImplementedError
+
+    def version(self):
+        """Return a cheap token that changes whenever the ledger changes."""
+        raise NotImplementedError
+
+    def changes_since(self, version):
+        """
+        Describe what changed since a version.
+
+        Stores that cannot tell return None and callers reload the ledger.
+
+        Args:
+            version: Token from version() or a previous changes_since call
+
+        Returns:
+            tuple: (inserted DataFrame indexed by entry_id, list of deleted ids, new version), or None
+        """
+        return None
+
+    def read(self, start_date=None, end_date=None, columns=None, filters=None):
+        """
+        Read a slice of the ledger.
+
+        Args:
+            start_date (datetime, optional): Inclusive start date
+            end_date (datetime, optional): Inclusive end date
+            columns (list, optional): Columns to return
+            filters (dict, optional): Column -> required value
+
+        Returns:
+            pandas.DataFrame: Matching entries indexed by entry_id
+        """
+        return filter_frame(self.load(), start_date, end_date, columns, filters)
+
+    def aggregate(self, by, start_date=None, end_date=None, filters=None, measure="emissions_kgCO2e"):
+        """
+        Sum a measure by groups.
+
+        Stores that set ``supports_aggregation`` answer this without loading
+        the rows; the default aggregates a read in pandas.
+
+        Args:
+            by (list): Columns to group by; "month" groups by YYYY-MM
+            start_date (datetime, optional): Inclusive start date
+            end_date (datetime, optional): Inclusive end date
+            filters (dict, optional): Column -> required value
+            measure (str, optional): Column to sum
+
+        Returns:
+            pandas.DataFrame: Group columns plus the summed measure and an "entries" count
+        """
+        columns = [c for c in by if c != "month"] + ["date", measure]
+        data = self.read(start_date, end_date, columns, filters)
+        return aggregate_frame(data, by, measure)
+
+    def _snapshot(self, df, source):
+        """Back up a ledger frame, logging failures, since the write it follows has committed."""
+        if self.snapshots is None:
+            return
+        try:
+            self.snapshots.take(records_from_frame(df), source=source)
+        except Exception as e:
+            print(f"Error backing up emissions ledger: {str(e)}")
+
+    def _snapshot_after(self, rows, source):
+        """Back up the whole ledger in the background once BACKUP_ROWS rows were written since the last backup."""
+        if self.snapshots is None:
+            return
+        self._backup_rows += rows
+        if self._backup_rows < BACKUP_ROWS or (self._backup_thread is not None and self._backup_thread.is_alive()):
+            return
+        self._backup_rows = 0
+        try:
+            self._backup_thread = threading.Thread(target=self._snapshot_quietly, args=(source,), daemon=True)
+            self._backup_thread.start()
+        except Exception as e:
+            print(f"Error starting emissions backup: {str(e)}")
+
+    def _snapshot_quietly(self, source):
+        """Load and back up the ledger in a background thread, logging failures."""
+        try:
+            df = self.load()
+        except Exception as e:
+            print(f"Error backing up emissions ledger: {str(e)}")
+            return
+        self._snapshot(df, source)
+
+
+class JournalStore(EmissionsStore):
+    """
+    Append-only emissions store.
+
+    The ledger lives in a JSON snapshot (the familiar ``emissions.json`` list
+    of records) plus a journal of JSON lines, one line per batch of inserts or
+    deletes. Writes only append to the journal, so adding a row costs the size
+    of the row rather than the size of the ledger. Once the journal holds
+    ``compact_threshold`` rows a background thread folds it into a new snapshot.
+
+    Every row carries a stable ``entry_id``. Legacy snapshots without one get
+    their list position as id, which the next compaction writes back.
+    """
+
+    def __init__(self, path, compact_threshold=COMPACT_THRESHOLD, snapshots=None, memory_limit=None):
+        """
+        Initialize the JournalStore class.
+
+        Args:
+            path (str): Snapshot file; journal and metadata live next to it
+            compact_threshold (int, optional): Journaled rows that trigger compaction
+            snapshots (SnapshotManager, optional): Backup repository for each new snapshot
+            memory_limit (int, optional): Largest ledger in bytes load() builds;
+                defaults to config.LOAD_MEMORY_LIMIT_MB
+        """
+        self.path = path
+        self.snapshots = snapshots
+        if memory_limit is None and LOAD_MEMORY_LIMIT_MB:
+            memory_limit = LOAD_MEMORY_LIMIT_MB << 20
+        self.memory_limit = memory_limit
+        self.journal_path = path + JOURNAL_SUFFIX
+        self.meta_path = path + META_SUFFIX
+        self.lock_path = path + LOCK_SUFFIX
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        self._compactor = None
+        self._generation = None
+        self._offset = 0
+        self._seq = 0
+        self._next_id = 0
+        self._journal_rows = 0
+
+    def _locked(self):
+        """Serialize writers across threads and, where supported, processes."""
+        return file_lock(self.lock_path, self._lock)
+
+    def is_empty(self):
+        """Return True if neither snapshot nor journal exist."""
+        return not os.path.exists(self.path) and not os.path.exists(self.journal_path)
+
+    def version(self):
+        """
+        Return (generation, journal size) as a change token.
+
+        Returns:
+            tuple: Snapshot generation and journal length in bytes
+        """
+        meta = self._read_meta() or {"generation": 0}
+        try:
+            size = os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            size = 0
+        return (meta["generation"], size)
+
+    def changes_since(self, version):
+        """
+        Read the journal ops written since a version.
+
+        Re-reading ops is harmless: inserts carry their entry ids and deletes
+        of missing ids are no-ops, so callers skip ids they already hold.
+
+        Args:
+            version (tuple): Token from version() or a previous call
+
+        Returns:
+            tuple: (inserted DataFrame indexed by entry_id, list of deleted ids, new version),
+                or None after a compaction, when the ledger must be reloaded
+        """
+        generation, offset = version
+        if (self._read_meta() or {"generation": 0})["generation"] != generation:
+            return None
+        if offset > 0:
+            # A size taken mid-write may point inside a line: start over from the
+            # journal head rather than misparse a fragment
+            with open(self.journal_path, "rb") as f:
+                f.seek(offset - 1)
+                if f.read(1) != b"\n":
+                    offset = 0
+        ops, end = self._read_journal(offset)
+        if (self._read_meta() or {"generation": 0})["generation"] != generation:
+            return None
+        inserted = [record for op in ops if op["op"] == "insert" for record in op["rows"]]
+        deleted = [entry_id for op in ops if op["op"] == "delete" for entry_id in op["ids"]]
+        return frame_from_records(inserted), deleted, (generation, end)
+
+    def _read_meta(self):
+        """Read the metadata file, or None if it does not exist yet."""
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _read_snapshot(self):
+        """Read the snapshot records."""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "r", encoding="utf-8") as f:
+            raw = f.read().strip()
+        return json.loads(raw or "[]")
+
+    def _read_journal(self, offset=0):
+        """
+        Read complete journal lines starting at a byte offset.
+
+        Returns:
+            tuple: (list of ops, offset just past the last complete line)
+        """
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+        end = data.rfind(b"\n") + 1
+        ops = []
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                ops.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Torn write from a crash; the op was never acknowledged
+                continue
+        return ops, offset + end
+
+    def _advance(self, ops):
+        """Move sequence number and id counter past the given ops."""
+        for op in ops:
+            self._seq = max(self._seq, op.get("seq", 0))
+            if op["op"] == "insert":
+                self._journal_rows += len(op["rows"])
+                if op["rows"]:
+                    self._next_id = max(self._next_id, max(r[ENTRY_ID] for r in op["rows"]) + 1)
+            else:
+                self._journal_rows += len(op.get("ids", []))
+
+    def _sync(self):
+        """Catch up with journal lines written by other processes (lock held)."""
+        meta = self._read_meta()
+        if meta is None:
+            # Legacy snapshot: derive the id counter once and record it
+            snapshot = self._read_snapshot()
+            ids = [r.get(ENTRY_ID, i) for i, r in enumerate(snapshot)]
+            meta = {"generation": 0, "seq": 0, "next_id": max(ids) + 1 if ids else 0}
+            atomic_write_json(self.meta_path, meta)
+        if meta["generation"] != self._generation:
+            self._generation = meta["generation"]
+            self._offset = 0
+            self._seq = meta["seq"]
+            self._next_id = meta["next_id"]
+            self._journal_rows = 0
+        ops, self._offset = self._read_journal(self._offset)
+        self._advance(ops)
+
+    def _write_ops(self, ops):
+        """Append ops to the journal with a single fsync (lock held)."""
+        ops = [{"seq": self._seq + i + 1, **op} for i, op in enumerate(ops)]
+        payload = "".join(
+            json.dumps(op, separators=(",", ":"), ensure_ascii=False, default=json_default) + "\n" for op in ops
+        )
+        with open(self.journal_path, "a+b") as f:
+            end = f.seek(0, os.SEEK_END)
+            if end > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # Terminate a torn line so it cannot swallow these ops
+                    payload = "\n" + payload
+            try:
+                f.write(payload.encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            except Exception:
+                # Take back whatever reached the file, so a failed commit leaves nothing to replay
+                f.truncate(end)
+                raise
+            self._offset = f.tell()
+        self._advance(ops)
+
+    @staticmethod
+    def _fold(snapshot, ops, base_seq):
+        """Apply journal ops newer than base_seq to snapshot records."""
+        rows = {}
+        for i, record in enumerate(snapshot):
+            entry_id = record.get(ENTRY_ID, i)
+            rows[entry_id] = {**record, ENTRY_ID: entry_id}
+        for op in ops:
+            if op.get("seq", 0) <= base_seq:
+                continue
+            if op["op"] == "insert":
+                for record in op["rows"]:
+                    rows.setdefault(record[ENTRY_ID], record)
+            elif op["op"] == "delete":
+                for entry_id in op["ids"]:
+                    rows.pop(entry_id, None)
+        return list(rows.values())
+
+    def _read_state(self):
+        """
+        Read snapshot and journal into a consistent list of records.
+
+        Retries if a compaction swaps the files underneath the reader.
+
+        Returns:
+            tuple: (records, metadata, journal offset, last folded seq)
+        """
+        while True:
+            meta = self._read_meta() or {"generation": 0, "seq": 0}
+            snapshot = self._read_snapshot()
+            ops, offset = self._read_journal(0)
+            if (self._read_meta() or {"generation": 0})["generation"] == meta["generation"]:
+                last_seq = max([meta["seq"]] + [op.get("seq", 0) for op in ops])
+                return self._fold(snapshot, ops, meta["seq"]), meta, offset, last_seq
+
+    def load(self, progress=None):
+        """
+        Load the full ledger.
+
+        The snapshot is streamed into column buffers rather than read and
+        parsed whole, then the journal ops are applied to the frame.
+
+        Args:
+            progress (callable, optional): Called as progress(bytes_read, total_bytes)
+
+        Returns:
+            pandas.DataFrame: Emissions data indexed by entry_id
+
+        Raises:
+            MemoryError: If the ledger would exceed the memory limit
+        """
+        return self._read_frame(progress=progress)
+
+    def read(self, start_date=None, end_date=None, columns=None, filters=None):
+        """
+        Read a slice of the ledger.
+
+        Each snapshot chunk is filtered as it streams in, so only the
+        matching rows and columns are ever held, not the full ledger.
+
+        Args:
+            start_date (datetime, optional): Inclusive start date
+            end_date (datetime, optional): Inclusive end date
+            columns (list, optional): Columns to return
+            filters (dict, optional): Column -> required value
+
+        Returns:
+            pandas.DataFrame: Matching entries indexed by entry_id
+        """
+        keep = None if columns is None else [ENTRY_ID] + [c for c in columns if c != ENTRY_ID]
+
+        def select(chunk):
+            return filter_frame(chunk, start_date, end_date, keep, filters)
+
+        data = self._read_frame(select)
+        if columns is not None:
+            data = data[[c for c in columns if c in data.columns]]
+        return data
+
+    def _read_frame(self, select=None, progress=None):
+        """
+        Read snapshot and journal into one frame, keeping what select keeps of each chunk.
+
+        Args:
+            select (callable, optional): Filters a chunk of records with an entry_id column
+            progress (callable, optional): Called as progress(bytes_read, total_bytes)
+
+        Returns:
+            pandas.DataFrame: Emissions data indexed by entry_id
+        """
+
+        def with_ids(chunk):
+            # Legacy snapshots: list position is the id
+            positions = pd.Series(chunk.index, index=chunk.index)
+            if ENTRY_ID in chunk.columns:
+                chunk[ENTRY_ID] = chunk[ENTRY_ID].fillna(positions)
+            else:
+                chunk[ENTRY_ID] = positions
+            return select(chunk) if select else chunk
+
+        while True:
+            meta = self._read_meta() or {"generation": 0, "seq": 0}
+            snapshot = pd.DataFrame()
+            if os.path.exists(self.path):
+                snapshot = load_json_frame(self.path, memory_limit=self.memory_limit, progress=progress, transform=with_ids)
+            ops, _ = self._read_journal(0)
+            if (self._read_meta() or {"generation": 0})["generation"] == meta["generation"]:
+                break
+        if ENTRY_ID not in snapshot.columns:
+            snapshot[ENTRY_ID] = pd.Series(dtype="int64")
+        ops = [op for op in ops if op.get("seq", 0) > meta["seq"]]
+        inserted = [record for op in ops if op["op"] == "insert" for record in op["rows"]]
+        deleted = {entry_id for op in ops if op["op"] == "delete" for entry_id in op["ids"]}
+        data = snapshot
+        if inserted:
+            inserted = pd.DataFrame(inserted)
+            if select:
+                inserted = select(inserted)
+            data = pd.concat([snapshot, inserted], ignore_index=True) if len(snapshot) else inserted
+            data = data.drop_duplicates(ENTRY_ID, keep="first")
+        if deleted:
+            data = data[~data[ENTRY_ID].isin(deleted)]
+        return frame_from_records(data)
+
+    def append(self, rows):
+        """
+        Append entries with a single journal write.
+
+        Args:
+            rows (pandas.DataFrame or list): New entries
+
+        Returns:
+            pandas.DataFrame: The entries indexed by their new entry ids
+        """
+        frame = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+        if frame.empty:
+            return frame
+        return self.commit(rows=frame)
+
+    def delete(self, entry_ids):
+        """
+        Delete entries by id with a single journal write.
+
+        Args:
+            entry_ids (iterable): Ids of the entries to delete
+        """
+        self.commit(entry_ids=entry_ids)
+
+    def commit(self, rows=None, entry_ids=None):
+        """
+        Journal inserts and deletes together with a single fsync.
+
+        Args:
+            rows (pandas.DataFrame, optional): New entries
+            entry_ids (iterable, optional): Ids of the entries to delete
+
+        Returns:
+            pandas.DataFrame: The new entries indexed by their entry ids, or None
+        """
+        frame = None if rows is None else (rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows))
+        ids = [int(i) for i in entry_ids or []]
+        ops = []
+        with self._locked():
+            self._sync()
+            if frame is not None and not frame.empty:
+                new_ids = pd.Index(range(self._next_id, self._next_id + len(frame)), name=ENTRY_ID)
+                frame = frame.set_axis(new_ids, axis=0)
+                ops.append({"op": "insert", "rows": records_from_frame(frame)})
+            if ids:
+                ops.append({"op": "delete", "ids": ids})
+            if ops:
+                self._write_ops(ops)
+        self._maybe_compact()
+        return frame
+
+    def rewrite(self, df):
+        """
+        Replace the whole ledger with a DataFrame and clear the journal.
+
+        Args:
+            df (pandas.DataFrame): Emissions data indexed by entry_id
+        """
+        if df.index.name != ENTRY_ID:
+            df = df.set_axis(pd.RangeIndex(len(df), name=ENTRY_ID), axis=0)
+        records = records_from_frame(df)
+        with self._locked():
+            self._sync()
+            next_id = max([self._next_id] + [r[ENTRY_ID] + 1 for r in records])
+            self._install(records, self._seq, next_id, tail=[])
+        self._backup(records)
+
+    def _install(self, records, seq, next_id, tail):
+        """Swap in a new snapshot, metadata and journal tail (lock held)."""
+        generation = (self._generation or 0) + 1
+        atomic_write_json(self.path, records)
+        atomic_write_json(self.meta_path, {"generation": generation, "seq": seq, "next_id": next_id})
+        directory = os.path.dirname(self.journal_path) or "."
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix="emissions_", suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            for op in tail:
+                f.write((json.dumps(op, separators=(",", ":"), ensure_ascii=False) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.journal_path)
+        self._generation = generation
+        self._offset = 0
+        self._seq = seq
+        self._next_id = next_id
+        self._journal_rows = 0
+        ops, self._offset = self._read_journal(0)
+        self._advance(ops)
+
+    def compact(self):
+        """
+        Fold the journal into a new snapshot.
+
+        The expensive read and fold run without the lock; only the final swap
+        holds it, carrying over any ops appended in the meantime.
+
+        Returns:
+            bool: True if a new snapshot was written
+        """
+        records, meta, offset, last_seq = self._read_state()
+        with self._locked():
+            self._sync()
+            if self._generation != meta["generation"]:
+                # Someone else compacted first
+                return False
+            tail, _ = self._read_journal(offset)
+            self._install(records, last_seq, self._next_id, tail)
+        self._backup(records)
+        return True
+
+    def _backup(self, records):
+        """Record a backup snapshot of freshly written snapshot records."""
+        if self.snapshots is not None:
+            self.snapshots.take(records, source=self.path)
+
+    def _maybe_compact(self):
+        """Start a background compaction once the journal is large enough."""
+        if self._journal_rows < self.compact_threshold:
+            return
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self._compact_quietly, daemon=True)
+        self._compactor.start()
+
+    def _compact_quietly(self):
+        """Run compaction in a background thread, logging failures."""
+        try:
+            self.compact()
+        except Exception as e:
+            print(f"Error compacting emissions journal: {str(e)}")
+
+
+class ParquetStore(EmissionsStore):
+    """
+    Columnar emissions store partitioned by month.
+
+    Entries live in ``month=YYYY-MM/part-*.parquet`` files with typed columns,
+    so a date-range query opens only the partitions it covers and reads only
+    the columns it asks for. Appends write a new part file per month touched;
+    a month's part files are merged once there are more than
+    ``PARTITION_FILE_LIMIT`` of them. Requires pyarrow.
+
+    ``_meta.json`` is the commit point. Ids are reserved in it (``next_id``)
+    before any part file is written, and a commit becomes visible with one
+    atomic meta write that advances ``committed`` and lists the ids it
+    deletes. Readers hide rows at or past ``committed``, rows whose ids are
+    listed as deleted and duplicate ids left by an interrupted merge.
+    A rewrite writes the new ledger into a fresh generation directory
+    (``gen-NNNNNN``, generation 0 being ``root`` itself) and switches to it
+    with the meta write. A crash therefore leaves the previous or the new
+    ledger, and the next write discards or finishes what was interrupted.
+    Readers retry when a writer removes a file from under them.
+
+    With a SnapshotManager, every rewrite is backed up, and so is the whole
+    ledger, in the background, after every ``BACKUP_ROWS`` rows written.
+    """
+
+    supports_pruning = True
+
+    def __init__(self, root, snapshots=None):
+        """
+        Initialize the ParquetStore class.
+
+        Args:
+            root (str): Directory holding the partitions
+            snapshots (SnapshotManager, optional): Backup repository for rewrites and periodic backups
+        """
+        if pq is None:
+            raise ImportError("The parquet storage backend requires pyarrow (pip install pyarrow)")
+        self.root = root
+        self.snapshots = snapshots
+        self.meta_path = os.path.join(root, "_meta.json")
+        self.lock_path = os.path.join(root, "_lock")
+        self.changes_path = os.path.join(root, "_changes.jsonl")
+        self._lock = threading.RLock()
+
+    def _locked(self):
+        """Serialize writers across threads and, where supported, processes."""
+        return file_lock(self.lock_path, self._lock)
+
+    def is_empty(self):
+        """Return True if nothing has been written yet."""
+        return not os.path.exists(self.meta_path)
+
+    def version(self):
+        """
+        Return the change log's inode and size as a change token.
+
+        Returns:
+            tuple: (inode, size), (0, 0) before the first write
+        """
+        try:
+            st = os.stat(self.changes_path)
+        except FileNotFoundError:
+            return (0, 0)
+        return (st.st_ino, st.st_size)
+
+    def changes_since(self, version):
+        """
+        Read the entries inserted and deleted since a version.
+
+        Every write appends a line naming the ids it inserted or deleted (and
+        the months they live in) to ``_changes.jsonl``; inserted rows are read
+        back from just those months. A rewrite or an oversized log replaces
+        the log with a reset marker, which sends readers back to a full load.
+
+        Args:
+            version (tuple): Token from version() or a previous call
+
+        Returns:
+            tuple: (inserted DataFrame indexed by entry_id, list of deleted ids, new version), or None
+        """
+        inode, offset = version
+        current = self.version()
+        if current == version:
+            return frame_from_records([]), [], version
+        if current[0] != inode and inode != 0:
+            return None
+        with open(self.changes_path, "rb") as f:
+            if offset > 0:
+                f.seek(offset - 1)
+                if f.read(1) != b"\n":
+                    # Size taken mid-write: replay the log, applying is idempotent
+                    offset = 0
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        ops = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+        if any(op["op"] == "reset" for op in ops):
+            return None
+        inserted = {i for op in ops if op["op"] == "insert" for i in op["ids"]}
+        months = sorted({m for op in ops if op["op"] == "insert" for m in op["months"]})
+        rows = self._scan(months=months)
+        rows = rows[rows.index.isin(inserted)].sort_index()
+        deleted = [i for op in ops if op["op"] == "delete" for i in op["ids"]]
+        return rows, deleted, (current[0], offset + end)
+
+    def _log_change(self, op, ids, months=None):
+        """Append a line to the change log, resetting it once it is too big (lock held)."""
+        try:
+            size = os.path.getsize(self.changes_path)
+        except FileNotFoundError:
+            size = 0
+        if op == "reset" or size > CHANGE_LOG_BYTES:
+            # A new file (new inode) tells readers to reload everything
+            tmp = self.changes_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"op": "reset"}) + "\n")
+            os.replace(tmp, self.changes_path)
+            if op == "reset":
+                return
+        line = {"op": op, "ids": [int(i) for i in ids]}
+        if months is not None:
+            line["months"] = months
+        with open(self.changes_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(line) + "\n")
+
+    def _base(self, generation):
+        """Return the directory holding the partitions of a generation."""
+        return self.root if not generation else os.path.join(self.root, f"gen-{generation:06d}")
+
+    def _months(self, base, start_date=None, end_date=None):
+        """List partition months under a generation directory overlapping a date range."""
+        if not os.path.isdir(base):
+            return []
+        months = sorted(d[len("month="):] for d in os.listdir(base) if d.startswith("month="))
+        if start_date:
+            lo = pd.Timestamp(start_date).strftime("%Y-%m")
+            months = [m for m in months if m == "none" or m >= lo]
+        if end_date:
+            hi = pd.Timestamp(end_date).strftime("%Y-%m")
+            months = [m for m in months if m == "none" or m <= hi]
+        if start_date or end_date:
+            # Rows without a valid date never match a date range
+            months = [m for m in months if m != "none"]
+        return months
+
+    def _files(self, base, month):
+        """List the part files of one partition."""
+        directory = os.path.join(base, f"month={month}")
+        return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".parquet"))
+
+    @staticmethod
+    def _normalize(frame):
+        """Cast entries to the stored column types."""
+        data = frame.reset_index() if frame.index.name == ENTRY_ID else frame.copy()
+        if "date" in data.columns:
+            data["date"] = pd.to_datetime(data["date"], errors="coerce")
+        for col in data.columns:
+            if col in NUMERIC_COLUMNS:
+                data[col] = pd.to_numeric(data[col], errors="coerce").astype("float64")
+            elif col not in ("date", ENTRY_ID):
+                data[col] = data[col].astype("string")
+        return data
+
+    def _write_part(self, base, month, data, name):
+        """Write one part file atomically."""
+        directory = os.path.join(base, f"month={month}")
+        os.makedirs(directory, exist_ok=True)
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        tmp = os.path.join(directory, f".{name}.tmp")
+        pq.write_table(table, tmp)
+        os.replace(tmp, os.path.join(directory, name))
+
+    def _write_months(self, base, data):
+        """Split normalized entries by month and write a part file for each."""
+        months = data["date"].dt.strftime("%Y-%m").fillna("none") if "date" in data.columns else pd.Series("none", index=data.index)
+        written = []
+        for month, part in data.groupby(months, sort=False):
+            self._write_part(base, month, part, f"part-{int(part[ENTRY_ID].min()):012d}.parquet")
+            written.append(month)
+        return written
+
+    def _read_files(self, files, meta, columns=None, start_date=None, end_date=None, progress=None):
+        """Read the rows of part files committed as of meta, pushing column selection and date bounds down to parquet."""
+        predicates = []
+        if start_date:
+            predicates.append(("date", ">=", pd.Timestamp(start_date)))
+        if end_date:
+            predicates.append(("date", "<=", pd.Timestamp(end_date)))
+        frames = []
+        for path in files:
+            # One handle for schema and rows: a part rewritten meanwhile is replaced, not changed
+            with open(path, "rb") as f:
+                available = pq.read_schema(f).names
+                wanted = available if columns is None else [c for c in available if c in columns or c == ENTRY_ID]
+                table = pq.read_table(f, columns=wanted, filters=predicates or None)
+            frames.append(table.to_pandas())
+            if progress:
+                progress(len(frames), len(files))
+        if not frames:
+            return frame_from_records([])
+        data = pd.concat(frames, ignore_index=True).set_index(ENTRY_ID)
+        # Uncommitted inserts, deleted ids not yet removed, and copies left by an interrupted merge
+        hidden = (data.index >= meta["committed"]) | data.index.isin(meta["deleted"]) | data.index.duplicated(keep="last")
+        return data[~hidden] if hidden.any() else data
+
+    def _scan(self, months=None, columns=None, start_date=None, end_date=None, progress=None):
+        """
+        Read the committed rows of some partitions while writers may be changing them.
+
+        A merge, a delete or a rewrite can remove a part file between listing
+        and reading it, and a commit can land in between. The read is repeated
+        until the metadata is the same before and after it; the last attempt
+        holds the writer lock, so readers never starve.
+
+        Args:
+            months (list, optional): Months to read; defaults to those overlapping the date range
+            columns (list, optional): Columns to read
+            start_date (datetime, optional): Inclusive start date
+            end_date (datetime, optional): Inclusive end date
+            progress (callable, optional): Called as progress(files_read, total_files)
+
+        Returns:
+            pandas.DataFrame: Committed entries indexed by entry_id
+        """
+        for attempt in range(READ_RETRIES + 1):
+            last = attempt == READ_RETRIES
+            with self._locked() if last else nullcontext():
+                meta = self._meta()
+                base = self._base(meta["generation"])
+                try:
+                    if months is None:
+                        wanted = self._months(base, start_date, end_date)
+                    else:
+                        wanted = [m for m in months if os.path.isdir(os.path.join(base, f"month={m}"))]
+                    files = [f for month in wanted for f in self._files(base, month)]
+                    data = self._read_files(files, meta, columns, start_date, end_date, progress)
+                except FileNotFoundError:
+                    if last:
+                        raise
+                    continue
+                if last or self._meta() == meta:
+                    return data
+
+    def read(self, start_date=None, end_date=None, columns=None, filters=None):
+        """
+        Read a slice of the ledger, opening only the partitions and columns needed.
+
+        Args:
+            start_date (datetime, optional): Inclusive start date
+            end_date (datetime, optional): Inclusive end date
+            columns (list, optional): Columns to return
+            filters (dict, optional): Column -> required value
+
+        Returns:
+            pandas.DataFrame: Matching entries indexed by entry_id
+        """
+        needed = None
+        if columns is not None:
+            needed = list(columns) + [c for c in (filters or {}) if c not in columns]
+        data = self._scan(columns=needed, start_date=start_date, end_date=end_date)
+        data = filter_frame(data, filters=filters)
+        if columns is not None:
+            data = data[[c for c in columns if c in data.columns]]
+        return data.sort_index()
+
+    def load(self, progress=None):
+        """
+        Load the full ledger.
+
+        Args:
+            progress (callable, optional): Called as progress(files_read, total_files)
+
+        Returns:
+            pandas.DataFrame: Emissions data indexed by entry_id
+        """
+        return self._scan(progress=progress).sort_index()
+
+    def _meta(self):
+        """
+        Read the metadata file.
+
+        Returns:
+            dict: generation (directory of the live partitions), next_id (first id not reserved),
+                committed (first id not committed) and deleted (ids deleted but maybe still in part files)
+        """
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            meta = {"next_id": 0}
+        meta.setdefault("generation", 0)
+        meta.setdefault("committed", meta["next_id"])
+        meta.setdefault("deleted", [])
+        return meta
+
+    def _next_id(self):
+        """Read the id counter (lock held)."""
+        return self._meta()["next_id"]
+
+    def _recover(self, meta):
+        """Clean up after a write or rewrite interrupted by a crash (lock held)."""
+        self._drop_stale_generations(meta)
+        if meta["next_id"] == meta["committed"] and not meta["deleted"]:
+            return meta
+        base = self._base(meta["generation"])
+        if meta["next_id"] > meta["committed"]:
+            # Part files are named after their first id, so uncommitted rows are whole files
+            for month in self._months(base):
+                for path in self._files(base, month):
+                    if int(os.path.basename(path)[len("part-"):-len(".parquet")]) >= meta["committed"]:
+                        os.remove(path)
+        if meta["deleted"]:
+            self._remove_rows(meta, set(meta["deleted"]))
+        meta = {**meta, "committed": meta["next_id"], "deleted": []}
+        atomic_write_json(self.meta_path, meta)
+        return meta
+
+    def _drop_stale_generations(self, meta):
+        """
+        Remove partitions that are not part of the live generation (lock held).
+
+        These are a rewrite that crashed before its commit point, the
+        generation a finished rewrite replaced, and the ``_old_month=*``
+        directories an interrupted rewrite of earlier versions moved aside.
+        Those are moved back, since that rewrite never committed.
+        """
+        if not os.path.isdir(self.root):
+            return
+        names = os.listdir(self.root)
+        retired = [d for d in names if d.startswith("_old_month=")]
+        if retired and meta["generation"] == 0:
+            for d in names:
+                if d.startswith("month="):
+                    shutil.rmtree(os.path.join(self.root, d))
+            for d in retired:
+                os.rename(os.path.join(self.root, d), os.path.join(self.root, d[len("_old_"):]))
+            names = os.listdir(self.root)
+        live = os.path.basename(self._base(meta["generation"]))
+        for d in names:
+            stale = d.startswith("_old_month=") or (d.startswith("gen-") and d != live)
+            if meta["generation"] and d.startswith("month="):
+                stale = True
+            if stale:
+                shutil.rmtree(os.path.join(self.root, d), ignore_errors=True)
+
+    def append(self, rows):
+        """
+        Append entries as new part files.
+
+        Args:
+            rows (pandas.DataFrame or list): New entries
+
+        Returns:
+            pandas.DataFrame: The entries indexed by their new entry ids
+        """
+        frame = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+        if frame.empty:
+            return frame
+        return self.commit(frame)
+
+    def delete(self, entry_ids):
+        """
+        Delete entries by id, rewriting only the part files that hold them.
+
+        Args:
+            entry_ids (iterable): Ids of the entries to delete
+        """
+        if entry_ids is not None and len(entry_ids):
+            self.commit(entry_ids=entry_ids)
+
+    def commit(self, rows=None, entry_ids=None):
+        """
+        Append and delete entries atomically.
+
+        Args:
+            rows (pandas.DataFrame, optional): New entries
+            entry_ids (iterable, optional): Ids of the entries to delete
+
+        Returns:
+            pandas.DataFrame: The new entries indexed by their entry ids, or None
+        """
+        frame = None if rows is None else rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+        deleted = sorted({int(i) for i in entry_ids}) if entry_ids is not None else []
+        with self._locked():
+            meta = self._recover(self._meta())
+            base = self._base(meta["generation"])
+            next_id = meta["next_id"]
+            months = []
+            if frame is not None and len(frame):
+                ids = pd.Index(range(next_id, next_id + len(frame)), name=ENTRY_ID)
+                frame = frame.set_axis(ids, axis=0)
+                next_id += len(frame)
+                # Reserve the ids before writing, so a crash never hands them out twice
+                atomic_write_json(self.meta_path, {**meta, "next_id": next_id})
+                months = self._write_months(base, self._normalize(frame))
+            # Commit point: the new rows appear and the deleted ones disappear together
+            meta = {**meta, "next_id": next_id, "committed": next_id, "deleted": deleted}
+            atomic_write_json(self.meta_path, meta)
+            try:
+                self._finish_commit(meta, frame, months)
+            except Exception as e:
+                # Committed already, so do not raise; the next write removes the deleted rows
+                print(f"Error tidying parquet partitions after a commit: {str(e)}")
+                self._reset_log_quietly()
+            self._snapshot_after((0 if frame is None else len(frame)) + len(deleted), self.root)
+        return frame
+
+    def _finish_commit(self, meta, frame, months):
+        """Log a commit, remove the rows it deleted and merge the partitions it grew (lock held)."""
+        if months:
+            self._log_change("insert", frame.index, months)
+        if meta["deleted"]:
+            self._log_change("delete", meta["deleted"])
+            self._remove_rows(meta, set(meta["deleted"]))
+        for month in months:
+            self._maybe_merge(meta, month)
+        if meta["deleted"]:
+            atomic_write_json(self.meta_path, {**meta, "deleted": []})
+
+    def _reset_log_quietly(self):
+        """Send readers back to a full load after a change may have gone unlogged (lock held)."""
+        try:
+            self._log_change("reset", [])
+        except Exception as e:
+            print(f"Error resetting parquet change log: {str(e)}")
+
+    def _maybe_merge(self, meta, month):
+        """Merge a partition's part files once there are too many (lock held)."""
+        base = self._base(meta["generation"])
+        files = self._files(base, month)
+        if len(files) <= PARTITION_FILE_LIMIT:
+            return
+        # A crash before the old parts are removed leaves duplicate ids, which readers drop
+        data = self._read_files(files, meta).reset_index()
+        name = f"part-{int(data[ENTRY_ID].min()):012d}.parquet"
+        self._write_part(base, month, data, name)
+        for path in files:
+            if os.path.basename(path) != name:
+                os.remove(path)
+
+    def _remove_rows(self, meta, ids):
+        """Rewrite the part files that hold some ids without them (lock held)."""
+        base = self._base(meta["generation"])
+        for month in self._months(base):
+            for path in self._files(base, month):
+                held = pq.read_table(path, columns=[ENTRY_ID]).column(ENTRY_ID).to_pylist()
+                if ids.isdisjoint(held):
+                    continue
+                data = pq.read_table(path).to_pandas()
+                data = data[~data[ENTRY_ID].isin(ids)]
+                if data.empty:
+                    os.remove(path)
+                else:
+                    self._write_part(base, month, data, os.path.basename(path))
+
+    def rewrite(self, df):
+        """
+        Replace the whole ledger with a DataFrame.
+
+        The new ledger is written as the next generation and switched to with
+        one meta write; the replaced generation is removed afterwards.
+
+        Args:
+            df (pandas.DataFrame): Emissions data indexed by entry_id
+        """
+        if df.index.name != ENTRY_ID:
+            df = df.set_axis(pd.RangeIndex(len(df), name=ENTRY_ID), axis=0)
+        with self._locked():
+            meta = self._recover(self._meta())
+            generation = meta["generation"] + 1
+            base = self._base(generation)
+            if len(df):
+                self._write_months(base, self._normalize(df))
+            next_id = max(meta["next_id"], int(df.index.max()) + 1 if len(df) else 0)
+            # Commit point: readers switch to the new generation
+            meta = {"generation": generation, "next_id": next_id, "committed": next_id, "deleted": []}
+            atomic_write_json(self.meta_path, meta)
+            self._reset_log_quietly()
+            try:
+                self._drop_stale_generations(meta)
+            except Exception as e:
+                # The next write retries
+                print(f"Error removing replaced parquet partitions: {str(e)}")
+        self._snapshot(df, self.root)
+
+
+class SQLiteStore(EmissionsStore):
+    """
+    Emissions store backed by a local SQLite database.
+
+    Filter columns are indexed, so date-range and scope/category queries and
+    their aggregates run inside SQLite instead of over a loaded DataFrame.
+    Inserts and deletes are single indexed transactions, durable once
+    committed (synchronous=FULL). WAL mode lets several processes read
+    while one writes.
+
+    With a SnapshotManager, every rewrite is backed up, and so is the whole
+    ledger, in the background, after every ``BACKUP_ROWS`` rows written.
+    """
+
+    supports_pruning = True
+    supports_aggregation = True
+
+    def __init__(self, path, snapshots=None):
+        """
+        Initialize the SQLiteStore class.
+
+        Args:
+            path (str): Database file
+            snapshots (SnapshotManager, optional): Backup repository for rewrites and periodic backups
+        """
+        self.path = path
+        self.snapshots = snapshots
+        self._local = threading.local()
+        self._columns = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._transaction() as conn:
+            columns = ", ".join(
+                [f"{ENTRY_ID} INTEGER PRIMARY KEY AUTOINCREMENT"]
+                + [f'"{c}" TEXT' for c in TEXT_COLUMNS]
+                + [f'"{c}" REAL' for c in NUMERIC_COLUMNS]
+            )
+            conn.execute(f"CREATE TABLE IF NOT EXISTS emissions ({columns})")
+            for col in INDEXED_COLUMNS:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS idx_emissions_{col} ON emissions ("{col}")')
+            # Sequence-numbered log of inserted and deleted ids for change feeds
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT NOT NULL, {ENTRY_ID} INTEGER)"
+            )
+
+    def version(self):
+        """
+        Return the last change sequence number as a change token.
+
+        Returns:
+            int: Sequence number of the newest change record
+        """
+        row = self._connection().execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        return row[0] if row else 0
+
+    def changes_since(self, version):
+        """
+        Read the entries inserted and deleted since a version from the change log.
+
+        Args:
+            version (int): Token from version() or a previous call
+
+        Returns:
+            tuple: (inserted DataFrame indexed by entry_id, list of deleted ids, new version),
+                or None if the log no longer reaches back that far or the ledger was rewritten
+        """
+        conn = self._connection()
+        conn.execute("BEGIN")  # one read snapshot for log and rows
+        try:
+            log = conn.execute(f"SELECT seq, op, {ENTRY_ID} FROM changes WHERE seq > ? ORDER BY seq", (version,)).fetchall()
+            if not log:
+                return frame_from_records([]), [], version
+            first = conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+            if first > version + 1 or any(op == "reset" for _, op, _ in log):
+                return None
+            inserted = [entry_id for _, op, entry_id in log if op == "insert"]
+            frames = []
+            for start in range(0, len(inserted), 500):
+                chunk = inserted[start:start + 500]
+                marks = ", ".join("?" for _ in chunk)
+                frames.append(pd.read_sql_query(f"SELECT * FROM emissions WHERE {ENTRY_ID} IN ({marks})", conn, params=chunk))
+            rows = pd.concat(frames).set_index(ENTRY_ID) if frames else frame_from_records([])
+            deleted = [entry_id for _, op, entry_id in log if op == "delete"]
+            return rows, deleted, log[-1][0]
+        finally:
+            conn.execute("COMMIT")
+
+    def _connection(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # NORMAL would skip the fsync per commit and can lose the last transactions on power loss
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Run statements in one write transaction."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _table_columns(self, conn):
+        """List the columns of the emissions table."""
+        return [row[1] for row in conn.execute("PRAGMA table_info(emissions)")]
+
+    def is_empty(self):
+        """Return True if the table has never held a row."""
+        conn = self._connection()
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'emissions'").fetchone()
+        return row is None and conn.execute("SELECT 1 FROM emissions LIMIT 1").fetchone() is None
+
+    @staticmethod
+    def _where(start_date=None, end_date=None, filters=None):
+        """Build a WHERE clause and its parameters."""
+        clauses, params = [], []
+        if start_date:
+            clauses.append("date >= ?")
+            params.append(pd.Timestamp(start_date).strftime("%Y-%m-%d"))
+        if end_date:
+            clauses.append("date <= ?")
+            params.append(pd.Timestamp(end_date).strftime("%Y-%m-%d"))
+        for col, value in (filters or {}).items():
+            if value is not None:
+                clauses.append(f'"{col}" = ?')
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def read(self, start_date=None, end_date=None, columns=None, filters=None):
+        """
+        Read a slice of the ledger with an indexed query.
+
+        Args:
+            start_date (datetime, optional): Inclusive start date
+            end_date (datetime, optional): Inclusive end date
+            columns (list, optional): Columns to return
+            filters (dict, optional): Column -> required value
+
+        Returns:
+            pandas.DataFrame: Matching entries indexed by entry_id
+        """
+        conn = self._connection()
+        available = self._table_columns(conn)
+        filters = {c: v for c, v in (filters or {}).items() if c in available}
+        selected = available if columns is None else [ENTRY_ID] + [c for c in columns if c in available and c != ENTRY_ID]
+        where, params = self._where(start_date, end_date, filters)
+        select = ", ".join(f'"{c}"' for c in selected)
+        data = pd.read_sql_query(f"SELECT {select} FROM emissions{where} ORDER BY {ENTRY_ID}", conn, params=params)
+        return data.set_index(ENTRY_ID)
+
+    def load(self, progress=None):
+        """
+        Load the full ledger.
+
+        Args:
+            progress (callable, optional): Called as progress(1, 1) once loaded
+
+        Returns:
+            pandas.DataFrame: Emissions data indexed by entry_id
+        """
+        data = self.read()
+        if progress:
+            progress(1, 1)
+        return data
+
+    def aggregate(self, by, start_date=None, end_date=None, filters=None, measure="emissions_kgCO2e"):
+        """
+        Sum a measure by groups with a SQL GROUP BY.
+
+        Args:
+            by (list): Columns to group by; "month" groups by YYYY-MM
+            start_date (datetime, optional): Inclusive start date
+            end_date (datetime, optional): Inclusive end date
+            filters (dict, optional): Column -> required value
+            measure (str, optional): Column to sum
+
+        Returns:
+            pandas.DataFrame: Group columns plus the summed measure and an "entries" count
+        """
+        keys = ["substr(date, 1, 7) AS month" if c == "month" else f'"{c}"' for c in by]
+        where, params = self._where(start_date, end_date, filters)
+        # Like pandas groupby, leave out rows with a missing group key
+        missing = [f'"{"date" if c == "month" else c}" IS NOT NULL' for c in by]
+        if missing:
+            where += (" AND " if where else " WHERE ") + " AND ".join(missing)
+        select = ", ".join(keys + [f'COALESCE(SUM("{measure}"), 0) AS "{measure}"', "COUNT(*) AS entries"])
+        group = f" GROUP BY {', '.join(str(i + 1) for i in range(len(by)))}" if by else ""
+        return pd.read_sql_query(f"SELECT {select} FROM emissions{where}{group}", self._connection(), params=params)
+
+    def _insert(self, conn, frame):
+        """Insert normalized entries, adding columns the table lacks (transaction held)."""
+        available = self._table_columns(conn)
+        data = frame.reset_index()
+        for col in data.columns:
+            if col not in available:
+                kind = "REAL" if col in NUMERIC_COLUMNS else "TEXT"
+                conn.execute(f'ALTER TABLE emissions ADD COLUMN "{col}" {kind}')
+        for col in data.columns:
+            if col in NUMERIC_COLUMNS:
+                data[col] = pd.to_numeric(data[col], errors="coerce")
+            elif col == "date":
+                data[col] = pd.to_datetime(data[col], errors="coerce").dt.strftime("%Y-%m-%d")
+        data = data.astype(object).where(data.notna(), None)
+        names = ", ".join(f'"{c}"' for c in data.columns)
+        marks = ", ".join("?" for _ in data.columns)
+        conn.executemany(f"INSERT INTO emissions ({names}) VALUES ({marks})", data.itertuples(index=False, name=None))
+
+    def append(self, rows):
+        """
+        Append entries in one transaction.
+
+        Args:
+            rows (pandas.DataFrame or list): New entries
+
+        Returns:
+            pandas.DataFrame: The entries indexed by their new entry ids
+        """
+        frame = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+        if frame.empty:
+            return frame
+        return self.commit(rows=frame)
+
+    def delete(self, entry_ids):
+        """
+        Delete entries by id in one transaction.
+
+        Args:
+            entry_ids (iterable): Ids of the entries to delete
+        """
+        self.commit(entry_ids=entry_ids)
+
+    def commit(self, rows=None, entry_ids=None):
+        """
+        Insert and delete entries in one transaction.
+
+        Args:
+            rows (pandas.DataFrame, optional): New entries
+            entry_ids (iterable, optional): Ids of the entries to delete
+
+        Returns:
+            pandas.DataFrame: The new entries indexed by their entry ids, or None
+        """
+        frame = None if rows is None else (rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows))
+        ids = [(int(i),) for i in entry_ids or []]
+        if (frame is None or frame.empty) and not ids:
+            return frame
+        with self._transaction() as conn:
+            if frame is not None and not frame.empty:
+                row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'emissions'").fetchone()
+                next_id = row[0] + 1 if row else 0
+                frame = frame.set_axis(pd.Index(range(next_id, next_id + len(frame)), name=ENTRY_ID), axis=0)
+                self._insert(conn, frame)
+                conn.executemany(f"INSERT INTO changes (op, {ENTRY_ID}) VALUES ('insert', ?)", ((int(i),) for i in frame.index))
+            if ids:
+                conn.executemany(f"DELETE FROM emissions WHERE {ENTRY_ID} = ?", ids)
+                conn.executemany(f"INSERT INTO changes (op, {ENTRY_ID}) VALUES ('delete', ?)", ids)
+            conn.execute("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?", (CHANGE_LOG_ROWS,))
+        self._snapshot_after((0 if frame is None else len(frame)) + len(ids), self.path)
+        return frame
+
+    def rewrite(self, df):
+        """
+        Replace the whole ledger with a DataFrame.
+
+        Args:
+            df (pandas.DataFrame): Emissions data indexed by entry_id
+        """
+        if df.index.name != ENTRY_ID:
+            df = df.set_axis(pd.RangeIndex(len(df), name=ENTRY_ID), axis=0)
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM emissions")
+            if len(df):
+                self._insert(conn, df)
+            conn.execute("DELETE FROM changes")
+            conn.execute("INSERT INTO changes (op) VALUES ('reset')")
+        self._snapshot(df, self.path)
+
+
+def open_store(backend=None, data_dir=DATA_DIR):
+    """
+    Open the configured emissions store.
+
+    A new, empty store is seeded from an existing ``emissions.json`` so that
+    switching backends keeps the ledger.
+
+    Args:
+        backend (str, optional): "json", "parquet" or "sqlite"; defaults to STORAGE_BACKEND
+        data_dir (str, optional): Data directory
+
+    Returns:
+        EmissionsStore: The store
+    """
+    from snapshots import SnapshotManager
+
+    backend = backend or STORAGE_BACKEND
+    json_path = os.path.join(data_dir, "emissions.json")
+    snapshots = SnapshotManager(os.path.join(data_dir, "snapshots"))
+    if backend == "json":
+        return JournalStore(json_path, snapshots=snapshots)
+    if backend == "parquet":
+        store = ParquetStore(os.path.join(data_dir, "emissions_parquet"), snapshots=snapshots)
+    elif backend == "sqlite":
+        store = SQLiteStore(os.path.join(data_dir, "emissions.db"), snapshots=snapshots)
+    else:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    legacy = JournalStore(json_path)
+    if store.is_empty() and not legacy.is_empty():
+        store.rewrite(legacy.load())
+    return store
@@ -0,0 +1,54 @@
+"""
+Shared fixtures for the YourCarbonFootprint tests.
+The application is a set of top-level modules, so the repository root is put on sys.path.
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_entries(n, start="2024-01-05", quantity=1.0):
+    """Build n valid entries, one day apart."""
+    dates = pd.date_range(start, periods=n, freq="D").strftime("%Y-%m-%d")
+    return pd.DataFrame({
+        "date": dates,
+        "scope": "Scope 1",
+        "category": "Mobile Combustion",
+        "activity": "Diesel",
+        "quantity": [quantity + i for i in range(n)],
+        "unit": "liter",
+        "emission_factor": 2.0,
+        "emissions_kgCO2e": [2.0 * (quantity + i) for i in range(n)],
+        "notes": [f"note {i}" for i in range(n)],
+    })
+
+
+@pytest.fixture
+def entries():
+    """Five valid entries."""
+    return make_entries(5)
+
+
+@pytest.fixture
+def handler(tmp_path, monkeypatch):
+    """Build DataHandlers on a fresh data directory and a fresh factor registry."""
+    import factor_registry
+    from data_handler import DataHandler
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(factor_registry, "_default", None)
+    os.makedirs("data")
+    handlers = []
+
+    def make(backend="json"):
+        handlers.append(DataHandler(backend))
+        return handlers[-1]
+
+    yield make
+    for dh in handlers:
+        dh.writer.close()
@@ -0,0 +1,109 @@
+"""Incrementally maintained dashboard aggregates."""
+
+import pandas as pd
+import pytest
+
+from aggregates import MaterializedAggregates
+from conftest import make_entries
+
+
+def mixed_entries():
+    """Entries across two scopes, two categories and two months."""
+    data = make_entries(6, start="2024-01-29")
+    data.loc[[1, 3, 5], "scope"] = "Scope 2"
+    data.loc[[1, 3, 5], "category"] = "Purchased Electricity"
+    return data
+
+
+def sorted_breakdown(aggregates, by):
+    return aggregates.breakdown(by).sort_values(list(by)).reset_index(drop=True)
+
+
+def expected_breakdown(data, by):
+    data = data.assign(month=pd.to_datetime(data["date"]).dt.strftime("%Y-%m"))
+    grouped = data.groupby(list(by))["emissions_kgCO2e"].agg(["sum", "size"]).reset_index()
+    return grouped.rename(columns={"sum": "emissions_kgCO2e", "size": "entries"})
+
+
+def test_rebuild_matches_groupby():
+    data = mixed_entries()
+    aggregates = MaterializedAggregates()
+    aggregates.rebuild(data)
+    assert aggregates.ready
+    for by in [("scope",), ("category",), ("month", "scope")]:
+        result = sorted_breakdown(aggregates, by)
+        expected = expected_breakdown(data, by)
+        assert result[list(by)].values.tolist() == expected[list(by)].values.tolist()
+        assert result["emissions_kgCO2e"].tolist() == pytest.approx(expected["emissions_kgCO2e"].tolist())
+        assert result["entries"].tolist() == expected["entries"].tolist()
+
+
+def test_totals():
+    data = mixed_entries()
+    aggregates = MaterializedAggregates()
+    aggregates.rebuild(data)
+    totals = aggregates.totals()
+    assert totals["total"] == pytest.approx(data["emissions_kgCO2e"].sum())
+    assert totals["entries"] == 6
+    assert totals["latest"] == pd.Timestamp("2024-02-03")
+
+
+def test_add_and_remove_match_a_rebuild():
+    data = mixed_entries()
+    aggregates = MaterializedAggregates()
+    aggregates.rebuild(data.iloc[:3])
+    aggregates.add(data.iloc[3:])
+    aggregates.remove(data.iloc[[0, 4]])
+    rebuilt = MaterializedAggregates()
+    rebuilt.rebuild(data.drop(index=[0, 4]))
+    assert aggregates.totals()["total"] == pytest.approx(rebuilt.totals()["total"])
+    assert aggregates.totals()["entries"] == rebuilt.totals()["entries"]
+    for by in aggregates.groupings:
+        pd.testing.assert_frame_equal(sorted_breakdown(aggregates, by), sorted_breakdown(rebuilt, by))
+
+
+def test_emptied_groups_and_dates_are_dropped():
+    data = mixed_entries()
+    aggregates = MaterializedAggregates()
+    aggregates.rebuild(data)
+    aggregates.remove(data[data["scope"] == "Scope 2"])
+    assert aggregates.breakdown(["scope"])["scope"].tolist() == ["Scope 1"]
+    aggregates.remove(data.iloc[[4]])
+    assert aggregates.totals()["latest"] == pd.Timestamp("2024-01-31")
+
+
+def test_missing_keys_and_values():
+    data = make_entries(3).astype({"emissions_kgCO2e": object})
+    data.loc[0, "scope"] = None
+    data.loc[1, "emissions_kgCO2e"] = "n/a"
+    aggregates = MaterializedAggregates()
+    aggregates.rebuild(data)
+    scope = aggregates.breakdown(["scope"])
+    assert scope["entries"].tolist() == [2]
+    assert scope["emissions_kgCO2e"].tolist() == [pytest.approx(6.0)]
+    assert aggregates.totals()["entries"] == 3
+
+
+def test_version_changes_on_every_update(entries):
+    aggregates = MaterializedAggregates()
+    versions = [aggregates.version]
+    aggregates.rebuild(entries)
+    versions.append(aggregates.version)
+    aggregates.add(entries.iloc[:0])
+    versions.append(aggregates.version)
+    aggregates.remove(entries.iloc[:1])
+    versions.append(aggregates.version)
+    assert versions[1] > versions[0]
+    assert versions[2] == versions[1]
+    assert versions[3] > versions[2]
+
+
+def test_clear_and_unknown_grouping(entries):
+    aggregates = MaterializedAggregates(groupings=[("scope",)])
+    aggregates.rebuild(entries)
+    with pytest.raises(KeyError):
+        aggregates.breakdown(["category"])
+    aggregates.clear()
+    assert not aggregates.ready
+    assert aggregates.totals() == {"total": 0.0, "entries": 0, "latest": None}
+    assert aggregates.breakdown(["scope"]).empty
@@ -0,0 +1,99 @@
+"""Anomaly scoring of incoming entries."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from anomaly import ANOMALY_MIN_COUNT, ANOMALY_THRESHOLD, SKETCH_ACCURACY, AnomalyDetector, QuantileSketch
+from conftest import make_entries
+
+
+def history(n=20, quantity=100.0):
+    """Entries of one key whose quantities vary by a few percent."""
+    data = make_entries(n)
+    data["quantity"] = quantity * (1 + 0.05 * np.sin(np.arange(n)))
+    data["emissions_kgCO2e"] = data["quantity"] * data["emission_factor"]
+    return data
+
+
+def incoming(quantity, **columns):
+    """One new entry like those in history()."""
+    data = make_entries(1, start="2024-06-01").assign(quantity=quantity, emissions_kgCO2e=2.0 * quantity, **columns)
+    return data.set_index(pd.Index([100]))
+
+
+def test_sketch_quantiles_are_within_the_accuracy():
+    values = np.random.default_rng(0).lognormal(3, 1.5, 5000)
+    sketch = QuantileSketch()
+    for bucket, n in pd.Series(sketch.buckets(values)).value_counts().items():
+        sketch.adjust(bucket, n)
+    for q in [0.1, 0.25, 0.5, 0.75, 0.9]:
+        exact = np.quantile(values, q)
+        assert sketch.quantile(q) == pytest.approx(exact, rel=2 * SKETCH_ACCURACY)
+    assert sketch.count == 5000
+    assert np.isnan(QuantileSketch().quantile(0.5))
+
+
+def test_unit_mistake_is_flagged_with_a_reason():
+    detector = AnomalyDetector()
+    detector.rebuild(history())
+    result = detector.score(pd.concat([incoming(101.0), incoming(100000.0).set_axis([101])]))
+    assert result["anomaly"].tolist() == [False, True]
+    assert result.loc[100, "score"] < ANOMALY_THRESHOLD < result.loc[101, "score"]
+    assert result.loc[100, "reason"] is None
+    assert "is far from the usual" in result.loc[101, "reason"]
+
+
+def test_keys_need_enough_history():
+    detector = AnomalyDetector()
+    detector.rebuild(history(ANOMALY_MIN_COUNT - 1))
+    result = detector.score(incoming(100000.0))
+    assert not result["anomaly"].any()
+    assert result["score"].isna().all()
+    detector.add(history(1))
+    assert detector.score(incoming(100000.0))["anomaly"].all()
+
+
+def test_other_keys_and_non_positive_values_are_not_scored():
+    detector = AnomalyDetector()
+    detector.rebuild(history())
+    result = detector.score(pd.concat([
+        incoming(100000.0, activity="Petrol"),
+        incoming(-5.0, emission_factor=0.0).set_axis([101]),
+    ]))
+    assert result["score"].isna().all()
+    assert not result["anomaly"].any()
+
+
+def test_flags_need_the_mean_and_the_median_to_agree():
+    data = history()
+    data.loc[:2, ["quantity", "emissions_kgCO2e"]] = [1e6, 2e6]
+    detector = AnomalyDetector()
+    detector.rebuild(data)
+    # Far from the skewed mean in standard deviations, but close to the median
+    result = detector.score(incoming(100.0))
+    assert 0 <= result["score"].iloc[0] < ANOMALY_THRESHOLD
+    assert not result["anomaly"].any()
+
+
+def test_removing_entries_matches_a_rebuild():
+    data = history(30)
+    detector = AnomalyDetector()
+    detector.rebuild(data)
+    detector.add(history(5, quantity=1000.0).set_axis(range(30, 35)))
+    detector.remove(history(5, quantity=1000.0).set_axis(range(30, 35)))
+    detector.remove(data.iloc[:10])
+    rebuilt = AnomalyDetector()
+    rebuilt.rebuild(data.iloc[10:])
+    probe = pd.concat([incoming(q).set_axis([i]) for i, q in enumerate([50.0, 100.0, 200.0, 1000.0])])
+    assert detector.score(probe)["score"].tolist() == pytest.approx(rebuilt.score(probe)["score"].tolist())
+
+
+def test_handler_rejects_anomalies_unless_allowed(handler):
+    dh = handler()
+    for i in range(ANOMALY_MIN_COUNT + 1):
+        assert dh.add_emission_entry(f"2024-01-{i + 1:02d}", "Scope 1", "Mobile Combustion", "Diesel", 100 + i, "liter", 2.0)
+    assert not dh.add_emission_entry("2024-02-01", "Scope 1", "Mobile Combustion", "Diesel", 100000, "liter", 2.0)
+    assert dh.add_emission_entry("2024-02-01", "Scope 1", "Mobile Combustion", "Diesel", 100000, "liter", 2.0,
+                                 allow_anomalies=True)
+    assert len(dh.emissions_data) == ANOMALY_MIN_COUNT + 2
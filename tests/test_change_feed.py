@@ -0,0 +1,99 @@
+"""Cross-process change notification."""
+
+import time
+
+import pytest
+
+from change_feed import ChangeFeed
+from conftest import make_entries
+from storage import JournalStore, SQLiteStore
+
+
+def open_pair(backend, tmp_path):
+    """Two handles on one store, standing in for two processes."""
+    if backend == "json":
+        return [JournalStore(str(tmp_path / "emissions.json")) for _ in range(2)]
+    if backend == "sqlite":
+        return [SQLiteStore(str(tmp_path / "emissions.db")) for _ in range(2)]
+    pytest.importorskip("pyarrow")
+    from storage import ParquetStore
+    return [ParquetStore(str(tmp_path / "emissions_parquet")) for _ in range(2)]
+
+
+class Replica:
+    """Subscriber rebuilding the set of live ids from published changes."""
+
+    def __init__(self, store):
+        self.store = store
+        self.ids = set(store.load().index)
+        self.resets = 0
+
+    def on_change(self, inserted, deleted):
+        self.ids |= set(inserted.index)
+        self.ids -= set(deleted)
+
+    def on_reset(self):
+        self.resets += 1
+        self.ids = set(self.store.load().index)
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite", "parquet"])
+def test_replaying_the_feed_reproduces_the_ledger(backend, tmp_path, entries):
+    reader, writer = open_pair(backend, tmp_path)
+    writer.append(entries)
+    feed = ChangeFeed(reader)
+    replica = Replica(reader)
+    feed.subscribe(replica.on_change, replica.on_reset)
+    writer.append(make_entries(3))
+    assert feed.poll()
+    writer.commit(rows=make_entries(1), entry_ids=[0, 6])
+    writer.delete([2])
+    assert feed.poll()
+    assert not feed.poll()
+    assert replica.ids == set(writer.load().index) == {1, 3, 4, 5, 7, 8}
+    assert replica.resets == 0
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite", "parquet"])
+def test_rewrite_resets_subscribers(backend, tmp_path, entries):
+    reader, writer = open_pair(backend, tmp_path)
+    writer.append(entries)
+    feed = ChangeFeed(reader)
+    replica = Replica(reader)
+    feed.subscribe(replica.on_change, replica.on_reset)
+    writer.rewrite(writer.load().head(2))
+    feed.poll()
+    assert replica.resets == 1
+    assert replica.ids == {0, 1}
+
+
+def test_subscriber_errors_do_not_stop_the_feed(tmp_path, entries):
+    reader, writer = open_pair("json", tmp_path)
+    feed = ChangeFeed(reader)
+    seen = []
+
+    def broken(inserted, deleted):
+        raise RuntimeError("boom")
+
+    feed.subscribe(broken)
+    feed.subscribe(lambda inserted, deleted: seen.append(list(inserted.index)))
+    writer.append(entries)
+    assert feed.poll()
+    assert seen == [[0, 1, 2, 3, 4]]
+
+
+def test_background_polling(tmp_path, entries):
+    reader, writer = open_pair("json", tmp_path)
+    feed = ChangeFeed(reader, interval=0.01)
+    published = []
+    feed.subscribe(lambda inserted, deleted: published.append(len(inserted)))
+    feed.start()
+    try:
+        writer.append(entries)
+        for _ in range(500):
+            if published:
+                break
+            time.sleep(0.01)
+    finally:
+        feed.stop()
+    assert published == [5]
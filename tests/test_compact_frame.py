@@ -0,0 +1,49 @@
+"""Compact session frames and the shared notes store."""
+
+import pandas as pd
+
+from compact_frame import NotesStore, append_compact, compact_frame
+from conftest import make_entries
+from storage import JournalStore
+
+
+def stored(entries):
+    return entries.set_axis(pd.RangeIndex(len(entries), name="entry_id"), axis=0)
+
+
+def test_compact_frame_dtypes(entries):
+    compact = compact_frame(entries, float32=True)
+    assert "notes" not in compact.columns
+    assert isinstance(compact["scope"].dtype, pd.CategoricalDtype)
+    assert compact["quantity"].dtype == "float32"
+    assert compact["emissions_kgCO2e"].dtype == "float64"
+    assert pd.api.types.is_datetime64_any_dtype(compact["date"])
+
+
+def test_compact_frame_is_smaller():
+    entries = make_entries(5000)
+    assert compact_frame(entries).memory_usage(deep=True).sum() < entries.memory_usage(deep=True).sum() / 3
+
+
+def test_append_compact_keeps_categories(entries):
+    compact = compact_frame(stored(entries))
+    rows = make_entries(2).assign(scope="Scope 3", country="India").set_axis(pd.RangeIndex(5, 7, name="entry_id"), axis=0)
+    combined = append_compact(compact, rows)
+    assert isinstance(combined["scope"].dtype, pd.CategoricalDtype)
+    assert isinstance(combined["country"].dtype, pd.CategoricalDtype)
+    assert combined["scope"].tolist() == ["Scope 1"] * 5 + ["Scope 3"] * 2
+    assert combined["country"].isna().sum() == 5
+
+
+def test_notes_are_read_once_and_follow_changes(tmp_path, entries):
+    store = JournalStore(str(tmp_path / "emissions.json"))
+    store.append(entries)
+    notes = NotesStore(store)
+    compact = compact_frame(store.load())
+    assert notes.attach(compact)["notes"].tolist() == entries["notes"].tolist()
+    new = store.append(make_entries(1).assign(notes="late"))
+    notes.update(new)
+    notes.remove([0])
+    shown = notes.attach(compact_frame(store.load()))["notes"]
+    assert pd.isna(shown.loc[0])
+    assert shown.loc[1:].tolist() == ["note 1", "note 2", "note 3", "note 4", "late"]
@@ -0,0 +1,93 @@
+"""The pre-aggregated emissions cube."""
+
+import pandas as pd
+import pytest
+
+from conftest import make_entries
+from cube import CUBE_DIMENSIONS, EmissionsCube
+
+
+def ledger():
+    """Entries across scopes, categories, facilities and three months."""
+    data = make_entries(9, start="2024-01-20", quantity=1.0)
+    data.index = range(0, 90, 10)
+    data = data.assign(
+        date=pd.date_range("2024-01-20", periods=9, freq="7D").strftime("%Y-%m-%d"),
+        facility=["Plant A", "Plant B", None] * 3,
+        country="DE",
+    )
+    data.loc[[10, 40, 70], "scope"] = "Scope 2"
+    data.loc[[10, 40, 70], "category"] = "Purchased Electricity"
+    return data
+
+
+def expected_rollup(data, by, mask=None):
+    data = data.assign(month=pd.to_datetime(data["date"]).dt.strftime("%Y-%m"))
+    if mask is not None:
+        data = data[mask(data)]
+    grouped = data.groupby(by)["emissions_kgCO2e"].agg(["sum", "size"]).reset_index()
+    return grouped.rename(columns={"sum": "emissions_kgCO2e", "size": "entries"})
+
+
+def assert_rollup(result, expected, by):
+    result = result.sort_values(by).reset_index(drop=True)
+    assert result[by].values.tolist() == expected[by].values.tolist()
+    assert result["emissions_kgCO2e"].tolist() == pytest.approx(expected["emissions_kgCO2e"].tolist())
+    assert result["entries"].tolist() == expected["entries"].tolist()
+
+
+@pytest.mark.parametrize("by", [["scope"], ["month"], ["month", "category"], ["country", "scope"]])
+def test_rollup_matches_groupby(by):
+    data = ledger()
+    cube = EmissionsCube()
+    cube.rebuild(data)
+    assert_rollup(cube.rollup(by), expected_rollup(data, by), by)
+
+
+def test_cells_are_the_finest_grain():
+    cube = EmissionsCube()
+    cube.rebuild(ledger())
+    cells = cube.cells()
+    assert list(cells.columns) == CUBE_DIMENSIONS + ["emissions_kgCO2e", "entries"]
+    assert cells["entries"].sum() == 9
+    assert cube.cells() is cells
+
+
+def test_grand_total_keeps_rows_with_missing_dimensions():
+    data = ledger()
+    cube = EmissionsCube()
+    cube.rebuild(data)
+    total = cube.rollup([])
+    assert total["entries"].tolist() == [9]
+    assert total["emissions_kgCO2e"].tolist() == [pytest.approx(data["emissions_kgCO2e"].sum())]
+    # business_unit is absent from the data entirely
+    assert cube.cells()["business_unit"].isna().all()
+
+
+def test_filters_and_month_range():
+    data = ledger()
+    cube = EmissionsCube()
+    cube.rebuild(data)
+    result = cube.rollup(["facility"], filters={"scope": "Scope 1", "country": None},
+                         start_month="2024-02", end_month="2024-02")
+    expected = expected_rollup(data, ["facility"], lambda d: (d["scope"] == "Scope 1") & (d["month"] == "2024-02"))
+    assert_rollup(result, expected, ["facility"])
+    listed = cube.rollup([], filters={"facility": ["Plant A", "Plant B"]})
+    assert listed["entries"].tolist() == [6]
+
+
+def test_add_and_remove_drill_down_like_a_rebuild():
+    data = ledger()
+    cube = EmissionsCube()
+    cube.rebuild(data.iloc[:4])
+    before = cube.cells()
+    cube.add(data.iloc[4:])
+    cube.remove(data.loc[[10, 50]])
+    assert cube.cells() is not before
+    rebuilt = EmissionsCube()
+    rebuilt.rebuild(data.drop(index=[10, 50]))
+    by = ["month", "scope", "facility"]
+    expected = rebuilt.rollup(by).sort_values(by).reset_index(drop=True)
+    assert_rollup(cube.rollup(by), expected, by)
+    cube.remove(data.drop(index=[10, 50]))
+    assert cube.cells().empty
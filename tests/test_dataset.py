@@ -0,0 +1,59 @@
+"""The process-wide shared dataset."""
+
+import pytest
+
+from aggregates import MaterializedAggregates
+from conftest import make_entries
+from dataset import SharedDataset
+from storage import JournalStore
+
+
+def test_views_share_one_load(tmp_path, entries):
+    store = JournalStore(str(tmp_path / "emissions.json"))
+    store.append(entries)
+    loads = []
+    load = store.load
+    store.load = lambda progress=None: loads.append(1) or load(progress)
+    dataset = SharedDataset(store)
+    first, second = dataset.view(), dataset.view()
+    assert len(loads) == 1
+    assert list(first.index) == list(second.index) == [0, 1, 2, 3, 4]
+    assert first is not second
+
+
+def test_writes_from_another_process_arrive_without_a_reload(tmp_path, entries):
+    path = str(tmp_path / "emissions.json")
+    JournalStore(path).append(entries)
+    dataset = SharedDataset(JournalStore(path), aggregates=MaterializedAggregates())
+    dataset.view()
+    other = JournalStore(path)
+    other.append(make_entries(1, quantity=10))
+    other.delete([0])
+    view = dataset.view()
+    assert list(view.index) == [1, 2, 3, 4, 5]
+    assert dataset.aggregates.totals()["total"] == pytest.approx(view["emissions_kgCO2e"].sum())
+
+
+def test_local_writes_are_applied_once(tmp_path, entries):
+    store = JournalStore(str(tmp_path / "emissions.json"))
+    dataset = SharedDataset(store)
+    dataset.view()
+    stored = store.append(entries)
+    # Applied locally, then published again by the feed
+    dataset.apply(inserted=stored)
+    assert list(dataset.view().index) == [0, 1, 2, 3, 4]
+
+
+def test_compaction_elsewhere_reloads(tmp_path, entries):
+    path = str(tmp_path / "emissions.json")
+    JournalStore(path).append(entries)
+    aggregates = MaterializedAggregates()
+    dataset = SharedDataset(JournalStore(path), aggregates=aggregates)
+    dataset.view()
+    other = JournalStore(path)
+    other.delete([4])
+    other.compact()
+    dataset.feed.poll()
+    assert not dataset.loaded and not aggregates.ready
+    assert list(dataset.view().index) == [0, 1, 2, 3]
+    assert aggregates.ready
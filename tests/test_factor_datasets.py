@@ -0,0 +1,122 @@
+"""External factor datasets and their catalog."""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import factor_datasets
+from factor_datasets import CACHE_DIR_NAME, FactorCatalog, FactorTable, load_dataset
+from factor_registry import FactorRegistry
+
+
+def dataset():
+    """A small factor dataset, out of order, with regional and yearly rows."""
+    return pd.DataFrame({
+        "category": ["Electricity", "Fuel", "Electricity", "Electricity", "Fuel", None],
+        "activity": ["Grid", "Diesel", "Grid", "Grid", "Petrol", "Orphan"],
+        "emission_factor": [0.5, 2.7, 0.8, 0.7, 2.3, 1.0],
+        "unit": ["kWh", "liter", "kWh", "kWh", "liter", "kg"],
+        "region": [None, None, "India", "India", None, None],
+        "year": [None, None, 2020, 2023, None, None],
+        "scope": ["Scope 2", "Scope 1", "Scope 2", "Scope 2", "Scope 1", "Scope 1"],
+    })
+
+
+def test_from_frame_interns_text_and_drops_incomplete_rows():
+    table = FactorTable.from_frame(dataset(), "test")
+    assert len(table) == 5
+    assert table.codes["category"].dtype == np.int32
+    assert len(table.pools["unit"]) == 2
+    assert table.categories() == ["Electricity", "Fuel"]
+    assert table.categories(scope="Scope 1") == ["Fuel"]
+    assert table.activities("Fuel") == ["Diesel", "Petrol"]
+    assert table.activities("Travel") == []
+
+
+def test_lookup_prefers_region_then_latest_year():
+    table = FactorTable.from_frame(dataset(), "test")
+    assert table.lookup("Electricity", "Grid")["factor"] == 0.5
+    assert table.lookup("Electricity", "Grid", region="India")["factor"] == 0.7
+    assert table.lookup("Electricity", "Grid", region="India", year=2021)["factor"] == 0.8
+    assert table.lookup("Electricity", "Grid", region="Japan")["region"] is None
+    found = table.lookup("Fuel", "Diesel")
+    assert found == {"factor": 2.7, "unit": "liter", "region": None, "year": None, "source": "test"}
+    assert table.lookup("Fuel", "Coal") is None
+
+
+def test_missing_columns_are_rejected():
+    with pytest.raises(ValueError):
+        FactorTable.from_frame(dataset().drop(columns="unit"))
+
+
+def test_save_and_load_round_trip(tmp_path):
+    table = FactorTable.from_frame(dataset(), "test")
+    path = str(tmp_path / "cache" / "test.npz")
+    table.save(path)
+    loaded = FactorTable.load(path, "test")
+    pd.testing.assert_frame_equal(loaded.frame(), table.frame())
+    assert os.listdir(tmp_path / "cache") == ["test.npz"]
+
+
+def test_load_dataset_uses_and_replaces_the_cache(tmp_path):
+    path = str(tmp_path / "defra.csv")
+    cache = str(tmp_path / "cache")
+    dataset().to_csv(path, index=False)
+    first = load_dataset(path, cache)
+    assert first.name == "defra"
+    assert len(os.listdir(cache)) == 1
+    cached = load_dataset(path, cache)
+    assert cached.lookup("Fuel", "Diesel") == first.lookup("Fuel", "Diesel")
+    data = dataset()
+    data.loc[1, "emission_factor"] = 2.9
+    data.to_csv(path, index=False)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+    assert load_dataset(path, cache).lookup("Fuel", "Diesel")["factor"] == 2.9
+    assert len(os.listdir(cache)) == 1
+
+
+def test_load_dataset_rejects_other_formats(tmp_path):
+    path = tmp_path / "factors.xlsx"
+    path.write_text("")
+    with pytest.raises(ValueError):
+        load_dataset(str(path))
+
+
+def test_catalog_loads_datasets_on_first_use(tmp_path, monkeypatch):
+    dataset().to_csv(tmp_path / "b_defra.csv", index=False)
+    dataset().assign(emission_factor=9.0).to_parquet(tmp_path / "a_epa.parquet")
+    (tmp_path / "notes.txt").write_text("not a dataset")
+    catalog = FactorCatalog(str(tmp_path))
+    loads = []
+    load = factor_datasets.load_dataset
+    monkeypatch.setattr(factor_datasets, "load_dataset", lambda *a: loads.append(a[0]) or load(*a))
+    assert catalog.names() == ["a_epa", "b_defra"]
+    assert loads == []
+    assert catalog.table("b_defra").lookup("Fuel", "Diesel")["factor"] == 2.7
+    assert catalog.table("missing") is None
+    # The first dataset by name wins
+    assert catalog.lookup("Fuel", "Diesel")["factor"] == 9.0
+    assert catalog.activities("Electricity") == ["Grid"]
+    assert len(loads) == 2
+    assert os.path.isdir(tmp_path / CACHE_DIR_NAME)
+
+
+def test_catalog_registers_each_dataset_once(tmp_path):
+    dataset().to_csv(tmp_path / "defra.csv", index=False)
+    catalog = FactorCatalog(str(tmp_path))
+    registry = FactorRegistry("AR5")
+    assert catalog.register(registry) == 5
+    assert catalog.register(registry) == 0
+    assert registry.resolve("Electricity", "Grid", "kWh", region="India")["factor"] == 0.7
+
+
+def test_handler_falls_back_to_the_datasets(handler, monkeypatch):
+    monkeypatch.setattr(factor_datasets, "_default", None)
+    dh = handler()
+    os.makedirs("data/factors")
+    dataset().to_csv("data/factors/custom.csv", index=False)
+    assert dh.add_emission_entry("2024-01-05", "Scope 1", "Fuel", "Petrol", 10, "liter", None)
+    assert dh.emissions_data["emissions_kgCO2e"].tolist() == pytest.approx([23.0])
+    assert not dh.add_emission_entry("2024-01-05", "Scope 1", "Fuel", "Coal", 10, "kg", None)
@@ -0,0 +1,126 @@
+"""Vectorized pricing and unit conversion of the factor registry."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from factor_registry import FactorRegistry
+
+
+@pytest.fixture
+def registry():
+    registry = FactorRegistry("AR5")
+    registry.register("Electricity", "Grid", 0.5, "kWh")
+    registry.register("Electricity", "Grid", 0.7, "kWh", region="India")
+    registry.register("Electricity", "Grid", 0.6, "kWh", region="India", year=2024)
+    registry.register("Mobile Combustion", "Diesel", 2.7, "liter")
+    return registry
+
+
+def entries(**columns):
+    """Electricity entries; list-valued columns give one value per entry."""
+    data = {"category": "Electricity", "activity": "Grid", "unit": "kWh", "quantity": 10.0}
+    data.update(columns)
+    n = max(len(v) for v in data.values() if isinstance(v, list))
+    return pd.DataFrame({k: v if isinstance(v, list) else [v] * n for k, v in data.items()})
+
+
+def test_apply_prices_by_region_and_year(registry):
+    df = entries(
+        country=[None, "India", "India", "Japan"],
+        date=["2024-03-01", "2023-03-01", "2024-03-01", "2024-03-01"],
+    )
+    priced = registry.apply(df)
+    assert priced["emission_factor"].tolist() == [0.5, 0.7, 0.6, 0.5]
+    assert priced["emissions_kgCO2e"].tolist() == pytest.approx([5.0, 7.0, 6.0, 5.0])
+    assert priced["factor_id"].notna().all()
+
+
+def test_apply_without_overwrite_keeps_given_factors(registry):
+    df = entries(emission_factor=[0.9, np.nan], emissions_kgCO2e=[9.0, np.nan])
+    priced = registry.apply(df, overwrite=False)
+    assert priced["emission_factor"].tolist() == [0.9, 0.5]
+    assert priced["emissions_kgCO2e"].tolist() == pytest.approx([9.0, 5.0])
+
+
+def test_apply_leaves_unknown_activities_unpriced(registry):
+    priced = registry.apply(entries(activity=["Grid", "Solar"]))
+    assert priced["factor_id"].isna().tolist() == [False, True]
+    assert np.isnan(priced["emission_factor"].iloc[1])
+
+
+def test_normalize_units_converts_to_the_factor_unit(registry):
+    df = entries(unit=["MWh", "kWh"], quantity=[2.0, 5.0])
+    converted, errors = registry.normalize_units(df)
+    assert converted["unit"].tolist() == ["kWh", "kWh"]
+    assert converted["quantity"].tolist() == pytest.approx([2000.0, 5.0])
+    assert not errors.any()
+
+
+def test_normalize_units_flags_other_dimensions(registry):
+    df = entries(category="Mobile Combustion", activity="Diesel", unit=["kg", "litre"], quantity=[1.0, 1.0])
+    converted, errors = registry.normalize_units(df)
+    assert errors.tolist() == [True, False]
+    assert converted["unit"].tolist() == ["kg", "liter"]
+
+
+def test_normalize_units_keeps_user_priced_entries(registry):
+    df = entries(category="Mobile Combustion", activity="Diesel", unit="kg", quantity=[1.0], emission_factor=[3.1])
+    _, errors = registry.normalize_units(df)
+    assert not errors.any()
+
+
+def test_revised_factor_is_reported_as_changed(registry):
+    version = registry.version
+    registry.register("Mobile Combustion", "Diesel", 2.8, "liter")
+    assert len(registry.changed_since(version)) == 1
+    priced = registry.apply(entries(category="Mobile Combustion", activity="Diesel", unit="liter", quantity=[1.0]))
+    assert priced["emission_factor"].tolist() == [2.8]
+
+
+def test_resolve_prefers_region_then_latest_year(registry):
+    assert registry.resolve("Electricity", "Grid", "kWh")["factor"] == 0.5
+    assert registry.resolve("Electricity", "Grid", "kWh", region="India", year=2023)["factor"] == 0.7
+    assert registry.resolve("Electricity", "Grid", "kWh", region="India")["factor"] == 0.6
+    assert registry.resolve("Electricity", "Grid", "kWh", region="Japan", year=2024)["factor"] == 0.5
+    assert registry.resolve("Electricity", "Grid", "MWh") is None
+
+
+def test_resolve_by_source(registry):
+    registry.register("Mobile Combustion", "Diesel", 2.5, "liter", source="EPA 2024")
+    assert registry.resolve("Mobile Combustion", "Diesel", "liter")["factor"] == 2.5
+    assert registry.resolve("Mobile Combustion", "Diesel", "liter", source="DEFRA/IPCC")["factor"] == 2.7
+
+
+def test_revision_keeps_the_factor_id(registry):
+    before = registry.get("Mobile Combustion", "Diesel", "liter")
+    registry.register("Mobile Combustion", "Diesel", 2.7, "liter")
+    assert registry.get("Mobile Combustion", "Diesel", "liter")["revision"] == 1
+    registry.register("Mobile Combustion", "Diesel", 2.8, "liter")
+    after = registry.get("Mobile Combustion", "Diesel", "liter")
+    assert after["factor_id"] == before["factor_id"]
+    assert after["revision"] == 2
+
+
+def test_register_frame_matches_register(registry):
+    frame = pd.DataFrame({
+        "category": ["Electricity"] * 3,
+        "activity": ["Grid"] * 3,
+        "factor": [0.5, 0.7, 0.6],
+        "unit": ["kWh"] * 3,
+        "region": [None, "India", "India"],
+        "year": [None, None, 2024],
+    })
+    loaded = FactorRegistry("AR5")
+    assert loaded.register_frame(frame) == 3
+    columns = ["category", "activity", "unit", "region", "year", "factor", "factor_id"]
+    expected = registry.table()
+    expected = expected[expected["category"] == "Electricity"][columns].reset_index(drop=True)
+    pd.testing.assert_frame_equal(loaded.table()[columns], expected)
+
+
+def test_related_factors_share_category_activity_and_unit(registry):
+    india = registry.get("Electricity", "Grid", "kWh", region="India")["factor_id"]
+    related = registry.related([india])
+    assert len(related) == 3
+    assert registry.get("Mobile Combustion", "Diesel", "liter")["factor_id"] not in related
@@ -0,0 +1,87 @@
+"""Batched monthly forecasts."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregates import MEASURE
+from forecast import FORECAST_COLUMNS, SEASONAL_MIN_MONTHS, TREND_MIN_MONTHS, forecast_series
+
+
+def monthly(values, start="2022-01-01", **columns):
+    """A monthly series in the shape timeseries.resample_totals returns."""
+    return pd.DataFrame({"period": pd.date_range(start, periods=len(values), freq="MS"), MEASURE: values, **columns})
+
+
+def projections(result):
+    return result[result["actual"].isna()]
+
+
+def test_short_history_projects_its_mean():
+    result = forecast_series(monthly([4.0, 6.0]), horizon=3)
+    assert list(result.columns) == FORECAST_COLUMNS
+    future = projections(result)
+    assert future["label"].tolist() == ["2022-03", "2022-04", "2022-05"]
+    assert future["forecast"].tolist() == pytest.approx([5.0] * 3)
+    assert (future["upper"] > future["forecast"]).all()
+
+
+def test_single_month_has_no_band():
+    future = projections(forecast_series(monthly([4.0]), horizon=2))
+    assert future["forecast"].tolist() == pytest.approx([4.0, 4.0])
+    assert future["lower"].isna().all() and future["upper"].isna().all()
+
+
+def test_trend_from_the_minimum_history():
+    values = [10.0 * (i + 1) for i in range(TREND_MIN_MONTHS)]
+    result = forecast_series(monthly(values), horizon=2)
+    history = result[result["actual"].notna()]
+    assert history["forecast"].tolist() == pytest.approx(values)
+    assert projections(result)["forecast"].tolist() == pytest.approx([40.0, 50.0])
+
+
+def test_seasonality_from_two_years():
+    months = np.arange(SEASONAL_MIN_MONTHS + 12)
+    values = 100 + 2.0 * months + 10.0 * (months % 12)
+    result = forecast_series(monthly(values), horizon=12)
+    ahead = months[-1] + 1 + np.arange(12)
+    expected = 100 + 2.0 * ahead + 10.0 * (ahead % 12)
+    future = projections(result)
+    assert future["forecast"].tolist() == pytest.approx(expected.tolist(), rel=1e-6)
+    assert future["upper"].to_numpy() - future["lower"].to_numpy() == pytest.approx(np.zeros(12), abs=1e-3)
+
+
+def test_forecasts_are_clipped_at_zero():
+    future = projections(forecast_series(monthly([40.0, 20.0, 0.0]), horizon=3))
+    assert future["forecast"].tolist() == pytest.approx([0.0, 0.0, 0.0], abs=1e-9)
+    assert (future["lower"] >= 0).all()
+
+
+def test_series_are_fitted_on_their_own_tier():
+    data = pd.concat([
+        monthly([5.0] * 30, facility="A"),
+        monthly([1.0, 2.0, 3.0, 4.0], start="2024-03-01", facility="B"),
+        monthly([7.0], start="2024-06-01", facility="C"),
+    ])
+    result = forecast_series(data, by=("facility",), horizon=1)
+    assert list(result.columns) == ["facility"] + FORECAST_COLUMNS
+    future = projections(result).set_index("facility")
+    assert future.loc["A", "label"] == "2024-07"
+    assert future["forecast"].to_dict() == pytest.approx({"A": 5.0, "B": 5.0, "C": 7.0})
+    # History starts at each series' first month
+    history = result[result["actual"].notna()]
+    assert history.groupby("facility").size().to_dict() == {"A": 30, "B": 4, "C": 1}
+
+
+def test_empty_input():
+    result = forecast_series(monthly([]), by=("scope",))
+    assert result.empty
+    assert list(result.columns) == ["scope"] + FORECAST_COLUMNS
+
+
+def test_handler_forecast(handler):
+    dh = handler()
+    for month, quantity in [("01", 10), ("02", 20), ("03", 30)]:
+        dh.add_emission_entry(f"2024-{month}-05", "Scope 1", "Mobile Combustion", "Diesel", quantity, "liter", 1.0)
+    result = dh.forecast(by=(), horizon=1)
+    assert projections(result)["forecast"].tolist() == pytest.approx([40.0])
@@ -0,0 +1,99 @@
+"""Per-gas factors and GWP restatement."""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import factor_registry
+from factor_registry import FactorRegistry, factor_id, load_gwp_basis, save_gwp_basis
+from gases import GASES, GWP, gas_emissions, gas_vector, gwp_vector
+
+METHANE = {"CO2": 1.0, "CH4": 0.1}
+
+
+def test_vectors_follow_the_gas_order():
+    assert gwp_vector("AR5")[GASES.index("CH4")] == 28
+    assert gwp_vector("AR6")[GASES.index("CO2e")] == 1
+    assert gas_vector({"N2O": 2.0}).tolist() == [2.0 if g == "N2O" else 0.0 for g in GASES]
+    with pytest.raises(ValueError):
+        gwp_vector("SAR")
+    with pytest.raises(ValueError):
+        gas_vector({"H2O": 1.0})
+
+
+def test_gas_factors_are_priced_under_the_basis():
+    registry = FactorRegistry("AR4")
+    registry.register("Waste", "Landfill", None, "kg", gases=METHANE)
+    assert registry.get("Waste", "Landfill", "kg")["factor"] == pytest.approx(1.0 + 0.1 * GWP["AR4"]["CH4"])
+    assert registry.gas_profiles().loc[factor_id("Waste", "Landfill", "kg"), "CH4"] == 0.1
+
+
+def test_switching_the_basis_revises_only_gas_factors():
+    registry = FactorRegistry("AR4")
+    registry.register("Waste", "Landfill", None, "kg", gases=METHANE)
+    registry.register("Waste", "Compost", None, "kg", gases={"CO2": 0.5})
+    registry.register("Fuel", "Diesel", 2.7, "liter")
+    revised = registry.set_gwp_basis("AR6")
+    assert revised == [factor_id("Waste", "Landfill", "kg")]
+    assert registry.get("Waste", "Landfill", "kg")["factor"] == pytest.approx(1.0 + 0.1 * GWP["AR6"]["CH4"])
+    assert registry.get("Fuel", "Diesel", "liter")["factor"] == 2.7
+
+
+def test_gas_emissions_split_entries_by_gas():
+    registry = FactorRegistry("AR5")
+    landfill = registry.register("Waste", "Landfill", None, "kg", gases=METHANE)
+    df = pd.DataFrame({
+        "quantity": [10.0, 4.0],
+        "emissions_kgCO2e": [38.0, 9.0],
+        "factor_id": [landfill, None],
+    })
+    kg = gas_emissions(df, registry)
+    assert kg.loc[0, ["CO2", "CH4", "CO2e"]].tolist() == pytest.approx([10.0, 1.0, 0.0])
+    assert kg.loc[1, "CO2e"] == 9.0
+    # Back to CO2e under the same basis
+    assert (kg.to_numpy() @ gwp_vector("AR5")).tolist() == pytest.approx([38.0, 9.0])
+
+
+def test_basis_file_round_trip(tmp_path):
+    path = str(tmp_path / "gwp_basis.json")
+    assert load_gwp_basis(path) == factor_registry.GWP_BASIS
+    save_gwp_basis("AR6", path)
+    assert load_gwp_basis(path) == "AR6"
+    with open(path, "w") as f:
+        f.write("{")
+    assert load_gwp_basis(path) == factor_registry.GWP_BASIS
+
+
+def test_handler_restates_and_remembers_the_basis(handler, monkeypatch):
+    dh = handler()
+    basis = dh.factors.gwp_basis
+    other = "AR6" if basis != "AR6" else "AR4"
+    dh.add_emission_entry("2024-01-05", "Scope 1", "Mobile Combustion", "Diesel", 100, "liter", None)
+    dh.add_emission_entry("2024-01-06", "Scope 1", "Mobile Combustion", "Diesel", 100, "liter", 3.0)
+    before = dh.emissions_by_gas()
+    summary = dh.set_gwp_basis(other)
+    assert summary["entries"].tolist() == [1]
+    after = dh.emissions_by_gas()
+    # Same kg of every gas, different CO2e
+    np.testing.assert_allclose(after[GASES].to_numpy(), before[GASES].to_numpy())
+    assert after["kgCO2e"].iloc[0] != pytest.approx(before["kgCO2e"].iloc[0], rel=1e-9)
+    assert after["kgCO2e"].iloc[0] == pytest.approx(dh.emissions_data["emissions_kgCO2e"].sum())
+    with open("data/gwp_basis.json") as f:
+        assert json.load(f) == {"basis": other}
+    # A new process starts from the saved basis
+    monkeypatch.setattr(factor_registry, "_default", None)
+    assert factor_registry.default_registry().gwp_basis == other
+
+
+def test_handler_keeps_the_basis_when_restating_fails(handler, monkeypatch, capsys):
+    dh = handler()
+    basis = dh.factors.gwp_basis
+    dh.add_emission_entry("2024-01-05", "Scope 1", "Mobile Combustion", "Diesel", 100, "liter", None)
+    monkeypatch.setattr(dh, "recalculate_emissions", lambda factor_ids=None: None)
+    assert dh.set_gwp_basis("AR6" if basis != "AR6" else "AR4") is None
+    assert dh.factors.gwp_basis == basis
+    assert load_gwp_basis() == basis
+    assert dh.set_gwp_basis("SAR") is None
+    assert "Error setting GWP basis" in capsys.readouterr().out
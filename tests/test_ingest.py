@@ -0,0 +1,182 @@
+"""Chunked CSV import and batch file ingest."""
+
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_entries
+from factor_registry import FactorRegistry
+from ingest import (
+    CHUNK_FLAGS, INGEST_REPORT_COLUMNS, expand_ranges, id_ranges, ingest_paths, iter_csv_chunks, prepare_file, price_chunk,
+)
+
+
+def csv_text(data):
+    return data.to_csv(index=False)
+
+
+def import_rows(n, start="2024-01-05"):
+    """Rows in the import format, priced from the registry."""
+    return make_entries(n, start=start).drop(columns=["emission_factor", "emissions_kgCO2e"])
+
+
+def test_iter_csv_chunks_reports_progress(tmp_path):
+    path = tmp_path / "entries.csv"
+    path.write_text(csv_text(make_entries(10)))
+    seen = []
+    chunks = list(iter_csv_chunks(str(path), chunk_rows=4, progress=lambda done, total: seen.append((done, total))))
+    assert [len(c) for c in chunks] == [4, 4, 2]
+    assert list(chunks[1].index) == [4, 5, 6, 7]
+    total = path.stat().st_size
+    assert seen[-1] == (total, total)
+    assert all(t == total for _, t in seen)
+
+
+def test_iter_csv_chunks_reads_buffers():
+    buffer = io.BytesIO(csv_text(make_entries(3)).encode())
+    assert sum(len(c) for c in iter_csv_chunks(buffer, chunk_rows=2)) == 3
+    assert not buffer.closed
+
+
+def test_price_chunk_flags_rows():
+    registry = FactorRegistry("AR5")
+    registry.register("Mobile Combustion", "Diesel", 2.0, "liter")
+    df = pd.DataFrame({
+        "category": "Mobile Combustion",
+        "activity": ["Diesel", "Diesel", "Diesel", "Hydrogen"],
+        "unit": ["liter", "gallon", "kg", "liter"],
+        "quantity": 1.0,
+        "emission_factor": [np.nan, np.nan, np.nan, 5.0],
+    })
+    priced, flags = price_chunk(df, registry)
+    assert list(flags.columns) == CHUNK_FLAGS
+    assert flags["unit_error"].tolist() == [False, False, True, False]
+    assert flags["unpriced"].tolist() == [False, False, True, False]
+    assert priced["emissions_kgCO2e"].tolist()[:2] == pytest.approx([2.0, 2.0 * 3.78541])
+    assert priced["emission_factor"].iloc[3] == 5.0
+
+
+@pytest.mark.parametrize("ids", [[], [7], [3, 4, 5, 9, 10, 20], [5, 1, 2, 3]])
+def test_id_ranges_round_trip(ids):
+    ranges = id_ranges(ids)
+    assert expand_ranges(ranges).tolist() == sorted(ids)
+    assert ranges.shape[1] == 2
+
+
+def test_id_ranges_compress_runs():
+    assert id_ranges(range(100, 1100)).tolist() == [[100, 1100]]
+
+
+def test_import_csv_in_chunks(handler):
+    dh = handler()
+    dh.summarize([])
+    seen = []
+    ok, message = dh.import_csv(io.StringIO(csv_text(import_rows(25))), chunk_rows=10, progress=lambda *a: seen.append(a))
+    assert ok, message
+    assert message == "Successfully imported 25 entries"
+    assert len(dh.emissions_data) == 25
+    assert dh.summarize([])["entries"].tolist() == [25]
+    assert len(seen) >= 3
+
+
+def test_import_csv_rolls_back_committed_chunks(handler):
+    dh = handler("sqlite")
+    dh.add_emission_entry("2024-01-01", "Scope 1", "Mobile Combustion", "Diesel", 10, "liter", 2.0)
+    dh.summarize([])
+    rows = import_rows(25)
+    rows.loc[22, "quantity"] = -1
+    ok, message = dh.import_csv(io.StringIO(csv_text(rows)), chunk_rows=10)
+    assert not ok
+    assert "invalid" in message
+    # The first two chunks were committed, then deleted again
+    assert len(dh.store.load()) == 1
+    assert len(dh.emissions_data) == 1
+    assert dh.summarize([])["entries"].tolist() == [1]
+
+
+def test_import_csv_reports_unpriced_rows(handler):
+    dh = handler()
+    rows = import_rows(3)
+    rows.loc[1, "activity"] = "Hydrogen"
+    ok, message = dh.import_csv(io.StringIO(csv_text(rows)))
+    assert not ok
+    assert message.startswith("No emission factor for 1 rows (line 3: Mobile Combustion / Hydrogen")
+    assert dh.emissions_data.empty
+
+
+def write_files(directory, files):
+    """Write {name: DataFrame} as CSV files into a directory."""
+    directory.mkdir()
+    for name, data in files.items():
+        (directory / name).write_text(csv_text(data))
+    return str(directory)
+
+
+def test_ingest_paths(tmp_path):
+    source = write_files(tmp_path / "exports", {"b.csv": import_rows(1), "a.csv": import_rows(1)})
+    (tmp_path / "exports" / "readme.txt").write_text("")
+    assert [p.rsplit("/", 1)[1] for p in ingest_paths(source)] == ["a.csv", "b.csv"]
+    assert ingest_paths(str(tmp_path / "exports" / "a*.csv")) == [str(tmp_path / "exports" / "a.csv")]
+
+
+def test_prepare_file_rejects_rows_not_files(tmp_path):
+    registry = FactorRegistry("AR5")
+    registry.register("Mobile Combustion", "Diesel", 2.0, "liter")
+    rows = import_rows(5)
+    rows.loc[1, "quantity"] = -1
+    rows.loc[3, "activity"] = "Hydrogen"
+    path = tmp_path / "plant.csv"
+    path.write_text(csv_text(rows))
+    df, lines, report = prepare_file(str(path), registry)
+    assert lines.tolist() == [2, 4, 6]
+    assert df["emissions_kgCO2e"].tolist() == pytest.approx([2.0, 6.0, 10.0])
+    assert (report["rows"], report["rejected"]) == (5, 2)
+    assert report["errors"] == "line 3: quantity must be greater than 0; line 5: activity has no emission factor"
+
+
+def test_prepare_file_reports_unreadable_files(tmp_path):
+    path = tmp_path / "plant.csv"
+    path.write_text(csv_text(import_rows(2).drop(columns="unit")))
+    df, lines, report = prepare_file(str(path), FactorRegistry("AR5"))
+    assert df is None and not len(lines)
+    assert report["errors"] == "Missing required columns: unit"
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_import_files(handler, tmp_path, workers):
+    dh = handler()
+    bad = import_rows(3, start="2024-02-01")
+    bad.loc[0, "unit"] = "kg"
+    source = write_files(tmp_path / "exports", {
+        "plant_a.csv": import_rows(4),
+        "plant_b.csv": bad,
+        "plant_c.csv": import_rows(2).drop(columns="date"),
+    })
+    ok, message, report = dh.import_files(source, workers=workers)
+    assert ok
+    assert message == "Imported 6 entries from 2 of 3 files; 1 rows rejected"
+    assert list(report.columns) == INGEST_REPORT_COLUMNS
+    assert report[["rows", "imported", "rejected"]].values.tolist() == [[4, 4, 0], [3, 2, 1], [2, 0, 0]]
+    assert report["errors"].iloc[2] == "Missing required columns: date"
+    assert len(dh.store.load()) == 6
+
+
+def test_import_files_rejects_anomalies_per_file(handler, tmp_path):
+    dh = handler()
+    for i in range(6):
+        dh.add_emission_entry(f"2024-01-{i + 1:02d}", "Scope 1", "Mobile Combustion", "Diesel", 100 + i, "liter", None)
+    odd = import_rows(2, start="2024-03-01").assign(quantity=[100.0, 100000.0])
+    source = write_files(tmp_path / "exports", {"plant.csv": odd})
+    ok, _, report = dh.import_files(source, workers=1)
+    assert ok
+    assert report[["imported", "rejected"]].values.tolist() == [[1, 1]]
+    assert report["errors"].iloc[0].startswith("line 3: ")
+    assert len(dh.emissions_data) == 7
+
+
+def test_import_files_without_files(handler, tmp_path):
+    ok, message, report = handler().import_files(str(tmp_path / "nothing*.csv"))
+    assert not ok and report.empty
+    assert message.startswith("No files found")
@@ -0,0 +1,72 @@
+"""Streaming parse of JSON record lists."""
+
+import json
+
+import pandas as pd
+import pytest
+
+import json_loader
+from json_loader import JSONFormatError, iter_json_chunks, load_json_frame
+
+
+def write_json(tmp_path, obj, name="emissions.json"):
+    path = tmp_path / name
+    path.write_text(json.dumps(obj, indent=1), encoding="utf-8")
+    return str(path)
+
+
+def test_loads_the_same_frame_as_json_load(tmp_path, entries):
+    records = entries.to_dict("records")
+    path = write_json(tmp_path, records)
+    pd.testing.assert_frame_equal(load_json_frame(path), pd.DataFrame(records))
+
+
+def test_records_spanning_read_blocks(tmp_path, entries, monkeypatch):
+    monkeypatch.setattr(json_loader, "READ_BLOCK_BYTES", 7)
+    records = entries.to_dict("records")
+    path = write_json(tmp_path, records)
+    chunks = list(iter_json_chunks(path, chunk_bytes=200))
+    assert len(chunks) > 1
+    assert pd.concat(chunks, ignore_index=True)["notes"].tolist() == entries["notes"].tolist()
+
+
+def test_missing_keys_become_missing_values(tmp_path):
+    path = write_json(tmp_path, [{"a": 1}, {"a": 2, "b": "x"}, {"b": "y"}])
+    frame = load_json_frame(path)
+    assert frame["a"].isna().tolist() == [False, False, True]
+    assert frame["b"].isna().tolist() == [True, False, False]
+    assert frame["b"].iloc[1:].tolist() == ["x", "y"]
+
+
+def test_transform_sees_file_positions(tmp_path, entries):
+    path = write_json(tmp_path, entries.to_dict("records"))
+    frame = load_json_frame(path, chunk_bytes=1, transform=lambda chunk: chunk[chunk["quantity"] > 3])
+    assert list(frame.index) == [3, 4]
+
+
+def test_memory_limit(tmp_path, entries):
+    path = write_json(tmp_path, entries.to_dict("records"))
+    with pytest.raises(MemoryError):
+        load_json_frame(path, memory_limit=100)
+
+
+def test_progress_reaches_the_file_size(tmp_path, entries):
+    path = write_json(tmp_path, entries.to_dict("records"))
+    calls = []
+    load_json_frame(path, progress=lambda done, total: calls.append((done, total)))
+    assert calls[-1][0] == calls[-1][1] > 0
+
+
+def test_empty_file_and_empty_list(tmp_path):
+    empty = tmp_path / "empty.json"
+    empty.write_text("", encoding="utf-8")
+    assert load_json_frame(str(empty)).empty
+    assert load_json_frame(write_json(tmp_path, [])).empty
+
+
+@pytest.mark.parametrize("text", ['{"a": 1}', "[1, 2]", '[{"a": 1}'])
+def test_malformed_files_raise(tmp_path, text):
+    path = tmp_path / "bad.json"
+    path.write_text(text, encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_json_frame(str(path))
@@ -0,0 +1,74 @@
+"""Fuzzy matching of free text to factor activities."""
+
+import pandas as pd
+import pytest
+
+from factor_registry import FactorRegistry
+from matching import MATCH_COLUMNS, FactorMatcher, trigrams
+
+
+@pytest.fixture
+def matcher():
+    registry = FactorRegistry("AR5")
+    registry.register("Mobile Combustion", "Diesel", 2.7, "liter")
+    registry.register("Mobile Combustion", "Petrol", 2.3, "liter")
+    registry.register("Electricity", "India Grid", 0.82, "kWh")
+    registry.register("Electricity", "Japan Grid", 0.47, "kWh")
+    registry.register("Business Travel", "Flight", 0.15, "passenger-km")
+    return FactorMatcher(registry, synonyms={("Business Travel", "Flight"): ["air travel", "plane"]})
+
+
+def test_trigrams_pad_words():
+    grams = trigrams("Diesel")
+    assert grams["die"] == 1
+    assert sum(grams.values()) >= len("diesel") - 2
+
+
+def test_match_ranks_the_closest_activity_first(matcher):
+    result = matcher.match(["diesel fuel", "diesel fuel", "petrl"], top=2)
+    assert list(result.columns) == MATCH_COLUMNS
+    # Repeated texts are scored once
+    assert result["text"].drop_duplicates().tolist() == ["diesel fuel", "petrl"]
+    first = result[result["rank"] == 1].set_index("text")
+    assert first.loc["diesel fuel", "activity"] == "Diesel"
+    assert first.loc["petrl", "activity"] == "Petrol"
+    ranked = result[result["text"] == "diesel fuel"]["confidence"].tolist()
+    assert ranked == sorted(ranked, reverse=True)
+    assert 0 < ranked[0] <= 1
+
+
+def test_synonyms_are_indexed(matcher):
+    first = matcher.match(["air travel"], top=1).iloc[0]
+    assert (first["category"], first["activity"], first["unit"]) == ("Business Travel", "Flight", "passenger-km")
+
+
+def test_texts_sharing_nothing_have_no_candidates(matcher):
+    assert matcher.match(["xyzzy"]).empty
+
+
+def test_best_reports_the_margin_over_another_activity(matcher):
+    df = pd.DataFrame({"category": ["Electricity", "Fuel"], "activity": ["grid", "Diesel"]}, index=[7, 9])
+    best = matcher.best(df)
+    assert list(best.index) == [7, 9]
+    assert best.loc[9, "activity"] == "Diesel"
+    # India and Japan grid are equally close
+    assert best.loc[7, "margin"] == pytest.approx(0.0, abs=0.01)
+    assert best.loc[9, "margin"] > 0.1
+
+
+def test_remap_takes_only_clear_matches(matcher):
+    df = pd.DataFrame({
+        "category": ["Mobile Combustion", "Transport", "Electricity"],
+        "activity": ["Diesel", "diesel", "grid"],
+    })
+    result, remapped = matcher.remap(df)
+    assert remapped.tolist() == [False, True, False]
+    assert result.loc[1, ["category", "activity", "matched_from"]].tolist() == ["Mobile Combustion", "Diesel", "Transport / diesel"]
+    assert result.loc[2, "activity"] == "grid"
+    assert df.loc[1, "category"] == "Transport"
+
+
+def test_index_follows_the_registry(matcher):
+    assert "Biogas" not in matcher.match(["biogas"])["activity"].tolist()
+    matcher.registry.register("Stationary Combustion", "Biogas", 0.0002, "kWh")
+    assert matcher.match(["biogas"], top=1).iloc[0]["activity"] == "Biogas"
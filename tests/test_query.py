@@ -0,0 +1,106 @@
+"""Composable emissions queries and their result cache."""
+
+import pandas as pd
+import pytest
+
+from conftest import make_entries
+from query import EmissionsQuery, QueryEngine
+
+
+def ledger():
+    """Entries across two scopes and two months, with datetime64 dates."""
+    data = make_entries(8, start="2024-01-28")
+    data.loc[[1, 3, 5, 7], "scope"] = "Scope 2"
+    data["country"] = ["IN", "JP", "DE", "IN"] * 2
+    return data.assign(date=pd.to_datetime(data["date"]))
+
+
+def test_builders_return_new_queries():
+    base = EmissionsQuery().between("2024-01-01", "2024-01-31")
+    scoped = base.where(scope="Scope 1")
+    assert base.filters == {}
+    assert scoped.filters == {"scope": "Scope 1"}
+    assert scoped.start_date == pd.Timestamp("2024-01-01")
+    assert base.key() != scoped.key()
+    assert scoped.key() == EmissionsQuery("2024-01-01", "2024-01-31", {"scope": "Scope 1"}).key()
+
+
+def test_invalid_filters_and_functions_are_rejected():
+    with pytest.raises(ValueError):
+        EmissionsQuery().where(notes="x")
+    with pytest.raises(ValueError):
+        EmissionsQuery().measure("quantity", "median")
+
+
+def test_row_query_filters_and_selects():
+    data = ledger()
+    query = EmissionsQuery().between("2024-01-29", "2024-02-02").where(scope="Scope 1", country=["IN", "DE"])
+    result = query.select("date", "quantity").run(data)
+    assert list(result.columns) == ["date", "quantity"]
+    assert result["quantity"].tolist() == [3.0, 5.0]
+    assert query.run(data, sorted_by_date=True).index.tolist() == [2, 4]
+
+
+def test_grouped_measures_match_groupby():
+    data = ledger()
+    query = EmissionsQuery().group_by("month", "scope").measure("emissions_kgCO2e").measure("quantity", "mean")
+    result = query.run(data).sort_values(["month", "scope"]).reset_index(drop=True)
+    months = data["date"].dt.strftime("%Y-%m")
+    expected = data.groupby([months, "scope"]).agg(
+        emissions_kgCO2e=("emissions_kgCO2e", "sum"),
+        quantity_mean=("quantity", "mean"),
+        entries=("quantity", "size"),
+    ).reset_index()
+    assert list(result.columns) == ["month", "scope", "emissions_kgCO2e", "quantity_mean", "entries"]
+    pd.testing.assert_frame_equal(result, expected.rename(columns={"date": "month"}), check_dtype=False)
+
+
+def test_ungrouped_measure_is_a_single_row():
+    data = ledger()
+    result = EmissionsQuery().measure("quantity", "max").measure("emissions_kgCO2e").run(data)
+    assert result.to_dict("records") == [{"quantity_max": 8.0, "emissions_kgCO2e": 72.0, "entries": 8}]
+
+
+def test_engine_reuses_results_until_the_version_moves():
+    data = ledger()
+    version = [1]
+    runs = []
+
+    def execute(query):
+        runs.append(query)
+        return query.run(data)
+
+    engine = QueryEngine(execute, lambda: version[0])
+    query = EmissionsQuery().group_by("scope")
+    first = engine.run(query)
+    assert engine.run(EmissionsQuery().group_by("scope")) is first
+    assert (engine.hits, engine.misses) == (1, 1)
+    version[0] += 1
+    assert engine.run(query) is not first
+    assert len(runs) == 2
+    engine.clear()
+    engine.run(query)
+    assert len(runs) == 3
+
+
+def test_engine_evicts_the_least_recently_used():
+    engine = QueryEngine(lambda q: q.run(ledger()), lambda: 0, max_entries=2)
+    a, b, c = (EmissionsQuery().where(scope=s) for s in ["Scope 1", "Scope 2", "Scope 3"])
+    engine.run(a)
+    engine.run(b)
+    engine.run(a)
+    engine.run(c)
+    misses = engine.misses
+    engine.run(a)
+    assert engine.misses == misses
+    engine.run(b)
+    assert engine.misses == misses + 1
+
+
+def test_handler_queries_see_new_entries(handler):
+    dh = handler()
+    query = EmissionsQuery().group_by("scope")
+    dh.add_emission_entry("2024-01-05", "Scope 1", "Mobile Combustion", "Diesel", 10, "liter", 2.0)
+    assert dh.query(query)["emissions_kgCO2e"].tolist() == [20.0]
+    dh.add_emission_entry("2024-01-06", "Scope 1", "Mobile Combustion", "Diesel", 5, "liter", 2.0)
+    assert dh.query(query)["emissions_kgCO2e"].tolist() == [30.0]
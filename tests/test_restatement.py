@@ -0,0 +1,90 @@
+"""Restating entries after emission factor revisions."""
+
+import pandas as pd
+import pytest
+
+from factor_registry import FactorRegistry, factor_id
+from restatement import DELTA_COLUMNS, FactorDependents, restate
+
+DIESEL = factor_id("Mobile Combustion", "Diesel", "liter")
+PETROL = factor_id("Mobile Combustion", "Petrol", "liter")
+
+
+def priced(registry, activities, quantities, index=None):
+    """Entries priced by the registry."""
+    rows = pd.DataFrame({
+        "date": pd.Timestamp("2024-01-05"),
+        "category": "Mobile Combustion",
+        "activity": activities,
+        "unit": "liter",
+        "quantity": quantities,
+    }, index=index)
+    return registry.apply(rows)
+
+
+@pytest.fixture
+def registry():
+    registry = FactorRegistry("AR5")
+    registry.register("Mobile Combustion", "Diesel", 2.0, "liter")
+    registry.register("Mobile Combustion", "Petrol", 3.0, "liter")
+    return registry
+
+
+def test_dependents_index_entries_by_factor():
+    dependents = FactorDependents()
+    data = pd.DataFrame({"factor_id": [DIESEL, PETROL, DIESEL, None, ""]}, index=[10, 11, 12, 13, 14])
+    dependents.rebuild(data)
+    assert dependents.entries([DIESEL]).tolist() == [10, 12]
+    assert dependents.counts() == {DIESEL: 2, PETROL: 1}
+    dependents.add(pd.DataFrame({"factor_id": [PETROL]}, index=[15]))
+    dependents.remove(data.loc[[11]])
+    assert dependents.entries([DIESEL, PETROL, "unknown"]).tolist() == [10, 12, 15]
+    dependents.remove(data.loc[[10, 12]])
+    assert DIESEL not in dependents.counts()
+
+
+def test_restate_returns_changed_rows_and_deltas(registry):
+    rows = priced(registry, ["Diesel", "Diesel", "Petrol"], [1.0, 2.0, 5.0], index=[4, 5, 6])
+    registry.register("Mobile Combustion", "Diesel", 2.5, "liter")
+    changed, summary = restate(rows, registry)
+    assert list(changed.index) == [4, 5]
+    assert changed["emissions_kgCO2e"].tolist() == [2.5, 5.0]
+    assert list(summary.columns) == DELTA_COLUMNS
+    assert summary.to_dict("records") == [{
+        "category": "Mobile Combustion", "activity": "Diesel", "factor_id": DIESEL,
+        "entries": 2, "before_kgCO2e": 6.0, "after_kgCO2e": 7.5, "change_kgCO2e": 1.5,
+    }]
+
+
+def test_restate_moves_entries_to_a_new_regional_factor(registry):
+    rows = priced(registry, ["Diesel", "Diesel"], [1.0, 1.0]).assign(country=["India", "Japan"])
+    registry.register("Mobile Combustion", "Diesel", 2.2, "liter", region="India")
+    changed, summary = restate(rows, registry)
+    assert list(changed.index) == [0]
+    assert changed["factor_id"].iloc[0] == factor_id("Mobile Combustion", "Diesel", "liter", region="India")
+    assert summary["change_kgCO2e"].tolist() == pytest.approx([0.2])
+
+
+def test_restate_without_changes(registry):
+    rows = priced(registry, ["Diesel"], [1.0])
+    changed, summary = restate(rows, registry)
+    assert changed.empty and summary.empty
+    changed, summary = restate(rows.iloc[:0], registry)
+    assert list(summary.columns) == DELTA_COLUMNS
+
+
+def test_handler_recalculates_only_revised_entries(handler):
+    dh = handler()
+    dh.add_emission_entry("2024-01-05", "Scope 1", "Mobile Combustion", "Diesel", 10, "liter", None)
+    dh.add_emission_entry("2024-01-06", "Scope 1", "Mobile Combustion", "Diesel", 10, "liter", 9.0)
+    dh.add_emission_entry("2024-01-07", "Scope 1", "Mobile Combustion", "Petrol/Gasoline", 10, "liter", None)
+    dh.factors.register("Mobile Combustion", "Diesel", 3.0, "liter")
+    summary = dh.recalculate_emissions()
+    assert summary["entries"].tolist() == [1]
+    assert summary["after_kgCO2e"].tolist() == pytest.approx([30.0])
+    data = dh.emissions_data.sort_values("date")
+    assert data["emissions_kgCO2e"].tolist() == pytest.approx([30.0, 90.0, 23.15], rel=1e-3)
+    assert dh.recalculate_emissions().empty
+    # The restated entry was stored under a new id
+    assert len(dh.store.load()) == 3
+    assert 0 not in dh.store.load().index
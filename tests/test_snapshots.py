@@ -0,0 +1,82 @@
+"""Deduplicated backup snapshots and their retention."""
+
+import os
+
+import pytest
+
+from conftest import make_entries
+from snapshots import SnapshotManager, chunk_records
+from storage import SQLiteStore, records_from_frame
+
+
+def chunk_files(manager):
+    """Names of all stored chunks."""
+    return {name for prefix in os.listdir(manager.chunk_dir) for name in os.listdir(os.path.join(manager.chunk_dir, prefix))}
+
+
+def test_chunks_only_change_around_an_edit():
+    records = records_from_frame(make_entries(2000))
+    edited = records[:1000] + records[1001:]
+    before, after = set(chunk_records(records)), set(chunk_records(edited))
+    assert len(before - after) <= 2
+    assert len(after - before) <= 2
+
+
+def test_snapshot_round_trip(tmp_path):
+    manager = SnapshotManager(str(tmp_path))
+    records = records_from_frame(make_entries(300))
+    snapshot_id = manager.take(records, source="test")
+    assert manager.read(snapshot_id) == records
+    assert [(m["id"], m["rows"], m["source"]) for m in manager.list()] == [(snapshot_id, 300, "test")]
+
+
+def test_unchanged_chunks_are_stored_once(tmp_path):
+    manager = SnapshotManager(str(tmp_path))
+    records = records_from_frame(make_entries(2000))
+    manager.take(records)
+    stored = chunk_files(manager)
+    manager.take(records + records_from_frame(make_entries(1, start="2030-01-01")))
+    assert len(chunk_files(manager) - stored) <= 1
+
+
+def test_retention_drops_old_snapshots_and_their_chunks(tmp_path):
+    manager = SnapshotManager(str(tmp_path), retention={"last": 2})
+    first = manager.take(records_from_frame(make_entries(3)))
+    manager.take(records_from_frame(make_entries(3, quantity=10)))
+    manager.take(records_from_frame(make_entries(3, quantity=20)))
+    assert first not in {m["id"] for m in manager.list()}
+    assert len(manager.list()) == 2
+    assert len(chunk_files(manager)) == 2
+
+
+def test_select_kept_keeps_one_per_bucket(tmp_path):
+    manager = SnapshotManager(str(tmp_path), retention={"daily": 2})
+    manifests = [
+        {"id": "c", "created": "2024-01-03T09:00:00"},
+        {"id": "b2", "created": "2024-01-02T18:00:00"},
+        {"id": "b1", "created": "2024-01-02T09:00:00"},
+        {"id": "a", "created": "2024-01-01T09:00:00"},
+    ]
+    assert manager.select_kept(manifests) == {"c", "b2"}
+
+
+def test_sqlite_rewrite_is_backed_up(tmp_path, entries):
+    manager = SnapshotManager(str(tmp_path / "snapshots"))
+    store = SQLiteStore(str(tmp_path / "emissions.db"), snapshots=manager)
+    store.rewrite(entries)
+    (manifest,) = manager.list()
+    assert manifest["rows"] == 5
+    assert [r["entry_id"] for r in manager.read(manifest["id"])] == [0, 1, 2, 3, 4]
+
+
+def test_stores_back_up_periodically(tmp_path, entries, monkeypatch):
+    pytest.importorskip("pyarrow")
+    from storage import ParquetStore
+    monkeypatch.setattr("storage.BACKUP_ROWS", 8)
+    manager = SnapshotManager(str(tmp_path / "snapshots"))
+    store = ParquetStore(str(tmp_path / "emissions_parquet"), snapshots=manager)
+    store.append(entries)
+    assert manager.list() == []
+    store.append(entries)
+    store._backup_thread.join()
+    assert manager.list()[0]["rows"] == 10
@@ -0,0 +1,333 @@
+"""Round-trips and atomic commits of the emissions stores."""
+
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import make_entries
+from storage import JournalStore, SQLiteStore, date_slice, sort_by_date
+
+BACKENDS = ["json", "sqlite", "parquet"]
+
+
+def open_backend(backend, tmp_path):
+    """A new, empty store of one backend under tmp_path."""
+    if backend == "json":
+        return JournalStore(str(tmp_path / "emissions.json"))
+    if backend == "sqlite":
+        return SQLiteStore(str(tmp_path / "emissions.db"))
+    pytest.importorskip("pyarrow")
+    from storage import ParquetStore
+    return ParquetStore(str(tmp_path / "emissions_parquet"))
+
+
+@pytest.fixture(params=BACKENDS)
+def store(request, tmp_path):
+    return open_backend(request.param, tmp_path)
+
+
+def test_append_and_load_round_trip(store, entries):
+    stored = store.append(entries)
+    assert list(stored.index) == [0, 1, 2, 3, 4]
+    loaded = store.load()
+    assert list(loaded.index) == [0, 1, 2, 3, 4]
+    assert loaded["quantity"].tolist() == entries["quantity"].tolist()
+    assert loaded["notes"].tolist() == entries["notes"].tolist()
+    assert pd.to_datetime(loaded["date"]).dt.strftime("%Y-%m-%d").tolist() == entries["date"].tolist()
+
+
+def test_ids_are_never_reused_after_delete(store, entries):
+    store.append(entries)
+    store.delete([3, 4])
+    stored = store.append(entries.head(1))
+    assert list(stored.index) == [5]
+    assert list(store.load().index) == [0, 1, 2, 5]
+
+
+def test_read_selects_columns_and_date_range(store, entries):
+    store.append(entries)
+    data = store.read("2024-01-06", "2024-01-08", columns=["quantity", "notes"])
+    assert list(data.columns) == ["quantity", "notes"]
+    assert list(data.index) == [1, 2, 3]
+    assert data["notes"].tolist() == ["note 1", "note 2", "note 3"]
+
+
+def test_commit_inserts_and_deletes_together(store, entries):
+    store.append(entries)
+    stored = store.commit(rows=entries.head(2), entry_ids=[0, 1])
+    assert list(stored.index) == [5, 6]
+    assert list(store.load().index) == [2, 3, 4, 5, 6]
+
+
+def test_changes_since_reports_a_commit(store, entries):
+    store.append(entries)
+    version = store.version()
+    store.commit(rows=entries.head(1), entry_ids=[0])
+    changes = store.changes_since(version)
+    if changes is None:
+        pytest.skip("store does not keep a change feed")
+    inserted, deleted, _ = changes
+    assert list(inserted.index) == [5]
+    assert deleted == [0]
+
+
+def test_reopened_store_sees_committed_rows(tmp_path, entries):
+    for backend in BACKENDS:
+        first = open_backend(backend, tmp_path / backend)
+        first.commit(rows=entries, entry_ids=None)
+        first.delete([0])
+        again = open_backend(backend, tmp_path / backend)
+        assert list(again.load().index) == [1, 2, 3, 4]
+
+
+def test_journal_commit_is_one_batch(tmp_path, entries):
+    store = JournalStore(str(tmp_path / "emissions.json"))
+    store.append(entries)
+    store.commit(rows=entries.head(1), entry_ids=[0])
+    with open(store.journal_path, "rb") as f:
+        lines = f.read().splitlines()
+    last = json.loads(lines[-1])
+    # Insert and delete are written and fsynced as one batch after the first append
+    assert len(lines) == 3
+    assert [op["op"] for op in map(json.loads, lines[1:])] == ["insert", "delete"]
+    assert last["ids"] == [0]
+
+
+def test_journal_ignores_a_torn_line(tmp_path, entries):
+    store = JournalStore(str(tmp_path / "emissions.json"))
+    store.append(entries)
+    with open(store.journal_path, "ab") as f:
+        f.write(b'{"seq": 9, "op": "delete", "ids": [0')
+    assert list(JournalStore(store.path).load().index) == [0, 1, 2, 3, 4]
+
+
+def test_journal_compaction_folds_the_journal_into_the_snapshot(tmp_path, entries):
+    store = JournalStore(str(tmp_path / "emissions.json"))
+    store.append(entries)
+    store.delete([1])
+    assert store.compact()
+    assert open(store.journal_path, "rb").read() == b""
+    with open(store.path, encoding="utf-8") as f:
+        assert [r["entry_id"] for r in json.load(f)] == [0, 2, 3, 4]
+    # Ids keep counting after the journal that handed them out is gone
+    assert list(JournalStore(store.path).append(entries.head(1)).index) == [5]
+
+
+def test_journal_reads_a_legacy_snapshot_without_ids(tmp_path, entries):
+    path = tmp_path / "emissions.json"
+    path.write_text(entries.to_json(orient="records"), encoding="utf-8")
+    store = JournalStore(str(path))
+    assert list(store.load().index) == [0, 1, 2, 3, 4]
+    assert list(store.append(entries.head(1)).index) == [5]
+    store.delete([0])
+    assert list(store.load().index) == [1, 2, 3, 4, 5]
+
+
+
+def test_aggregate_sums_by_month_and_scope(store):
+    rows = make_entries(40, start="2024-01-20")
+    rows.loc[::2, "scope"] = "Scope 2"
+    store.append(rows)
+    result = store.aggregate(["month", "scope"], start_date="2024-01-25", filters={"category": "Mobile Combustion"})
+    result = result.sort_values(["month", "scope"]).reset_index(drop=True)
+    expected = rows.iloc[5:].assign(month=lambda d: d["date"].str[:7])
+    expected = expected.groupby(["month", "scope"])["emissions_kgCO2e"].agg(["sum", "size"]).reset_index()
+    assert result[["month", "scope"]].values.tolist() == expected[["month", "scope"]].values.tolist()
+    assert result["emissions_kgCO2e"].tolist() == pytest.approx(expected["sum"].tolist())
+    assert result["entries"].tolist() == expected["size"].tolist()
+
+
+def dated(dates):
+    """A frame of datetime64 dates in the given order, labelled by position."""
+    return pd.DataFrame({"date": pd.to_datetime(dates), "n": range(len(dates))})
+
+
+def test_sort_by_date_is_stable_with_missing_dates_last():
+    data = dated(["2024-03-01", None, "2024-01-01", "2024-03-01", "2024-02-01"])
+    assert sort_by_date(data)["n"].tolist() == [2, 4, 0, 3, 1]
+    ordered = dated(["2024-01-01", "2024-01-02", None])
+    assert sort_by_date(ordered) is ordered
+
+
+@pytest.mark.parametrize("start, end", [
+    ("2024-01-10", "2024-01-20"),
+    ("2024-01-10", None),
+    (None, "2024-01-20"),
+    ("2023-12-01", "2023-12-31"),
+    ("2024-01-15 12:00", "2024-02-28"),
+])
+def test_date_slice_matches_a_mask(start, end):
+    data = make_entries(40)
+    data = data.assign(date=pd.to_datetime(data["date"])).sample(frac=1, random_state=1)
+    data.loc[data.index[:3], "date"] = pd.NaT
+    data = sort_by_date(data)
+    mask = data["date"].notna()
+    if start:
+        mask &= data["date"] >= pd.Timestamp(start)
+    if end:
+        mask &= data["date"] <= pd.Timestamp(end)
+    pd.testing.assert_frame_equal(date_slice(data, start, end), data[mask])
+
+
+def test_date_slice_without_a_range_returns_everything():
+    data = dated([None, "2024-01-01"])
+    assert date_slice(data) is data
+
+
+def test_handler_ranges_include_both_ends(handler):
+    dh = handler()
+    for day in ["2024-01-07", "2024-01-05", "2024-01-06", "2024-01-08"]:
+        dh.add_emission_entry(day, "Scope 1", "Mobile Combustion", "Diesel", 10, "liter", 2.0)
+    data = dh.get_filtered_data("2024-01-06", "2024-01-07")
+    assert data["date"].dt.strftime("%Y-%m-%d").tolist() == ["2024-01-06", "2024-01-07"]
+    assert dh.emissions_data["date"].is_monotonic_increasing
+
+
+def test_sqlite_commit_rolls_back_on_error(tmp_path, entries, monkeypatch):
+    store = SQLiteStore(str(tmp_path / "emissions.db"))
+    store.append(entries)
+    insert = store._insert
+
+    def insert_then_fail(conn, frame):
+        insert(conn, frame)
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(store, "_insert", insert_then_fail)
+    with pytest.raises(RuntimeError):
+        store.commit(rows=entries.head(1), entry_ids=[0])
+    assert list(store.load().index) == [0, 1, 2, 3, 4]
+
+
+def test_sqlite_rewrite_resets_the_change_feed(tmp_path, entries):
+    store = SQLiteStore(str(tmp_path / "emissions.db"))
+    store.append(entries)
+    version = store.version()
+    store.rewrite(store.load().head(2))
+    assert store.changes_since(version) is None
+    assert list(store.load().index) == [0, 1]
+
+
+@pytest.fixture
+def parquet(tmp_path):
+    pytest.importorskip("pyarrow")
+    from storage import ParquetStore
+    return ParquetStore(str(tmp_path / "emissions_parquet"))
+
+
+def test_parquet_prunes_months_outside_a_date_range(parquet):
+    parquet.append(make_entries(40, start="2024-01-20"))
+    assert sorted(os.listdir(parquet.root)) == ["_changes.jsonl", "_lock", "_meta.json", "month=2024-01", "month=2024-02"]
+    data = parquet.read("2024-02-01", "2024-02-29", columns=["date"])
+    assert list(data.index) == list(range(12, 40))
+
+
+def test_parquet_hides_an_uncommitted_insert(parquet, entries):
+    parquet.append(entries)
+    # A crash after the ids were reserved and the part written, before the commit point
+    meta = parquet._meta()
+    with open(parquet.meta_path, "w", encoding="utf-8") as f:
+        json.dump({**meta, "next_id": meta["next_id"] + 2}, f)
+    orphan = make_entries(2).set_axis(pd.Index([5, 6], name="entry_id"), axis=0)
+    parquet._write_months(parquet.root, parquet._normalize(orphan))
+    assert list(parquet.load().index) == [0, 1, 2, 3, 4]
+    # The next write discards the orphan and never hands out its ids again
+    stored = parquet.append(entries.head(1))
+    assert list(stored.index) == [7]
+    assert list(parquet.load().index) == [0, 1, 2, 3, 4, 7]
+
+
+def test_parquet_hides_duplicates_of_an_interrupted_merge(parquet, entries):
+    parquet.append(entries)
+    parquet.append(entries.head(1))
+    # The merged file was written but the parts it replaces were not removed yet
+    month = "2024-01"
+    merged = parquet._read_files(parquet._files(parquet.root, month), parquet._meta()).reset_index()
+    parquet._write_part(parquet.root, month, parquet._normalize(merged.set_index("entry_id")), "part-000000000001.parquet")
+    assert len(parquet._files(parquet.root, month)) == 3
+    assert list(parquet.load().index) == [0, 1, 2, 3, 4, 5]
+
+
+def test_parquet_finishes_a_pending_delete(parquet, entries):
+    parquet.append(entries)
+    # A crash after the commit point, before the deleted rows were removed from their part files
+    meta = parquet._meta()
+    with open(parquet.meta_path, "w", encoding="utf-8") as f:
+        json.dump({**meta, "deleted": [1, 2]}, f)
+    assert list(parquet.load().index) == [0, 3, 4]
+    parquet.append(entries.head(1))
+    assert parquet._meta()["deleted"] == []
+    assert list(parquet.load().index) == [0, 3, 4, 5]
+    assert not os.path.exists(parquet.meta_path + ".tmp")
+
+
+def test_parquet_rewrite_switches_generations(parquet, entries):
+    parquet.append(entries)
+    parquet.rewrite(parquet.load().tail(2))
+    assert parquet._meta()["generation"] == 1
+    assert not any(d.startswith("month=") for d in os.listdir(parquet.root))
+    assert list(parquet.load().index) == [3, 4]
+    assert list(parquet.append(entries.head(1)).index) == [5]
+
+
+def test_parquet_discards_a_rewrite_that_did_not_commit(parquet, entries):
+    parquet.append(entries)
+    # A crash while the next generation was being written
+    parquet._write_months(parquet._base(1), parquet._normalize(entries.set_axis(pd.Index(range(10, 15), name="entry_id"), axis=0)))
+    assert list(parquet.load().index) == [0, 1, 2, 3, 4]
+    parquet.append(entries.head(1))
+    assert not os.path.exists(parquet._base(1))
+    assert list(parquet.load().index) == [0, 1, 2, 3, 4, 5]
+
+
+def test_parquet_restores_partitions_moved_aside_by_an_old_rewrite(parquet, entries):
+    parquet.append(entries)
+    # Earlier versions renamed month=* to _old_month=* before writing the new ledger
+    os.rename(os.path.join(parquet.root, "month=2024-01"), os.path.join(parquet.root, "_old_month=2024-01"))
+    parquet._write_months(parquet.root, parquet._normalize(entries.head(1).set_axis(pd.Index([0], name="entry_id"), axis=0)))
+    parquet.append(entries.head(1))
+    assert "_old_month=2024-01" not in os.listdir(parquet.root)
+    assert list(parquet.load().index) == [0, 1, 2, 3, 4, 5]
+
+
+def test_parquet_read_retries_when_a_part_disappears(parquet, entries, monkeypatch):
+    parquet.append(entries)
+    files = parquet._files
+    calls = []
+
+    def vanishing(base, month):
+        # The first listing names a part a merge removed before it was read
+        calls.append(month)
+        found = files(base, month)
+        return found + [os.path.join(base, f"month={month}", "part-000000000099.parquet")] if len(calls) == 1 else found
+
+    monkeypatch.setattr(parquet, "_files", vanishing)
+    assert list(parquet.load().index) == [0, 1, 2, 3, 4]
+    assert len(calls) == 2
+
+
+def test_query_keeps_rows_with_unparseable_dates(handler):
+    dh = handler("sqlite")
+    dh.add_emission_entry("2024-01-05", "Scope 1", "Mobile Combustion", "Diesel", 10, "liter", 2.0)
+    dh.add_emission_entry("2024-01-06", "Scope 1", "Mobile Combustion", "Diesel", 10, "liter", 2.0)
+    with dh.store._transaction() as conn:
+        conn.execute("UPDATE emissions SET date = 'sometime' WHERE entry_id = 1")
+    data = dh._query(columns=["date"])
+    assert data["date"].isna().tolist() == [False, True]
+
+
+def test_journal_write_failure_leaves_nothing_behind(tmp_path, entries, monkeypatch):
+    store = JournalStore(str(tmp_path / "emissions.json"))
+    store.append(entries)
+    size = len(open(store.journal_path, "rb").read())
+
+    def fail(fd):
+        raise OSError("disk full")
+
+    monkeypatch.setattr("storage.os.fsync", fail)
+    with pytest.raises(OSError):
+        store.append(entries.head(1))
+    monkeypatch.undo()
+    assert len(open(store.journal_path, "rb").read()) == size
+    assert list(JournalStore(store.path).load().index) == [0, 1, 2, 3, 4]
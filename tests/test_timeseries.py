@@ -0,0 +1,116 @@
+"""Resampled emissions series."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregates import MEASURE
+from timeseries import TimeSeriesEngine, daily_totals, period_label, period_start, resample_frame
+
+
+def rows(values, start="2023-01-01", freq="MS", **columns):
+    """One row per period with the given emissions."""
+    dates = pd.date_range(start, periods=len(values), freq=freq) + pd.Timedelta(days=14)
+    return pd.DataFrame({"date": dates, MEASURE: values, **columns})
+
+
+@pytest.mark.parametrize("granularity, expected", [
+    ("daily", "2024-05-15"),
+    ("weekly", "2024-05-13"),
+    ("monthly", "2024-05-01"),
+    ("quarterly", "2024-04-01"),
+    ("fiscal_year", "2024-04-01"),
+])
+def test_period_start(granularity, expected):
+    dates = pd.Series(pd.to_datetime(["2024-05-15 13:00", None]))
+    starts = period_start(dates, granularity, fiscal_start=4)
+    assert starts.iloc[0] == pd.Timestamp(expected)
+    assert pd.isna(starts.iloc[1])
+
+
+def test_fiscal_year_before_its_start_month_belongs_to_the_previous_year():
+    starts = period_start(pd.Series(pd.to_datetime(["2024-03-31", "2024-04-01"])), "fiscal_year", fiscal_start=4)
+    assert starts.tolist() == [pd.Timestamp("2023-04-01"), pd.Timestamp("2024-04-01")]
+    labels = period_label(starts, "fiscal_year", fiscal_start=4)
+    assert labels.tolist() == ["FY2023-24", "FY2024-25"]
+
+
+def test_unknown_granularity_is_rejected():
+    with pytest.raises(ValueError):
+        period_start(pd.Series(pd.to_datetime(["2024-01-01"])), "hourly")
+
+
+def test_daily_totals_skip_rows_without_dates():
+    data = pd.DataFrame({"date": ["2024-01-01", "2024-01-01", "soon"], MEASURE: [1.0, "2", 4.0]})
+    daily = daily_totals(data)
+    assert daily[MEASURE].tolist() == [3.0]
+    assert daily["entries"].tolist() == [2]
+
+
+def test_monthly_figures():
+    values = [float(v) for v in range(1, 15)]
+    series = resample_frame(rows(values))
+    assert len(series) == 14
+    assert series["label"].tolist()[:2] == ["2023-01", "2023-02"]
+    assert series["rolling_mean"].tolist()[:4] == pytest.approx([1.0, 1.5, 2.0, 3.0])
+    assert series["change"].iloc[1] == 1.0
+    assert series["change_pct"].iloc[1] == pytest.approx(100.0)
+    assert np.isnan(series["yoy_change"].iloc[11])
+    assert series["yoy_change"].iloc[12] == 12.0
+    assert series["cumulative"].iloc[-1] == sum(values)
+    # Calendar fiscal year by default: year to date restarts in January
+    assert series["year_to_date"].iloc[12] == 13.0
+
+
+def test_gaps_become_zero_periods():
+    data = rows([5.0, 7.0], freq="2MS")
+    series = resample_frame(data, window=2)
+    assert series[MEASURE].tolist() == [5.0, 0.0, 7.0]
+    assert series["entries"].tolist() == [1, 0, 1]
+    assert series["rolling_mean"].tolist() == [5.0, 2.5, 3.5]
+    assert np.isnan(series["change_pct"].iloc[2])
+
+
+def test_each_group_is_its_own_series():
+    data = pd.concat([
+        rows([1.0, 2.0, 3.0], scope="Scope 1"),
+        rows([10.0], start="2023-02-01", scope="Scope 2"),
+    ])
+    series = resample_frame(data, "quarterly", by=("scope",))
+    assert series[["scope", "label", MEASURE]].values.tolist() == [
+        ["Scope 1", "2023Q1", 6.0],
+        ["Scope 2", "2023Q1", 10.0],
+    ]
+    monthly = resample_frame(data, by=("scope",))
+    # Scope 2 starts at its first entry and runs to the latest period in the data
+    assert monthly[monthly["scope"] == "Scope 2"]["label"].tolist() == ["2023-02", "2023-03"]
+
+
+def test_engine_caches_per_version_and_slices_ranges():
+    data = rows([1.0, 2.0, 3.0, 4.0])
+    calls = []
+    version = [0]
+    engine = TimeSeriesEngine(lambda by: calls.append(by) or data, lambda: version[0])
+    monthly = engine.resample()
+    assert engine.resample() is monthly
+    engine.resample("quarterly")
+    assert len(calls) == 1
+    sliced = engine.resample(start_date="2023-02-20", end_date="2023-03-31")
+    assert sliced["label"].tolist() == ["2023-02", "2023-03"]
+    assert sliced["cumulative"].tolist() == [3.0, 6.0]
+    version[0] += 1
+    engine.resample()
+    assert len(calls) == 2
+    with pytest.raises(ValueError):
+        engine.resample("hourly")
+
+
+def test_handler_resample(handler):
+    dh = handler()
+    dh.add_emission_entry("2024-01-05", "Scope 1", "Mobile Combustion", "Diesel", 10, "liter", 2.0)
+    dh.add_emission_entry("2024-03-05", "Scope 2", "Purchased Electricity", "Grid", 5, "kWh", 1.0)
+    series = dh.resample("monthly")
+    assert series["label"].tolist() == ["2024-01", "2024-02", "2024-03"]
+    assert series[MEASURE].tolist() == [20.0, 0.0, 5.0]
+    by_scope = dh.resample("monthly", by=("scope",))
+    assert set(by_scope["scope"]) == {"Scope 1", "Scope 2"}
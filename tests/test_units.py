@@ -0,0 +1,68 @@
+"""Unit names and column-wise conversion."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from units import UNITS, conversion_ratios, convert, dimension, normalize_unit, unit_codes
+
+
+@pytest.mark.parametrize("written, canonical", [
+    ("kWh", "kWh"), ("MWH", "MWh"), (" Litres ", "liter"), ("m3", "cubic meter"),
+    ("cubic   metre", "cubic meter"), ("Metric Ton", "tonne"), ("furlong", None), (None, None),
+])
+def test_normalize_unit(written, canonical):
+    assert normalize_unit(written) == canonical
+
+
+def test_dimension():
+    assert dimension("MWh") == "energy"
+    assert dimension("gal") == "volume"
+    assert dimension("furlong") is None
+
+
+def test_unit_codes_mark_unknown_and_missing_units():
+    codes = unit_codes(pd.Series(["kWh", "kwh", "furlong", None]))
+    assert codes[0] == codes[1] >= 0
+    assert codes[2:].tolist() == [-1, -1]
+
+
+def test_convert_within_a_dimension():
+    converted, errors = convert(
+        pd.Series([1.0, 2.0, 1.0, 1.0, "3"]),
+        pd.Series(["MWh", "GJ", "gallon", "t", "MWh"]),
+        pd.Series(["kWh", "kWh", "liter", "kg", "MWh"]),
+    )
+    assert converted == pytest.approx([1000.0, 2000 / 3.6, 3.78541, 1000.0, 3.0])
+    assert not errors.any()
+
+
+def test_convert_across_dimensions_fails():
+    converted, errors = convert(pd.Series([1.0, 1.0]), pd.Series(["kg", "kWh"]), pd.Series(["liter", "kWh"]))
+    assert errors.tolist() == [True, False]
+    assert np.isnan(converted[0])
+    assert converted[1] == 1.0
+
+
+def test_same_unknown_unit_is_left_alone():
+    ratios, errors = conversion_ratios(pd.Series(["crate", "crate"]), pd.Series(["crate", "piece"]))
+    assert ratios[0] == 1.0
+    assert errors.tolist() == [False, True]
+
+
+def test_round_trips_within_every_dimension():
+    names = list(UNITS)
+    pairs = [(a, b) for a in names for b in names if UNITS[a][0] == UNITS[b][0]]
+    there, errors = convert(pd.Series(1.0, index=range(len(pairs))), pd.Series([a for a, _ in pairs]), pd.Series([b for _, b in pairs]))
+    back, _ = convert(pd.Series(there), pd.Series([b for _, b in pairs]), pd.Series([a for a, _ in pairs]))
+    assert not errors.any()
+    assert back == pytest.approx(np.ones(len(pairs)))
+
+
+def test_handler_converts_entries_to_the_factor_unit(handler):
+    dh = handler()
+    assert dh.add_emission_entry("2024-01-05", "Scope 2", "Electricity", "Japan Grid", 2, "MWh", None)
+    assert not dh.add_emission_entry("2024-01-06", "Scope 2", "Electricity", "Japan Grid", 2, "kg", None)
+    entry = dh.emissions_data.iloc[0]
+    assert (entry["quantity"], entry["unit"]) == (2000.0, "kWh")
+    assert entry["emissions_kgCO2e"] == pytest.approx(2000 * 0.47)
@@ -0,0 +1,93 @@
+"""Entry schema checks."""
+
+import numpy as np
+import pandas as pd
+
+from conftest import make_entries
+from validation import format_errors, known_unit, validate
+
+
+def errors_of(df):
+    """(row, column, error) tuples of validate(df)."""
+    return list(validate(df).itertuples(index=False, name=None))
+
+
+def test_valid_entries_have_no_errors(entries):
+    assert validate(entries).empty
+
+
+def test_missing_and_malformed_values():
+    df = make_entries(4).astype(object)
+    df.loc[0, "scope"] = " "
+    df.loc[1, "quantity"] = "ten"
+    df.loc[2, "date"] = "Q1 2024"
+    df.loc[3, "unit"] = "bushels"
+    assert errors_of(df) == [
+        (0, "scope", "missing"),
+        (1, "quantity", "not a number"),
+        (2, "date", "not a date"),
+        (3, "unit", "not a known unit"),
+    ]
+
+
+def test_bounds_and_allowed_values():
+    df = make_entries(4)
+    df.loc[0, "quantity"] = 0
+    df.loc[1, "emission_factor"] = -1
+    df.loc[2, "scope"] = "Scope 4"
+    df.loc[3, "date"] = "1989-12-31"
+    assert [(row, column) for row, column, _ in errors_of(df)] == [
+        (0, "quantity"), (1, "emission_factor"), (2, "scope"), (3, "date"),
+    ]
+
+
+def test_future_dates_are_rejected():
+    df = make_entries(1, start=(pd.Timestamp.today() + pd.Timedelta(days=2)).strftime("%Y-%m-%d"))
+    assert errors_of(df) == [(0, "date", "after " + pd.Timestamp.today().strftime("%Y-%m-%d"))]
+
+
+def test_infinite_numbers_are_rejected():
+    df = make_entries(3)
+    df["quantity"] = [np.inf, 1.0, -np.inf]
+    df["emission_factor"] = ["2", "inf", "2"]
+    assert errors_of(df) == [
+        (0, "quantity", "must be finite"),
+        (1, "emission_factor", "must be finite"),
+        (2, "quantity", "must be finite"),
+    ]
+
+
+def test_required_column_missing():
+    df = make_entries(2).drop(columns="unit")
+    assert errors_of(df) == [(0, "unit", "missing"), (1, "unit", "missing")]
+
+
+def test_row_labels_follow_the_index():
+    df = make_entries(2).set_axis([40, 41], axis=0)
+    df.loc[41, "quantity"] = -5
+    errors = validate(df)
+    assert errors["row"].tolist() == [41]
+    assert format_errors(errors) == "line 43: quantity must be greater than 0"
+
+
+def test_format_errors_describes_the_first_errors():
+    df = make_entries(8)
+    df["quantity"] = -1
+    assert format_errors(validate(df), limit=2) == "line 2: quantity must be greater than 0; line 3: quantity must be greater than 0"
+
+
+def test_units_priced_by_a_factor_are_known(handler):
+    dh = handler()
+    dh.factors.register("Business Travel", "Hotel Stay", 20.0, "room-night")
+    df = make_entries(2).assign(unit=["room-night", "furlong"])
+    assert errors_of(df) == [(1, "unit", "not a known unit")]
+    assert known_unit("MWH")
+    assert not known_unit(None)
+
+
+def test_handler_rejects_invalid_entries(handler, capsys):
+    dh = handler()
+    assert not dh.add_emission_entry("2024-01-05", "Scope 9", "Mobile Combustion", "Diesel", -1, "liter", 2.0)
+    out = capsys.readouterr().out
+    assert "Emission entry not added" in out and "quantity must be greater than 0" in out
+    assert dh.emissions_data.empty
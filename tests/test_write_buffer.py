@@ -0,0 +1,128 @@
+"""Group commits and failure propagation of the write buffer."""
+
+import threading
+
+import pandas as pd
+import pytest
+
+from storage import JournalStore
+from write_buffer import WriteBuffer
+
+
+class FailingStore:
+    """Store stub that refuses rows with a negative quantity and counts commits."""
+
+    def __init__(self):
+        self.commits = 0
+        self.next_id = 0
+        self.deleted = []
+
+    def commit(self, rows=None, entry_ids=None):
+        self.commits += 1
+        if rows is not None and (rows["quantity"] < 0).any():
+            raise ValueError("negative quantity")
+        self.deleted.extend(entry_ids or [])
+        if rows is None:
+            return None
+        ids = pd.RangeIndex(self.next_id, self.next_id + len(rows), name="entry_id")
+        self.next_id += len(rows)
+        return rows.set_axis(ids, axis=0)
+
+
+@pytest.fixture
+def buffer():
+    # A long delay, so writes only commit when the test flushes
+    buffer = WriteBuffer(FailingStore(), max_delay=60)
+    yield buffer
+    buffer.close()
+
+
+def test_batch_is_one_commit_and_each_writer_gets_its_ids(buffer):
+    first = buffer.submit(pd.DataFrame({"quantity": [1.0, 2.0]}))
+    second = buffer.submit(pd.DataFrame({"quantity": [3.0]}))
+    buffer.flush()
+    assert buffer.store.commits == 1
+    assert list(first.wait().index) == [0, 1]
+    assert list(second.wait().index) == [2]
+
+
+def test_failed_write_raises_from_wait(buffer):
+    write = buffer.submit(pd.DataFrame({"quantity": [-1.0]}))
+    buffer.flush()
+    assert write.done()
+    with pytest.raises(ValueError, match="negative quantity"):
+        write.wait()
+
+
+def test_failed_write_does_not_fail_its_batch(buffer):
+    good = buffer.submit(pd.DataFrame({"quantity": [1.0]}))
+    bad = buffer.submit(pd.DataFrame({"quantity": [-1.0]}))
+    delete = buffer.submit_delete([7])
+    buffer.flush()
+    assert list(good.wait().index) == [0]
+    with pytest.raises(ValueError):
+        bad.wait()
+    assert delete.wait() is None
+    assert buffer.store.deleted == [7]
+
+
+def test_wait_times_out_before_a_flush(buffer):
+    write = buffer.submit(pd.DataFrame({"quantity": [1.0]}))
+    with pytest.raises(TimeoutError):
+        write.wait(timeout=0.01)
+
+
+def test_closed_buffer_refuses_writes(buffer):
+    buffer.close()
+    with pytest.raises(RuntimeError):
+        buffer.submit(pd.DataFrame({"quantity": [1.0]}))
+
+
+def test_concurrent_writers_reach_the_store(tmp_path, entries):
+    store = JournalStore(str(tmp_path / "emissions.json"))
+    buffer = WriteBuffer(store, max_delay=0.005)
+    results = []
+
+    def write():
+        results.append(buffer.submit(entries.head(1)).wait(timeout=10))
+
+    threads = [threading.Thread(target=write) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    buffer.close()
+    ids = sorted(i for result in results for i in result.index)
+    assert ids == list(range(8))
+    assert list(store.load().index) == ids
+
+
+def test_replace_swaps_entries_in_one_commit(tmp_path, entries):
+    store = JournalStore(str(tmp_path / "emissions.json"))
+    store.append(entries)
+    buffer = WriteBuffer(store, max_delay=60)
+    write = buffer.submit_replace(entries.head(2), [0, 1])
+    buffer.flush()
+    buffer.close()
+    assert list(write.wait().index) == [5, 6]
+    assert list(store.load().index) == [2, 3, 4, 5, 6]
+
+
+def test_cleanup_failure_after_the_commit_point_is_not_retried(tmp_path, entries, monkeypatch):
+    pytest.importorskip("pyarrow")
+    from storage import ParquetStore
+    store = ParquetStore(str(tmp_path / "emissions_parquet"))
+    store.append(entries)
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(store, "_remove_rows", fail)
+    buffer = WriteBuffer(store, max_delay=60)
+    insert = buffer.submit(entries.head(1))
+    delete = buffer.submit_delete([0])
+    buffer.flush()
+    buffer.close()
+    assert list(insert.wait().index) == [5]
+    assert delete.wait() is None
+    assert list(store.load().index) == [1, 2, 3, 4, 5]
@@ -0,0 +1,325 @@
+"""
+Time series for YourCarbonFootprint application.
+Resamples emissions to calendar periods with rolling, period-over-period and cumulative figures.
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aggregates import MEASURE
+from config import FISCAL_YEAR_START_MONTH
+
+# Supported granularities, lags for year-on-year comparison and default rolling windows
+GRANULARITIES = ["daily", "weekly", "monthly", "quarterly", "fiscal_year"]
+PERIODS_PER_YEAR = {"daily": 364, "weekly": 52, "monthly": 12, "quarterly": 4, "fiscal_year": 1}  # days: same weekday
+ROLLING_WINDOW = {"daily": 7, "weekly": 4, "monthly": 3, "quarterly": 4, "fiscal_year": 3}
+# Columns every resampled frame holds besides the group columns
+SERIES_COLUMNS = [
+    "period", "label", MEASURE, "entries", "rolling_mean", "change", "change_pct",
+    "yoy_change", "yoy_pct", "cumulative", "year_to_date",
+]
+
+_MONTH_NAMES = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"]
+
+
+def _frequency(granularity, fiscal_start):
+    """Pandas frequency string for the period starts of a granularity."""
+    return {
+        "daily": "D",
+        "weekly": "W-MON",
+        "monthly": "MS",
+        "quarterly": "QS-JAN",
+        "fiscal_year": f"YS-{_MONTH_NAMES[fiscal_start - 1]}",
+    }[granularity]
+
+
+def period_start(dates, granularity, fiscal_start=FISCAL_YEAR_START_MONTH):
+    """
+    Map dates to the first day of their period, without formatting them as strings.
+
+    Weeks start on Monday, quarters in January, April, July and October, and
+    fiscal years on the first of fiscal_start.
+
+    Args:
+        dates (pandas.Series): Dates; NaT stays NaT
+        granularity (str): One of GRANULARITIES
+        fiscal_start (int, optional): First month of the fiscal year (1-12)
+
+    Returns:
+        pandas.Series: Period start of each date
+
+    Raises:
+        ValueError: If the granularity is not supported
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unsupported granularity: {granularity}")
+    dates = pd.to_datetime(dates, errors="coerce")
+    days = dates.values.astype("datetime64[D]")
+    if granularity == "daily":
+        starts = days
+    elif granularity == "weekly":
+        # 1970-01-01 was a Thursday
+        starts = days - ((days.view("int64") + 3) % 7).astype("timedelta64[D]")
+    else:
+        months = days.astype("datetime64[M]").view("int64")
+        if granularity == "quarterly":
+            months = months - months % 3
+        elif granularity == "fiscal_year":
+            months = months - (months - (fiscal_start - 1)) % 12
+        starts = months.astype("datetime64[M]")
+    starts = starts.astype("datetime64[ns]")
+    starts[np.isnat(days)] = np.datetime64("NaT")
+    return pd.Series(starts, index=dates.index)
+
+
+def _format_periods(periods, granularity, fiscal_start):
+    """Labels for a Series of distinct period starts."""
+    if granularity in ("daily", "weekly"):
+        return periods.dt.strftime("%Y-%m-%d")
+    if granularity == "monthly":
+        return periods.dt.strftime("%Y-%m")
+    if granularity == "quarterly":
+        return periods.dt.year.astype(str) + "Q" + ((periods.dt.month - 1) // 3 + 1).astype(str)
+    years = periods.dt.year
+    if fiscal_start == 1:
+        return "FY" + years.astype(str)
+    return "FY" + years.astype(str) + "-" + ((years + 1) % 100).astype(str).str.zfill(2)
+
+
+def period_label(periods, granularity, fiscal_start=FISCAL_YEAR_START_MONTH):
+    """
+    Format period starts for display.
+
+    Each distinct period is formatted once, so long frames of repeated periods
+    cost one string per period rather than one per row.
+
+    Args:
+        periods (pandas.Series): Period starts from period_start
+        granularity (str): One of GRANULARITIES
+        fiscal_start (int, optional): First month of the fiscal year (1-12)
+
+    Returns:
+        pandas.Series: Labels such as 2024-03-18, 2024-03, 2024Q1 or FY2024-25; missing for NaT
+    """
+    periods = pd.Series(pd.to_datetime(periods))
+    codes, uniques = pd.factorize(periods)
+    labels = np.append(_format_periods(pd.Series(uniques), granularity, fiscal_start).to_numpy(dtype=object), None)
+    return pd.Series(labels[codes], index=periods.index)
+
+
+def daily_totals(df, by=()):
+    """
+    Sum emissions per day and group.
+
+    Args:
+        df (pandas.DataFrame): Emissions rows with date, the group columns and the measure
+        by (tuple, optional): Columns to keep; absent ones are all missing
+
+    Returns:
+        pandas.DataFrame: Group columns, period (the day), the summed measure and "entries";
+            rows without a valid date are left out
+    """
+    by = list(by)
+    if not len(df) or "date" not in df.columns:
+        return pd.DataFrame(columns=by + ["period", MEASURE, "entries"])
+    values = pd.to_numeric(df[MEASURE], errors="coerce").fillna(0) if MEASURE in df.columns else pd.Series(0.0, index=df.index)
+    # Absent group columns count as missing values, like the cube's dimensions
+    data = pd.DataFrame({c: df[c] if c in df.columns else None for c in by}, index=df.index)
+    data["period"] = period_start(df["date"], "daily")
+    data[MEASURE] = values
+    data = data[data["period"].notna()]
+    grouped = data.groupby(by + ["period"], observed=True, dropna=False)[MEASURE].agg(["sum", "size"])
+    return grouped.rename(columns={"sum": MEASURE, "size": "entries"}).reset_index()
+
+
+def resample_totals(daily, granularity="monthly", by=(), window=None, fiscal_start=FISCAL_YEAR_START_MONTH):
+    """
+    Roll daily totals up to a granularity and derive the comparison figures.
+
+    Every series is reindexed to consecutive periods from its first entry to
+    the latest period in the data, with empty periods as zero, so rolling
+    means and lags are plain shifts. All figures are computed for every series
+    at once with grouped cumulative sums and shifts.
+
+    Args:
+        daily (pandas.DataFrame): Output of daily_totals for the same group columns
+        granularity (str, optional): One of GRANULARITIES
+        by (tuple, optional): Group columns, each forming its own series
+        window (int, optional): Periods in the rolling mean; ROLLING_WINDOW by default
+        fiscal_start (int, optional): First month of the fiscal year (1-12)
+
+    Returns:
+        pandas.DataFrame: Group columns plus SERIES_COLUMNS, sorted by group and period:
+            rolling_mean over the window (fewer periods at the start of a series),
+            change and change_pct against the previous period, yoy_change and
+            yoy_pct against the same period a year earlier, cumulative since the
+            first entry and year_to_date within the fiscal year. Percentages are
+            NaN where the earlier value is zero or missing.
+    """
+    by = list(by)
+    window = window or ROLLING_WINDOW[granularity]
+    if not len(daily):
+        return pd.DataFrame(columns=by + SERIES_COLUMNS)
+    starts = period_start(daily["period"], granularity, fiscal_start)
+    keys = [daily[c] for c in by] + [starts.rename("period")]
+    totals = daily.groupby(keys, observed=True, dropna=False)[[MEASURE, "entries"]].sum()
+
+    # Consecutive periods for every series
+    periods = pd.date_range(totals.index.get_level_values("period").min(),
+                            totals.index.get_level_values("period").max(),
+                            freq=_frequency(granularity, fiscal_start), name="period")
+    if by:
+        series = totals.index.droplevel("period").unique()
+        grid = pd.MultiIndex.from_arrays(
+            [series.get_level_values(i).repeat(len(periods)) for i in range(len(by))]
+            + [np.tile(periods.values, len(series))],
+            names=by + ["period"],
+        )
+        frame = totals.reindex(grid, fill_value=0).reset_index()
+        group = [frame[c] for c in by]
+        # Drop the periods before each series' first entry
+        frame = frame[frame.groupby(group, dropna=False)["entries"].cumsum() > 0].reset_index(drop=True)
+        group = [frame[c] for c in by]
+    else:
+        frame = totals.reindex(periods, fill_value=0).reset_index()
+        group = [pd.Series(0, index=frame.index)]
+    grouped = frame.groupby(group, dropna=False, sort=False)
+    value = frame[MEASURE].astype(float)
+
+    cumulative = grouped[MEASURE].cumsum().astype(float)
+    position = grouped.cumcount()
+    earlier = cumulative.groupby(group, dropna=False).shift(window).fillna(0)
+    frame["rolling_mean"] = (cumulative - earlier) / np.minimum(position + 1, window)
+
+    previous = value.groupby(group, dropna=False).shift(1)
+    frame["change"] = value - previous
+    frame["change_pct"] = (frame["change"] / previous.where(previous != 0)) * 100
+
+    last_year = value.groupby(group, dropna=False).shift(PERIODS_PER_YEAR[granularity])
+    frame["yoy_change"] = value - last_year
+    frame["yoy_pct"] = (frame["yoy_change"] / last_year.where(last_year != 0)) * 100
+
+    frame["cumulative"] = cumulative
+    fiscal_year = period_start(frame["period"], "fiscal_year", fiscal_start)
+    frame["year_to_date"] = value.groupby(group + [fiscal_year], dropna=False).cumsum()
+    frame["label"] = period_label(frame["period"], granularity, fiscal_start).values
+    frame["entries"] = frame["entries"].astype(int)
+    return frame[by + SERIES_COLUMNS]
+
+
+def resample_frame(df, granularity="monthly", by=(), window=None, fiscal_start=FISCAL_YEAR_START_MONTH):
+    """
+    Resample emissions rows in one step.
+
+    Args:
+        df (pandas.DataFrame): Emissions rows
+        granularity (str, optional): One of GRANULARITIES
+        by (tuple, optional): Group columns, each forming its own series
+        window (int, optional): Periods in the rolling mean
+        fiscal_start (int, optional): First month of the fiscal year (1-12)
+
+    Returns:
+        pandas.DataFrame: See resample_totals
+    """
+    return resample_totals(daily_totals(df, by), granularity, by, window, fiscal_start)
+
+
+def write_trend_pdf(pdf, trend, periods=12):
+    """
+    Write the "Monthly Trend" section of a PDF report.
+
+    Args:
+        pdf (fpdf.FPDF): Report being written
+        trend (pandas.DataFrame): Monthly series from resample_totals
+        periods (int, optional): Latest months listed
+    """
+    pdf.ln(5)
+    pdf.cell(0, 10, "Monthly Trend:", 0, 1)
+    # Each month against the previous month and the same month a year earlier
+    for _, row in trend.tail(periods).iterrows():
+        mom = f"{row['change_pct']:+.1f}%" if pd.notna(row['change_pct']) else "n/a"
+        yoy = f"{row['yoy_pct']:+.1f}%" if pd.notna(row['yoy_pct']) else "n/a"
+        pdf.cell(0, 10, f"{row['label']}: {row[MEASURE]:.2f} kgCO2e (3-month avg {row['rolling_mean']:.2f}, MoM {mom}, YoY {yoy})", 0, 1)
+
+
+class TimeSeriesEngine:
+    """
+    Resampled emissions series, cached per granularity.
+
+    Rows are reduced once to daily totals per group; every granularity is
+    then rolled up from those (days in the data, not entries), and the
+    results are kept until the data version moves. Cached frames are shared:
+    treat them as read-only.
+    """
+
+    def __init__(self, rows, version, fiscal_start=FISCAL_YEAR_START_MONTH):
+        """
+        Initialize the TimeSeriesEngine class.
+
+        Args:
+            rows (callable): Called as rows(by); returns emissions rows with date,
+                the group columns and the measure
+            version (callable): Returns the current data version
+            fiscal_start (int, optional): First month of the fiscal year (1-12)
+        """
+        self.rows = rows
+        self.version = version
+        self.fiscal_start = fiscal_start
+        self._lock = threading.Lock()
+        self._version = None
+        self._daily = {}
+        self._series = {}
+
+    def resample(self, granularity="monthly", by=(), window=None, start_date=None, end_date=None):
+        """
+        Return a resampled series.
+
+        Rolling and year-on-year figures are computed over the full history,
+        so the first periods of a date range still compare with earlier data.
+
+        Args:
+            granularity (str, optional): One of GRANULARITIES
+            by (tuple, optional): Group columns, each forming its own series
+            window (int, optional): Periods in the rolling mean
+            start_date (datetime, optional): Keep periods starting on or after this date's period
+            end_date (datetime, optional): Keep periods starting on or before this date
+
+        Returns:
+            pandas.DataFrame: See resample_totals
+
+        Raises:
+            ValueError: If the granularity is not supported
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unsupported granularity: {granularity}")
+        by = tuple(by)
+        version = self.version()
+        with self._lock:
+            if version != self._version:
+                self._version, self._daily, self._series = version, {}, {}
+            daily = self._daily.get(by)
+            series = self._series.get((granularity, by, window))
+        if series is None:
+            if daily is None:
+                daily = daily_totals(self.rows(by), by)
+            series = resample_totals(daily, granularity, by, window, self.fiscal_start)
+            with self._lock:
+                if version == self._version:
+                    self._daily[by] = daily
+                    self._series[(granularity, by, window)] = series
+        if start_date is not None or end_date is not None:
+            mask = pd.Series(True, index=series.index)
+            if start_date is not None:
+                first = period_start(pd.Series([pd.Timestamp(start_date)]), granularity, self.fiscal_start).iloc[0]
+                mask &= series["period"] >= first
+            if end_date is not None:
+                mask &= series["period"] <= pd.Timestamp(end_date)
+            series = series[mask]
+        return series
+
+    def clear(self):
+        """Drop every cached series."""
+        with self._lock:
+            self._version, self._daily, self._series = None, {}, {}
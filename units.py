@@ -0,0 +1,167 @@
+"""
+Unit conversion for YourCarbonFootprint application.
+Converts whole columns of quantities between units of the same dimension.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Units by dimension: (dimension, size in the dimension's base unit)
+UNITS = {
+    # Energy, base kWh
+    "kWh": ("energy", 1.0),
+    "Wh": ("energy", 0.001),
+    "MWh": ("energy", 1000.0),
+    "GWh": ("energy", 1e6),
+    "MJ": ("energy", 1 / 3.6),
+    "GJ": ("energy", 1000 / 3.6),
+    "therm": ("energy", 29.3071),
+    "MMBtu": ("energy", 293.071),
+    # Volume, base liter
+    "liter": ("volume", 1.0),
+    "milliliter": ("volume", 0.001),
+    "cubic meter": ("volume", 1000.0),
+    "gallon": ("volume", 3.78541),
+    "barrel": ("volume", 158.987),
+    # Mass, base kg
+    "kg": ("mass", 1.0),
+    "g": ("mass", 0.001),
+    "tonne": ("mass", 1000.0),
+    "lb": ("mass", 0.453592),
+    # Distance, base km
+    "km": ("distance", 1.0),
+    "m": ("distance", 0.001),
+    "mile": ("distance", 1.609344),
+    # Passenger distance, base passenger-km
+    "passenger-km": ("passenger distance", 1.0),
+    "passenger-mile": ("passenger distance", 1.609344),
+    # Freight, base tonne-km
+    "tonne-km": ("freight", 1.0),
+    # Others without conversions
+    "square meter": ("area", 1.0),
+    "hour": ("time", 1.0),
+    "day": ("time", 24.0),
+    "piece": ("count", 1.0),
+    "USD": ("currency", 1.0),
+}
+
+# Other spellings, matched case-insensitively
+UNIT_ALIASES = {
+    "kwh": "kWh", "kw-h": "kWh", "kilowatt hour": "kWh", "kilowatt-hour": "kWh",
+    "mwh": "MWh", "megawatt hour": "MWh", "gwh": "GWh", "wh": "Wh",
+    "l": "liter", "litre": "liter", "liters": "liter", "litres": "liter", "ml": "milliliter",
+    "m3": "cubic meter", "m³": "cubic meter", "cubic metre": "cubic meter", "cubic meters": "cubic meter",
+    "gal": "gallon", "gallons": "gallon", "bbl": "barrel",
+    "kgs": "kg", "kilogram": "kg", "kilograms": "kg", "gram": "g", "grams": "g",
+    "t": "tonne", "tonnes": "tonne", "metric ton": "tonne", "metric tonne": "tonne",
+    "lbs": "lb", "pound": "lb", "pounds": "lb",
+    "kilometer": "km", "kilometre": "km", "kilometers": "km", "meter": "m", "metre": "m", "miles": "mile",
+    "pkm": "passenger-km", "passenger km": "passenger-km", "passenger-kilometer": "passenger-km",
+    "tkm": "tonne-km", "tonne km": "tonne-km",
+    "m2": "square meter", "m²": "square meter", "sq m": "square meter",
+    "hours": "hour", "hr": "hour", "h": "hour", "days": "day",
+    "pcs": "piece", "pieces": "piece", "unit": "piece", "units": "piece",
+}
+
+UNIT_NAMES = list(UNITS)
+_POSITION = {name: i for i, name in enumerate(UNIT_NAMES)}
+_LOOKUP = {**{name.lower(): name for name in UNIT_NAMES}, **UNIT_ALIASES}
+
+
+def _conversion_table():
+    """Ratio from every unit (rows) to every unit (columns); NaN across dimensions."""
+    dimensions = np.array([UNITS[u][0] for u in UNIT_NAMES])
+    sizes = np.array([UNITS[u][1] for u in UNIT_NAMES])
+    table = sizes[:, None] / sizes[None, :]
+    table[dimensions[:, None] != dimensions[None, :]] = np.nan
+    return table
+
+
+# Precomputed once: converting a column is a fancy index into this table
+CONVERSION_TABLE = _conversion_table()
+
+
+def normalize_unit(name):
+    """
+    Canonical name of a unit.
+
+    Args:
+        name (str): Unit as written, e.g. "MWH", "litre" or "m3"
+
+    Returns:
+        str: Name in UNITS, or None if the unit is not known
+    """
+    if not isinstance(name, str):
+        return None
+    return _LOOKUP.get(" ".join(name.strip().lower().split()))
+
+
+def dimension(name):
+    """
+    Dimension of a unit, e.g. "energy" for "MWh".
+
+    Args:
+        name (str): Unit as written
+
+    Returns:
+        str: Dimension, or None if the unit is not known
+    """
+    unit = normalize_unit(name)
+    return UNITS[unit][0] if unit else None
+
+
+def unit_codes(units):
+    """
+    Position in UNIT_NAMES of every unit in a column.
+
+    Each distinct spelling is looked up once.
+
+    Args:
+        units (pandas.Series): Units as written
+
+    Returns:
+        numpy.ndarray: Positions, -1 for unknown or missing units
+    """
+    codes, uniques = pd.factorize(pd.Series(units))
+    positions = np.array([_POSITION.get(normalize_unit(u), -1) for u in uniques] + [-1], dtype=np.int64)
+    return positions[codes]
+
+
+def conversion_ratios(from_units, to_units):
+    """
+    Factors turning quantities in from_units into quantities in to_units.
+
+    Args:
+        from_units (pandas.Series): Units the quantities are in
+        to_units (pandas.Series): Units wanted, aligned with from_units
+
+    Returns:
+        tuple: (ratios, errors): float array, 1 where the units are the same
+            (including the same unknown unit) and NaN where they cannot be
+            converted; errors is the boolean mask of those NaN rows
+    """
+    source = unit_codes(from_units)
+    target = unit_codes(to_units)
+    known = (source >= 0) & (target >= 0)
+    ratios = np.full(len(source), np.nan)
+    ratios[known] = CONVERSION_TABLE[source[known], target[known]]
+    same = pd.Series(from_units).to_numpy(dtype=object) == pd.Series(to_units).to_numpy(dtype=object)
+    ratios[same] = 1.0
+    return ratios, np.isnan(ratios)
+
+
+def convert(quantities, from_units, to_units):
+    """
+    Convert a column of quantities.
+
+    Args:
+        quantities (pandas.Series): Quantities
+        from_units (pandas.Series): Their units
+        to_units (pandas.Series): Units wanted
+
+    Returns:
+        tuple: (converted quantities as a float array, NaN where the units are
+            incompatible or unknown; boolean error mask)
+    """
+    ratios, errors = conversion_ratios(from_units, to_units)
+    return pd.to_numeric(pd.Series(quantities), errors="coerce").to_numpy(dtype=float) * ratios, errors
@@ -0,0 +1,197 @@
+"""
+Validation for YourCarbonFootprint application.
+Checks emissions entries against one declarative schema in whole-column passes.
+"""
+
+import numpy as np
+import pandas as pd
+
+from config import EMISSION_SCOPES, VALID_FROM_DATE
+from factor_datasets import default_catalog
+from factor_registry import default_registry
+from units import normalize_unit
+
+# Rules per column:
+#   type      "str", "number" or "date"; present values that do not parse, and numbers
+#             that are not finite, are errors
+#   required  a value must be present (blank strings count as missing)
+#   allowed   list of values, or a function of one distinct value returning True if allowed
+#   message   error for values that are not allowed
+#   gt/ge/le  numeric bounds
+#   min/max   date bounds; "today" is the current date
+ENTRY_SCHEMA = {
+    "date": {"type": "date", "required": True, "min": VALID_FROM_DATE, "max": "today"},
+    "scope": {"type": "str", "required": True, "allowed": EMISSION_SCOPES},
+    "category": {"type": "str", "required": True},
+    "activity": {"type": "str", "required": True},
+    "quantity": {"type": "number", "required": True, "gt": 0},
+    "unit": {"type": "str", "required": True, "allowed": lambda unit: known_unit(unit), "message": "not a known unit"},
+    "emission_factor": {"type": "number", "ge": 0},
+    "emissions_kgCO2e": {"type": "number", "ge": 0},
+}
+ERROR_COLUMNS = ["row", "column", "error"]
+ERROR_EXAMPLES = 5  # errors described by format_errors
+
+_factor_units = {}  # registry version -> units of the registry's and the catalog's factors
+
+
+def known_unit(unit):
+    """
+    Whether entries may be recorded in a unit.
+
+    Units the converter knows are accepted straight away; others, such as
+    "room-night", are accepted if some factor of the shared registry or of
+    the factor datasets is priced in them. Those are only looked up the first
+    time such a unit is seen.
+
+    Args:
+        unit (str): Unit as written
+
+    Returns:
+        bool: True if the unit is known
+    """
+    if normalize_unit(unit) is not None:
+        return True
+    if not isinstance(unit, str):
+        return False
+    registry = default_registry()
+    version = registry.version
+    if version not in _factor_units:
+        units = set(registry.table()["unit"].dropna().astype(str))
+        for table in default_catalog().tables():
+            units.update(str(u) for u in table.pools["unit"])
+        _factor_units.clear()
+        _factor_units[version] = units
+    return unit.strip() in _factor_units[version]
+
+
+def _column(values, kind):
+    """
+    Presence, parsed values and distinct values of one column.
+
+    Columns that still need parsing are factorized first, so blank checks,
+    parsing and allowed-value checks run once per distinct value.
+
+    Returns:
+        tuple: (present mask, parsed numpy array or None for "str", codes into distinct
+            (-1 for missing) or None, distinct values or None)
+    """
+    if kind == "number" and pd.api.types.is_numeric_dtype(values):
+        parsed = values.to_numpy(dtype=float, na_value=np.nan)
+        return ~np.isnan(parsed), parsed, None, None
+    if kind == "date" and pd.api.types.is_datetime64_any_dtype(values):
+        parsed = values.to_numpy(dtype="datetime64[ns]")
+        return ~np.isnat(parsed), parsed, None, None
+    codes, uniques = pd.factorize(values)
+    distinct = pd.Series(uniques, dtype=object)
+    present = np.r_[(distinct.astype(str).str.strip() != "").to_numpy(dtype=bool), False][codes]
+    if kind == "number":
+        parsed = np.r_[pd.to_numeric(distinct, errors="coerce").to_numpy(dtype=float, na_value=np.nan), np.nan][codes]
+    elif kind == "date":
+        parsed = np.r_[pd.to_datetime(distinct, errors="coerce", format="mixed").to_numpy(dtype="datetime64[ns]"), np.datetime64("NaT")][codes]
+    else:
+        parsed = None
+    return present, parsed, codes, distinct
+
+
+def _allowed(values, codes, distinct, allowed):
+    """Boolean array of the values that are allowed, checked once per distinct value where known."""
+    if codes is None:
+        return values.isin(allowed).to_numpy() if not callable(allowed) else values.map(allowed).to_numpy(dtype=bool)
+    ok = distinct.isin(allowed).to_numpy() if not callable(allowed) else np.array([bool(allowed(v)) for v in distinct], dtype=bool)
+    return np.r_[ok, True][codes]
+
+
+def validate(df, schema=ENTRY_SCHEMA):
+    """
+    Check entries against a schema.
+
+    Every rule is one boolean mask over a whole column, so a million rows
+    take a fraction of a second; only the failing positions are kept.
+
+    Args:
+        df (pandas.DataFrame): Entries
+        schema (dict, optional): Column -> rules (see ENTRY_SCHEMA)
+
+    Returns:
+        pandas.DataFrame: ERROR_COLUMNS, one row per failed rule ordered by row; row is
+            the index label of the entry. Empty if every entry is valid.
+    """
+    today = pd.Timestamp.today().normalize()
+    found = []  # (positions, column, error)
+
+    def flag(mask, column, error):
+        positions = np.flatnonzero(mask)
+        if len(positions):
+            found.append((positions, column, error))
+
+    for column, rule in schema.items():
+        if column not in df.columns:
+            if rule.get("required"):
+                flag(np.ones(len(df), dtype=bool), column, "missing")
+            continue
+        kind = rule.get("type", "str")
+        values = df[column]
+        present, parsed, codes, distinct = _column(values, kind)
+        if rule.get("required"):
+            flag(~present, column, "missing")
+        if kind != "str":
+            # Present values that did not parse are malformed rather than missing
+            valid = ~(np.isnat(parsed) if kind == "date" else np.isnan(parsed))
+            flag(present & ~valid, column, "not a number" if kind == "number" else "not a date")
+            present = present & valid
+        if kind == "number":
+            # inf passes every bound check
+            finite = np.isfinite(parsed)
+            flag(present & ~finite, column, "must be finite")
+            present = present & finite
+        if "allowed" in rule:
+            allowed = rule["allowed"]
+            flag(present & ~_allowed(values, codes, distinct, allowed), column,
+                 rule.get("message") or (f"not one of {', '.join(map(str, allowed))}" if not callable(allowed) else "not allowed"))
+        if kind == "number":
+            with np.errstate(invalid="ignore"):
+                if "gt" in rule:
+                    flag(present & ~(parsed > rule["gt"]), column, f"must be greater than {rule['gt']}")
+                if "ge" in rule:
+                    flag(present & ~(parsed >= rule["ge"]), column, f"must be at least {rule['ge']}")
+                if "le" in rule:
+                    flag(present & ~(parsed <= rule["le"]), column, f"must be at most {rule['le']}")
+        if kind == "date":
+            if "min" in rule:
+                first = today if rule["min"] == "today" else pd.Timestamp(rule["min"])
+                flag(present & (parsed < first.to_datetime64()), column, f"before {first:%Y-%m-%d}")
+            if "max" in rule:
+                last = today if rule["max"] == "today" else pd.Timestamp(rule["max"])
+                # Any time on the last day is allowed
+                flag(present & (parsed >= (last + pd.Timedelta(days=1)).to_datetime64()), column, f"after {last:%Y-%m-%d}")
+
+    if not found:
+        return pd.DataFrame({"row": df.index[:0], "column": pd.Series(dtype=object), "error": pd.Series(dtype=object)})
+    positions = np.concatenate([p for p, _, _ in found])
+    counts = [len(p) for p, _, _ in found]
+    order = np.argsort(positions, kind="stable")
+    return pd.DataFrame({
+        "row": df.index.to_numpy()[positions[order]],
+        "column": pd.Categorical(np.repeat([c for _, c, _ in found], counts)[order]),
+        "error": pd.Categorical(np.repeat([e for _, _, e in found], counts)[order]),
+    })
+
+
+def format_errors(errors, line_offset=2, limit=ERROR_EXAMPLES):
+    """
+    Describe the first errors of a validate() table.
+
+    Args:
+        errors (pandas.DataFrame): Table returned by validate
+        line_offset (int, optional): Added to integer row labels to give file lines
+            (2 for a file with a header, read with a default index)
+        limit (int, optional): Errors described
+
+    Returns:
+        str: e.g. "line 9: date not a date; line 12: quantity must be greater than 0"
+    """
+    return "; ".join(
+        f"line {row + line_offset}: {column} {error}"
+        for row, column, error in errors.head(limit).itertuples(index=False, name=None)
+    )
@@ -0,0 +1,227 @@
+"""
+Write coalescing for YourCarbonFootprint application.
+Batches bursts of emissions inserts and deletes into single durable commits.
+"""
+
+import atexit
+import threading
+import time
+
+import pandas as pd
+
+# Flush thresholds
+MAX_BATCH_ROWS = 1000  # pending rows that trigger an immediate flush
+MAX_DELAY = 0.01  # seconds a write may wait for others to join its batch
+
+
+class PendingWrite:
+    """Handle for a buffered write; becomes durable when its batch is committed."""
+
+    def __init__(self, rows=None, entry_ids=None):
+        """
+        Initialize the PendingWrite class.
+
+        Args:
+            rows (pandas.DataFrame, optional): Entries to insert
+            entry_ids (list, optional): Ids of entries to delete
+        """
+        self.rows = rows
+        self.entry_ids = entry_ids or []
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def done(self):
+        """Return True once the write has been committed or has failed."""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Block until the write is durable.
+
+        Args:
+            timeout (float, optional): Seconds to wait
+
+        Returns:
+            pandas.DataFrame: Inserted entries indexed by their entry ids, or None for deletes
+
+        Raises:
+            TimeoutError: If the batch was not committed in time
+            Exception: Whatever the store raised while committing the batch
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError("Write was not committed in time")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def _finish(self, result=None, error=None):
+        """Record the outcome and wake up waiters."""
+        self.result = result
+        self.error = error
+        self._done.set()
+
+
+class WriteBuffer:
+    """
+    Write-behind buffer in front of an emissions store.
+
+    Writes queue up and a background thread commits everything pending with
+    one store.commit call (one journal fsync or one SQLite transaction) once
+    ``max_batch_rows`` rows are waiting or the oldest write is ``max_delay``
+    seconds old. Callers that need durability wait on the returned
+    PendingWrite; nothing is acknowledged before its batch is committed.
+    """
+
+    def __init__(self, store, max_batch_rows=MAX_BATCH_ROWS, max_delay=MAX_DELAY):
+        """
+        Initialize the WriteBuffer class.
+
+        Args:
+            store (EmissionsStore): Store to commit to
+            max_batch_rows (int, optional): Pending rows that trigger a flush
+            max_delay (float, optional): Longest time a write waits for a batch
+        """
+        self.store = store
+        self.max_batch_rows = max_batch_rows
+        self.max_delay = max_delay
+        self._pending = []
+        self._pending_rows = 0
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._commit_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, rows):
+        """
+        Queue entries for insertion.
+
+        Args:
+            rows (pandas.DataFrame or list): New entries
+
+        Returns:
+            PendingWrite: Handle to wait on
+        """
+        frame = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+        return self._enqueue(PendingWrite(rows=frame), len(frame))
+
+    def submit_delete(self, entry_ids):
+        """
+        Queue entries for deletion.
+
+        Args:
+            entry_ids (iterable): Ids of the entries to delete
+
+        Returns:
+            PendingWrite: Handle to wait on
+        """
+        ids = [int(i) for i in entry_ids]
+        return self._enqueue(PendingWrite(entry_ids=ids), len(ids))
+
+    def submit_replace(self, rows, entry_ids):
+        """
+        Queue entries to replace others, committed together in one batch.
+
+        The new versions are stored under new entry ids; the replaced ids are gone.
+
+        Args:
+            rows (pandas.DataFrame): New versions of the entries
+            entry_ids (iterable): Ids of the entries they replace
+
+        Returns:
+            PendingWrite: Handle to wait on
+        """
+        ids = [int(i) for i in entry_ids]
+        return self._enqueue(PendingWrite(rows=rows, entry_ids=ids), len(rows) + len(ids))
+
+    def _enqueue(self, write, rows):
+        """Add a write to the queue and wake the flusher if needed."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("WriteBuffer is closed")
+            self._pending.append(write)
+            self._pending_rows += rows
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._cond.notify()
+        return write
+
+    def flush(self):
+        """Commit everything queued so far and wait until it is durable."""
+        # Batches are taken and committed under one lock, so once this returns
+        # every earlier write is durable too
+        with self._commit_lock:
+            with self._cond:
+                batch = self._take()
+            self._commit(batch)
+
+    def close(self):
+        """Flush pending writes and stop the background thread."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
+
+    def _take(self):
+        """Detach the pending batch (condition held)."""
+        batch = self._pending
+        self._pending = []
+        self._pending_rows = 0
+        self._oldest = None
+        return batch
+
+    def _run(self):
+        """Background loop: flush on size or age."""
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._pending_rows >= self.max_batch_rows:
+                        break
+                    if self._oldest is not None:
+                        remaining = self._oldest + self.max_delay - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+            self.flush()
+
+    def _commit(self, batch):
+        """
+        Commit a batch with a single store write and resolve its handles (commit lock held).
+
+        If the batch fails, its writes are retried one at a time so that one
+        bad write only fails its own handle. Stores raise only when nothing
+        was committed (see EmissionsStore.commit), so a retry never writes
+        an entry twice.
+        """
+        if not batch:
+            return
+        frames = [w.rows for w in batch if w.rows is not None and not w.rows.empty]
+        entry_ids = [i for w in batch for i in w.entry_ids]
+        rows = pd.concat(frames) if frames else None
+        try:
+            stored = self.store.commit(rows=rows, entry_ids=entry_ids)
+        except Exception as e:
+            if len(batch) > 1:
+                for write in batch:
+                    self._commit([write])
+                return
+            batch[0]._finish(error=e)
+            return
+        # Hand each writer back its own rows with their new ids
+        start = 0
+        for write in batch:
+            if write.rows is not None and not write.rows.empty:
+                write._finish(result=stored.iloc[start:start + len(write.rows)])
+                start += len(write.rows)
+            else:
+                write._finish(result=write.rows)